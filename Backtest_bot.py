@@ -1,6 +1,7 @@
 import sys
 import os
 import json
+import pickle
 import logging
 from datetime import datetime, timedelta
 
@@ -10,11 +11,15 @@ sys.path.insert(0, project_root)
 
 from dotenv import load_dotenv
 import alpaca_trade_api as tradeapi
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import VecNormalize, DummyVecEnv
 from trading_env import TradingEnv
+from portfolio_env import PortfolioData, PortfolioEnv
+from feature_store import FeatureSet
+from bar_cache import BarCache
+from indicators import add_indicators
+from policy_export import NumpyPolicy, model_files_lock, policy_export_path
+import backtest_results
+import timing
 import pandas as pd
-import pandas_ta as ta
 
 # Load environment variables
 load_dotenv()
@@ -29,127 +34,249 @@ STOCK_MAPPINGS = {
     "Netflix": "NFLX"
 }
 
+# Name of the model train_model.py --portfolio trains over several stocks
+PORTFOLIO = "portfolio"
+
 # Alpaca API credentials
 API_KEY = os.getenv('ALPACA_API_KEY')
 API_SECRET = os.getenv('ALPACA_API_SECRET')
 BASE_URL = 'https://paper-api.alpaca.markets'
 
-# Initialize Alpaca API
-api = tradeapi.REST(API_KEY, API_SECRET, BASE_URL, api_version='v2')
+_api = None
 
-def backtest(stock_name):
-    try:
-        # Validate stock name
-        SYMBOL = STOCK_MAPPINGS.get(stock_name)
-        if not SYMBOL:
-            raise ValueError(f"Stock name '{stock_name}' not recognized. Available options: {list(STOCK_MAPPINGS.keys())}")
-        
-        TIMEFRAME = '1H'
-        
-        # Set date range for fetching data 
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)
-        start_date_str = start_date.strftime('%Y-%m-%d')
-        end_date_str = end_date.strftime('%Y-%m-%d')
-
-        print(f"Fetching data from {start_date_str} to {end_date_str} for {stock_name}...")
-
-        # Fetch historical data
-        data = api.get_bars(SYMBOL, TIMEFRAME, start=start_date_str, end=end_date_str, feed='iex').df
-
-        if data.empty:
-            raise ValueError("No data fetched from Alpaca. Check API credentials and data availability.")
-        
-        # Compute technical indicators
-        data['RSI'] = ta.rsi(data['close'], length=14)
-        data.ta.macd(close='close', fast=12, slow=26, signal=9, append=True)
-        data['SMA_10'] = data['close'].rolling(window=10).mean()
-        data['SMA_20'] = data['close'].rolling(window=20).mean()
-        data['SMA_50'] = data['close'].rolling(window=50).mean()
-        data['STD_20'] = data['close'].rolling(window=20).std()
-        data['Upper_Band'] = data['SMA_20'] + (2 * data['STD_20'])
-        data['Lower_Band'] = data['SMA_20'] - (2 * data['STD_20'])
-        data['ATR'] = ta.atr(data['high'], data['low'], data['close'], length=14)
-        data['VWAP'] = ta.vwap(data['high'], data['low'], data['close'], data['volume'])
-
-        # Stochastic Oscillator
-        stoch = ta.stoch(data['high'], data['low'], data['close'], k=14, d=3)
-        data['Stochastic_K'] = stoch['STOCHk_14_3_3']
-        data['Stochastic_D'] = stoch['STOCHd_14_3_3']
-
-        # Add CCI and OBV
-        data['CCI'] = ta.cci(data['high'], data['low'], data['close'], length=14)
-        data['OBV'] = ta.obv(data['close'], data['volume'])
-
-        # Rename MACD columns
-        data.rename(columns={'MACD_12_26_9': 'MACD', 
-                             'MACDh_12_26_9': 'MACD_hist', 
-                             'MACDs_12_26_9': 'MACD_signal'}, inplace=True)
+
+def get_api():
+    """Alpaca client, created on first use so importing this module needs no credentials."""
+    global _api
+    if _api is None:
+        _api = tradeapi.REST(API_KEY, API_SECRET, BASE_URL, api_version='v2')
+    return _api
+
+
+def fetch_backtest_bars(stock_name):
+    """Raw OHLCV bars of the last 90 days for stock_name."""
+    # Validate stock name
+    SYMBOL = STOCK_MAPPINGS.get(stock_name)
+    if not SYMBOL:
+        raise ValueError(f"Stock name '{stock_name}' not recognized. Available options: {list(STOCK_MAPPINGS.keys())}")
+
+    TIMEFRAME = '1H'
+
+    # Set date range for fetching data 
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=90)
+    start_date_str = start_date.strftime('%Y-%m-%d')
+    end_date_str = end_date.strftime('%Y-%m-%d')
+
+    print(f"Fetching data from {start_date_str} to {end_date_str} for {stock_name}...", file=sys.stderr)
+
+    # Fetch historical data (served from the local bar cache where possible)
+    with timing.span('fetch_bars'):
+        data = BarCache(get_api()).get_bars(SYMBOL, TIMEFRAME, start=start_date_str, end=end_date_str, feed='iex')
+
+    if data.empty:
+        raise ValueError("No data fetched from Alpaca. Check API credentials and data availability.")
+    return data
+
+
+def load_backtest_data(stock_name, bars=None):
+    """Recent bars for stock_name with indicators added and warm-up rows dropped.
+
+    bars is fetch_backtest_bars output, fetched here if not given.
+    """
+    data = fetch_backtest_bars(stock_name) if bars is None else bars
+
+    # Compute technical indicators
+    with timing.span('indicators'):
+        add_indicators(data)
 
         # Drop NaN values
         data.dropna(inplace=True)
 
-        if data.empty:
-            raise ValueError("Data contains too many NaN values after processing. Adjust indicator calculations.")
+    if data.empty:
+        raise ValueError("Data contains too many NaN values after processing. Adjust indicator calculations.")
+    return data
 
-        # Verify model and environment files exist
-        model_path = f"models/trading_bot_ppo_{stock_name}.zip"
-        env_path = f"models/trading_env_normalize_{stock_name}.pkl"
-        
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"{model_path} not found. Train the model first.")
-        if not os.path.exists(env_path):
-            raise FileNotFoundError(f"{env_path} not found. Ensure the environment normalization file exists.")
 
-        # Create trading environment
-        env = TradingEnv(data)
-        env = DummyVecEnv([lambda: env])
+def policy_paths(stock_name):
+    """Paths of the trained model and its normalization stats, checked to exist."""
+    model_path = f"models/trading_bot_ppo_{stock_name}.zip"
+    env_path = f"models/trading_env_normalize_{stock_name}.pkl"
 
-        # Load the trained model
-        model = PPO.load(model_path)
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"{model_path} not found. Train the model first.")
+    if not os.path.exists(env_path):
+        raise FileNotFoundError(f"{env_path} not found. Ensure the environment normalization file exists.")
+    return model_path, env_path
 
-        # Load normalization settings
-        env = VecNormalize.load(env_path, env)
 
-        # Simulation
-        obs = env.reset()
-        done = [False]
-        portfolio_values = []
-        action_logs = []
+def load_normalizer(env_path):
+    """Unpickle saved VecNormalize stats without attaching them to an env yet."""
+    with open(env_path, 'rb') as f:
+        return pickle.load(f)
 
-        while not done[0]:
+
+def run_backtest(stock_name, data, model, normalizer):
+    """Simulate the model over data.
+
+    normalizer is a VecNormalize as unpickled from the .pkl file (not attached
+    to an env); it is attached to a fresh env here, as VecNormalize.load does.
+    """
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    # Create trading environment
+    env = TradingEnv(data)
+    env = DummyVecEnv([lambda: env])
+
+    # Attach normalization settings
+    normalizer.set_venv(env)
+    env = normalizer
+
+    # Simulation
+    obs = env.reset()
+    done = [False]
+    actions, rewards, portfolio_values = [], [], []
+
+    while not done[0]:
+        with timing.span('inference'):
             action, _ = model.predict(obs, deterministic=True)
+        with timing.span('env_step'):
             obs, reward, done, info = env.step(action)
-            
-            if done[0]:
-                current_value = info[0]["net_worth"]
-            else:
-                current_value = env.get_attr("net_worth")[0]
-                
-            portfolio_values.append(current_value)
-            
-            action_log = {
-                "action": int(action[0]),
-                "reward": float(reward[0]),
-                "net_worth": current_value
-            }
-            action_logs.append(action_log)
-
-        # Prepare results
-        backtest_results = {
-            "stock": stock_name,
-            "initial_portfolio_value": portfolio_values[0],
-            "final_portfolio_value": portfolio_values[-1],
-            "total_return_percentage": ((portfolio_values[-1] - portfolio_values[0]) / portfolio_values[0]) * 100,
-            "action_logs": action_logs
-        }
 
-        # Save results to a file
-        results_file = f"backtest_results_{stock_name}.json"
-        with open(results_file, 'w') as f:
-            json.dump(backtest_results, f, indent=2)
+        if done[0]:
+            current_value = info[0]["net_worth"]
+        else:
+            current_value = env.get_attr("net_worth")[0]
+
+        actions.append(action[0])
+        rewards.append(reward[0])
+        portfolio_values.append(current_value)
+
+    # Prepare results: summary metrics plus typed per-bar columns
+    return backtest_results.summarize(stock_name, actions, rewards, portfolio_values)
+
+
+def run_numpy_backtest(stock_name, data, policy):
+    """Simulate an exported NumpyPolicy over data without torch or stable_baselines3.
+
+    Observations are normalized with the frozen training stats and rewards
+    are the raw env rewards, as in live trading.
+    """
+    env = TradingEnv(data)
+    obs = env.reset()
+    done = False
+    actions, rewards, portfolio_values = [], [], []
+
+    while not done:
+        with timing.span('inference'):
+            action, _ = policy.predict(obs)
+        with timing.span('env_step'):
+            obs, reward, done, info = env.step(int(action))
+        actions.append(action)
+        rewards.append(reward)
+        portfolio_values.append(info["net_worth"])
+
+    return backtest_results.summarize(stock_name, actions, rewards, portfolio_values)
 
-        return backtest_results
+
+def run_portfolio_backtest(data, model, normalizer):
+    """Simulate the portfolio model over data (a PortfolioData), as run_backtest does for one stock.
+
+    The action series holds one hold/buy/sell column per symbol, in data.symbols order.
+    """
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    env = DummyVecEnv([lambda: PortfolioEnv(data)])
+    normalizer.set_venv(env)
+    env = normalizer
+
+    obs = env.reset()
+    done = [False]
+    actions, rewards, portfolio_values = [], [], []
+
+    while not done[0]:
+        with timing.span('inference'):
+            action, _ = model.predict(obs, deterministic=True)
+        with timing.span('env_step'):
+            obs, reward, done, info = env.step(action)
+
+        if done[0]:
+            current_value = info[0]["net_worth"]
+        else:
+            current_value = env.get_attr("net_worth")[0]
+
+        actions.append(action[0])
+        rewards.append(reward[0])
+        portfolio_values.append(current_value)
+
+    results = backtest_results.summarize(PORTFOLIO, actions, rewards, portfolio_values)
+    results["symbols"] = data.symbols
+    return results
+
+
+def load_portfolio_metadata():
+    """Stocks and symbols (in action order) the portfolio model was trained on."""
+    path = f"models/trading_bot_ppo_{PORTFOLIO}.json"
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found. Train the model first with train_model.py --portfolio.")
+    with open(path) as f:
+        return json.load(f)
+
+
+def backtest_portfolio():
+    """Backtest the portfolio model over the last 90 days of bars of all its stocks."""
+    from stable_baselines3 import PPO
+
+    with timing.span('model_load'), model_files_lock(PORTFOLIO):
+        metadata = load_portfolio_metadata()
+        model_path, env_path = policy_paths(PORTFOLIO)
+        model = PPO.load(model_path)
+        normalizer = load_normalizer(env_path)
+
+    data = PortfolioData.align({symbol: FeatureSet.from_frame(load_backtest_data(stock))
+                                for stock, symbol in zip(metadata['stocks'], metadata['symbols'])})
+    return save_results(PORTFOLIO, run_portfolio_backtest(data, model, normalizer))
+
+
+def save_results(stock_name, results):
+    """Write results to backtest_results_<Stock>.npz and return the summary (without the series)."""
+    with timing.span('save_results'):
+        path = backtest_results.save(stock_name, results)
+    summary = {key: value for key, value in results.items() if key != 'series'}
+    summary["results_file"] = path
+    return summary
+
+
+def backtest(stock_name, numpy_policy=False):
+    try:
+        if stock_name == PORTFOLIO:
+            if numpy_policy:
+                raise ValueError("The portfolio model has no exported NumPy policy; backtest it without --numpy.")
+            return backtest_portfolio()
+
+        data = load_backtest_data(stock_name)
+
+        if numpy_policy:
+            # Exported policy from policy_export.py
+            export_path = policy_export_path(stock_name)
+            if not os.path.exists(export_path):
+                raise FileNotFoundError(f"{export_path} not found. Run policy_export.py {stock_name} first.")
+            with timing.span('model_load'):
+                policy = NumpyPolicy.load(export_path)
+            results = run_numpy_backtest(stock_name, data, policy)
+        else:
+            from stable_baselines3 import PPO
+
+            # Load the trained model and normalization settings
+            with timing.span('model_load'), model_files_lock(stock_name):
+                model_path, env_path = policy_paths(stock_name)
+                model = PPO.load(model_path)
+                normalizer = load_normalizer(env_path)
+
+            results = run_backtest(stock_name, data, model, normalizer)
+
+        # Save results to a file
+        return save_results(stock_name, results)
 
     except Exception as e:
         # Log the full error for debugging
@@ -172,11 +299,14 @@ def main():
         sys.exit(1)
     
     stock_name = sys.argv[1]
+    numpy_policy = '--numpy' in sys.argv[2:]
     
     try:
         # Run backtest and print results
-        result = backtest(stock_name)
+        result = backtest(stock_name, numpy_policy=numpy_policy)
         print(json.dumps(result, indent=2))
+        print(timing.report(), file=sys.stderr)
+        timing.save('Backtest_bot')
         sys.exit(0)
     except Exception as e:
         # Print error to stderr
@@ -1,74 +1,204 @@
-from fastapi import FastAPI, HTTPException
-import subprocess
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import asyncio
+import threading
+import time
 import os
-import sys
-import json
 from dotenv import load_dotenv
+from backtest_engine import BacktestEngine
+from broker_client import connect
+from backtest_results import BacktestResults, results_path
+from constants import STOCK_MAPPINGS
+from training_jobs import TRAINING_THREADS, TrainingScheduler
+from performance import PERFORMANCE_FILE, PerformanceTracker
+import timing
+import worker_pool
+import pandas as pd
 
 load_dotenv()
 
 app = FastAPI()
+backtest_engine = BacktestEngine()
+# Trainings and trading bots are forked from a server with torch & co. already imported,
+# whose BLAS/OpenMP thread pools are sized for one training
+job_pool = worker_pool.WorkerPool(threads=TRAINING_THREADS)
+training_scheduler = TrainingScheduler(pool=job_pool)
+# (mtime, tracker) of the last performance state written by live_engine.py
+_performance_state = (None, None)
+# stock -> (mtime, BacktestResults) of the last results file read
+_backtest_results = {}
+# One profiled request at a time: a thread can only run one profiler
+_profile_lock = asyncio.Lock()
+
+
+@app.on_event("startup")
+def start_job_pool():
+    # Pay the pool server's imports now rather than on the first /train or /trade
+    if worker_pool.USE_WORKER_POOL:
+        threading.Thread(target=job_pool.ensure_running, daemon=True).start()
+
+
+@app.on_event("shutdown")
+def shutdown_backtest_engine():
+    backtest_engine.shutdown()
+    training_scheduler.shutdown()
+    job_pool.shutdown()
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """Record request latency per route; profile the request when asked with ?profile=cprofile|pyinstrument."""
+    mode = request.query_params.get("profile")
+    if mode and not timing.PROFILING:
+        return JSONResponse({"detail": "Profiling is disabled. Start the API with ITRADER_PROFILING=1."}, 403)
+    start = time.perf_counter()
+    if mode:
+        try:
+            profile = timing.RequestProfile(mode)
+        except (ImportError, ValueError) as e:
+            return JSONResponse({"detail": f"Cannot profile with '{mode}': {e}"}, 400)
+        async with _profile_lock:
+            with profile.active(), profile.capture(async_mode=True):
+                response = await call_next(request)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.url.path.strip('/').replace('/', '_') or 'root'}"
+            response.headers["X-Profile"] = await asyncio.to_thread(profile.save, name)
+    else:
+        response = await call_next(request)
+    # Route templates (not raw paths) keep the label set small
+    route = request.scope.get("route")
+    timing.observe(f"http {request.method} {route.path if route else 'unmatched'}", time.perf_counter() - start)
+    return response
+
+@app.get("/metrics")
+def metrics():
+    """Stage latency histograms of the API and its background processes, in the Prometheus text format."""
+    return PlainTextResponse(timing.render_prometheus(timing.collect("app")),
+                             media_type="text/plain; version=0.0.4")
 
 @app.get("/train")
-def train_model(stock: str):
-    """Train the RL model on a specified stock."""
-    subprocess.Popen([sys.executable, "train_model.py", stock], env=os.environ.copy())
-    return {"message": f"Training started for {stock}"}
+def train_model(stock: str, incremental: bool = False):
+    """Queue training of the RL model on a specified stock (incremental: fine-tune on new bars only)."""
+    if stock not in STOCK_MAPPINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown stock '{stock}'. Available: {list(STOCK_MAPPINGS)}")
+    job, created = training_scheduler.submit(stock, incremental=incremental)
+    if not created:
+        message = f"Training already {job.state} for {stock}"
+    elif job.state == "queued":
+        message = f"Training queued for {stock}"
+    else:
+        message = f"Training started for {stock}"
+    return {"message": message, "job": job.to_dict()}
+
+@app.get("/jobs")
+def list_jobs():
+    """Status and progress of queued, running and recent training jobs."""
+    return {"jobs": [job.to_dict() for job in training_scheduler.jobs()]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status and progress of one training job."""
+    job = training_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Cancel a queued or running training job."""
+    job = training_scheduler.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return {"message": f"Job {job_id} is {job.state}", "job": job.to_dict()}
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value lists etag (weak validators compare equal)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
 
 @app.get("/backtest")
-async def backtest_model(stock: str):
-    """Backtest the trained model on historical data and return the result."""
+async def backtest_model(stock: str, request: Request):
+    """Backtest the trained model on historical data and return the result.
+
+    Results are cached until the model files or the bars change; the ETag
+    header identifies them, and If-None-Match with it answers 304.
+    """
     try:
-        # Run backtest and capture output
-        result = subprocess.run(
-            [sys.executable, "Backtest_bot.py", stock],
-            capture_output=True, 
-            text=True, 
-            check=False  # Remove check=True to capture non-zero exit codes
-        )
-        
-        # Check if the process exited with an error
-        if result.returncode != 0:
-            # If there's stderr output, use that
-            error_message = result.stderr.strip() or result.stdout.strip()
-            return {
-                "error": "Backtesting failed", 
-                "details": error_message,
-                "return_code": result.returncode
-            }
-        
-        # Try to parse the JSON output
-        try:
-            backtest_results = json.loads(result.stdout)
-            return {
-                "message": f"Backtesting completed for {stock}", 
-                "data": backtest_results
-            }
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return raw output
-            return {
-                "message": f"Backtesting completed for {stock}", 
-                "data": result.stdout
-            }
-    
+        # Runs in-process on the engine's worker pool, reusing loaded models and cached results
+        etag, backtest_results = await backtest_engine.run(stock)
     except Exception as e:
         # Catch any unexpected errors
         return {
             "error": "Backtesting failed", 
             "details": str(e)
         }
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({
+        "message": f"Backtesting completed for {stock}",
+        "data": backtest_results
+    }, headers=headers)
+
+def load_backtest_results(stock):
+    """Stored results of the last backtest of stock, re-read only when the file changes."""
+    try:
+        mtime = os.stat(results_path(stock)).st_mtime_ns
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"No backtest results for {stock}. Run /backtest?stock={stock} first.")
+    cached = _backtest_results.get(stock)
+    if cached is None or cached[0] != mtime:
+        cached = _backtest_results[stock] = (mtime, BacktestResults(results_path(stock)))
+    return cached[1]
+
+@app.get("/backtest/results")
+def get_backtest_results(stock: str, offset: int = Query(0, ge=0), limit: int = Query(1000, ge=1, le=10000),
+                         every: int = Query(1, ge=1)):
+    """Page through the per-bar series of the last backtest, optionally in buckets of `every` bars."""
+    results = load_backtest_results(stock)
+    return {"summary": results.summary, **results.page(offset, limit, every)}
+
+@app.get("/backtest/results/stream")
+def stream_backtest_results(stock: str, every: int = Query(1, ge=1)):
+    """Stream the last backtest as newline-delimited JSON: summary, then chunks of the series."""
+    results = load_backtest_results(stock)
+    return StreamingResponse(results.stream(every), media_type="application/x-ndjson")
 
 @app.get("/trade")
 def start_trading(stock: str):
     """Start live trading using the trained model."""
-    subprocess.Popen([sys.executable, "interactive_bot.py", stock], env=os.environ.copy())
+    worker_pool.launch("interactive_bot.py", [stock], capture_output=False, pool=job_pool)
     return {"message": f"Trading started for {stock}"}
 
+def load_performance():
+    """Latest PerformanceTracker saved by the live engine or the /trade bots, re-read only when the file changes."""
+    global _performance_state
+    try:
+        mtime = os.stat(PERFORMANCE_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if _performance_state[0] != mtime:
+        _performance_state = (mtime, PerformanceTracker.load(PERFORMANCE_FILE))
+    return _performance_state[1]
+
 @app.get("/performance")
-def get_performance():
-    """Fetch trading bot performance metrics."""
-    # This should be replaced with actual logic to fetch live data
-    return {"net_worth": 10500, "profit_loss": 500}
+def get_performance(symbol: str = None, window: str = None):
+    """Fetch trading bot performance metrics, for the portfolio or one symbol, over all time or a window (e.g. 1h, 7d)."""
+    tracker = load_performance()
+    if tracker is None:
+        raise HTTPException(status_code=404,
+                            detail="No performance data yet. Start trading with /trade or live_engine.py first.")
+
+    symbol = STOCK_MAPPINGS.get(symbol, symbol)
+    if symbol is not None and symbol not in tracker.books:
+        raise HTTPException(status_code=400, detail=f"Unknown symbol '{symbol}'. Tracked: {list(tracker.books)}")
+    try:
+        window_seconds = pd.Timedelta(window).total_seconds() if window else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid window '{window}'. Use e.g. 30min, 1h, 7d.")
+
+    return {"symbol": symbol or "total", "window": window, **tracker.summary(symbol, window_seconds)}
 
 @app.get("/stocks")
 def get_available_stocks():
@@ -76,11 +206,15 @@ def get_available_stocks():
     stock_mapping = {"Apple": "AAPL", "Tesla": "TSLA", "Nvidia": "NVDA", "Google": "GOOGL", "Microsoft": "MSFT", "Netflix": "NFLX"}
     return {"available_stocks": list(stock_mapping.keys())}
 
+def force_exit():
+    try:
+        connect().close_all_positions(cancel_orders=True)
+    except Exception as e:
+        print(f"Error exiting positions : {e}")
+
 @app.get("/exit")
-def exit():
+def exit(background_tasks: BackgroundTasks):
     """Exit All Positions Forcefully"""
-    subprocess.Popen(
-        [sys.executable, "interactive_bot.py", "force_exit"],
-        env=os.environ.copy()
-    )
+    # One Alpaca request: sent from this process after responding, no interpreter or model imports
+    background_tasks.add_task(force_exit)
     return {"message": "Force exit command sent successfully!"}
\ No newline at end of file
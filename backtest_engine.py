@@ -0,0 +1,205 @@
+import asyncio
+import contextvars
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from stable_baselines3 import PPO
+
+import Backtest_bot
+import timing
+from policy_export import model_files_lock
+
+# Number of stocks whose model + normalizer stay loaded
+MAX_LOADED_MODELS = int(os.getenv('ITRADER_MAX_LOADED_MODELS', '6'))
+# Backtests allowed to run at the same time
+BACKTEST_WORKERS = int(os.getenv('ITRADER_BACKTEST_WORKERS', '4'))
+# Backtest summaries kept, keyed by stock, model files and bars
+MAX_CACHED_BACKTESTS = int(os.getenv('ITRADER_BACKTEST_CACHE_SIZE', '64'))
+# Seconds the bars fetched for a stock's backtest are reused before Alpaca is asked again
+BARS_TTL = float(os.getenv('ITRADER_BACKTEST_BARS_TTL_SECONDS', '60'))
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class ModelRegistry:
+    """LRU cache of loaded PPO models and their VecNormalize stats.
+
+    Entries are keyed by stock and the mtimes of both files, so retraining a
+    stock makes the next lookup load the new files.
+    """
+
+    def __init__(self, max_models=MAX_LOADED_MODELS):
+        self.max_models = max_models
+        self._entries = OrderedDict()
+        self._loading = {}  # key -> future of the load other callers for that key wait on
+        self._lock = threading.Lock()
+
+    def get(self, stock_name):
+        """Return (model, normalizer) for stock_name, loading the model if needed.
+
+        The model is shared; the normalizer is a fresh unpickled copy on every
+        call so concurrent backtests don't share running stats. Loads run
+        outside the registry lock, so cold loads of different stocks overlap;
+        callers asking for a model that is already loading wait for that load.
+        """
+        with model_files_lock(stock_name):
+            model_path, env_path = Backtest_bot.policy_paths(stock_name)
+            key = (stock_name, os.stat(model_path).st_mtime_ns, os.stat(env_path).st_mtime_ns)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                model, normalizer_state = self._entries[key]
+                return model, pickle.loads(normalizer_state)
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            model, normalizer_state = loading.result()
+            return model, pickle.loads(normalizer_state)
+
+        try:
+            with timing.span('model_load'), model_files_lock(stock_name):
+                with open(env_path, 'rb') as f:
+                    normalizer_state = f.read()
+                model = PPO.load(model_path)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._loading[key]
+            # Drop older versions of this stock's files, then the least recently used stocks
+            for stale in [k for k in self._entries if k[0] == stock_name]:
+                del self._entries[stale]
+            self._entries[key] = (model, normalizer_state)
+            while len(self._entries) > self.max_models:
+                self._entries.popitem(last=False)
+        loading.set_result((model, normalizer_state))
+        return model, pickle.loads(normalizer_state)
+
+    def loaded(self):
+        with self._lock:
+            return [stock_name for stock_name, _, _ in self._entries]
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def model_fingerprint(stock_name):
+    """mtime and size of a stock's model and normalizer files."""
+    model_path, env_path = Backtest_bot.policy_paths(stock_name)
+    return file_fingerprint(model_path), file_fingerprint(env_path)
+
+
+def bars_fingerprint(bars):
+    """Digest of the bar times and OHLCV values, so a new or revised bar changes it."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(bars.index.as_unit('ns').asi8.tobytes())
+    digest.update(bars[BAR_COLUMNS].to_numpy(dtype='float64').tobytes())
+    return digest.hexdigest()
+
+
+class BacktestEngine:
+    """Runs Backtest_bot backtests inside the current process with warm models.
+
+    Summaries are memoized in an LRU cache keyed by the stock, the mtime and
+    size of its model and normalizer files, and a fingerprint of the bars
+    fetched for the backtest. A request only recomputes when one of those
+    changed. The key's hash is returned as the result's ETag. Fetched bars
+    and their fingerprint are reused for bars_ttl seconds, so a cache hit
+    within that time makes no Alpaca request.
+    """
+
+    def __init__(self, max_workers=BACKTEST_WORKERS, registry=None, max_cached=MAX_CACHED_BACKTESTS,
+                 bars_ttl=BARS_TTL):
+        self.registry = registry or ModelRegistry()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backtest')
+        self.max_cached = max_cached
+        self._results = OrderedDict()
+        self._results_lock = threading.Lock()
+        self.bars_ttl = bars_ttl
+        self._bars = {}  # stock -> (monotonic fetch time, bars, fingerprint)
+        self._bars_lock = threading.Lock()
+        # (stock, model fingerprint) -> future of the run every concurrent request for it awaits
+        self._inflight = {}
+
+    def recent_bars(self, stock_name):
+        """(bars, fingerprint) of stock_name, fetched at most bars_ttl seconds ago."""
+        with self._bars_lock:
+            cached = self._bars.get(stock_name)
+        if cached is not None and time.monotonic() - cached[0] < self.bars_ttl:
+            return cached[1], cached[2]
+        fetched_at = time.monotonic()
+        bars = Backtest_bot.fetch_backtest_bars(stock_name)
+        fingerprint = bars_fingerprint(bars)
+        with self._bars_lock:
+            self._bars[stock_name] = (fetched_at, bars, fingerprint)
+        return bars, fingerprint
+
+    def backtest(self, stock_name):
+        """Blocking backtest, served from the cache when possible; returns (etag, summary).
+
+        The summary is the same as Backtest_bot.backtest's, and a recomputed
+        backtest writes the same results file.
+        """
+        with timing.profiled():
+            bars, fingerprint = self.recent_bars(stock_name)
+            key = (stock_name, *model_fingerprint(stock_name), fingerprint)
+            etag = f'"{hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()}"'
+            with self._results_lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    return etag, self._results[key]
+
+            with timing.span('backtest'):
+                # load_backtest_data adds indicators in place; keep the cached bars raw
+                data = Backtest_bot.load_backtest_data(stock_name, bars.copy())
+                model, normalizer = self.registry.get(stock_name)
+                results = Backtest_bot.run_backtest(stock_name, data, model, normalizer)
+                summary = Backtest_bot.save_results(stock_name, results)
+            with self._results_lock:
+                self._results[key] = summary
+                while len(self._results) > self.max_cached:
+                    self._results.popitem(last=False)
+            return etag, summary
+
+    async def run(self, stock_name):
+        """backtest() on the worker pool without blocking the event loop.
+
+        Requests for a stock that arrive while one is running share its result,
+        as long as its model files are unchanged; after a retrain they start a
+        new run on the new model.
+        """
+        inflight_key = (stock_name, *model_fingerprint(stock_name))
+        pending = self._inflight.get(inflight_key)
+        if pending is None:
+            loop = asyncio.get_running_loop()
+            # Carry the request's context (e.g. an active timing.RequestProfile) into the worker
+            context = contextvars.copy_context()
+            pending = loop.run_in_executor(self.executor, context.run, self.backtest, stock_name)
+            self._inflight[inflight_key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        # One client going away must not cancel the run for the others
+        return await asyncio.shield(pending)
+
+    def clear_cache(self):
+        with self._results_lock:
+            self._results.clear()
+        with self._bars_lock:
+            self._bars.clear()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,105 @@
+"""Backtest results stored as typed columns in one binary file per stock.
+
+Per-bar series are kept as arrays (action int8, reward and net_worth float32)
+next to a small JSON summary in ``backtest_results_<Stock>.npz``. Readers
+can load the summary alone, or page through or stream the series,
+optionally downsampled into fixed-size buckets.
+"""
+import json
+import os
+
+import numpy as np
+
+# Per-bar columns and their stored dtypes
+SERIES_DTYPES = {
+    'action': np.int8,
+    'reward': np.float32,
+    'net_worth': np.float32,
+}
+# Bars per chunk when streaming a series
+STREAM_CHUNK_BARS = 5000
+
+
+def results_path(stock_name):
+    return f"backtest_results_{stock_name}.npz"
+
+
+def summarize(stock_name, action, reward, net_worth):
+    """Summary metrics and typed series of one backtest run."""
+    series = {
+        'action': np.asarray(action, dtype=SERIES_DTYPES['action']),
+        'reward': np.asarray(reward, dtype=SERIES_DTYPES['reward']),
+        'net_worth': np.asarray(net_worth, dtype=SERIES_DTYPES['net_worth']),
+    }
+    values = np.asarray(net_worth, dtype=np.float64)
+    peak = np.maximum.accumulate(values)
+    return {
+        "stock": stock_name,
+        "initial_portfolio_value": float(values[0]),
+        "final_portfolio_value": float(values[-1]),
+        "total_return_percentage": float((values[-1] - values[0]) / values[0] * 100),
+        "max_drawdown_percentage": float(np.max(1 - values / peak) * 100),
+        "bars": len(values),
+        "series": series,
+    }
+
+
+def save(stock_name, results, path=None):
+    """Write a summarize() result to its results file."""
+    path = path or results_path(stock_name)
+    summary = {key: value for key, value in results.items() if key != 'series'}
+    tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+    np.savez(tmp_path, summary=np.array(json.dumps(summary)), **results['series'])
+    os.replace(tmp_path, path)
+    return path
+
+
+def downsample(series, every):
+    """Bucket every ``every`` bars: last action and net worth, summed reward."""
+    if every <= 1:
+        return series
+    starts = np.arange(0, len(series['net_worth']), every)
+    ends = np.minimum(starts + every, len(series['net_worth'])) - 1
+    return {
+        'action': series['action'][ends],
+        'reward': np.add.reduceat(series['reward'], starts) if len(starts) else series['reward'][:0],
+        'net_worth': series['net_worth'][ends],
+    }
+
+
+class BacktestResults:
+    """Read side of a results file: summary, pages and chunks of the per-bar series."""
+
+    def __init__(self, path):
+        self.path = path
+        with np.load(path, allow_pickle=False) as f:
+            self.summary = json.loads(str(f['summary']))
+            self.series = {name: f[name] for name in SERIES_DTYPES}
+
+    @classmethod
+    def for_stock(cls, stock_name):
+        path = results_path(stock_name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found. Run a backtest for {stock_name} first.")
+        return cls(path)
+
+    def __len__(self):
+        return len(self.series['net_worth'])
+
+    def page(self, offset=0, limit=1000, every=1):
+        """One page of the (downsampled) series as JSON-ready lists."""
+        series = downsample(self.series, every)
+        total = len(series['net_worth'])
+        stop = min(offset + limit, total)
+        page = {name: values[offset:stop].tolist() for name, values in series.items()}
+        return {"offset": offset, "limit": limit, "every": every, "total": total,
+                "next_offset": stop if stop < total else None, "series": page}
+
+    def stream(self, every=1, chunk_bars=STREAM_CHUNK_BARS):
+        """Newline-delimited JSON: the summary first, then one object per chunk of the series."""
+        yield json.dumps(self.summary) + "\n"
+        series = downsample(self.series, every)
+        total = len(series['net_worth'])
+        for offset in range(0, total, chunk_bars):
+            chunk = {name: values[offset:offset + chunk_bars].tolist() for name, values in series.items()}
+            yield json.dumps({"offset": offset, **chunk}) + "\n"
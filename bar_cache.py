@@ -0,0 +1,138 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Root directory of the on-disk bar store
+CACHE_DIR = os.getenv('ITRADER_BAR_CACHE', os.path.join('data', 'bars'))
+
+# Ranges closer to "now" than this are not marked as cached: the latest bars
+# may still be incomplete or revised, so they are fetched again next time.
+SETTLE_PERIOD = pd.Timedelta(days=1)
+
+# Alpaca has bars from the pre-market open to the after-hours close on weekdays.
+# An empty answer for a range outside all of those hours is final; any other
+# empty answer may be a transient miss and is asked again next time.
+MARKET_TZ = 'America/New_York'
+EXTENDED_OPEN = pd.Timedelta(hours=4)
+EXTENDED_CLOSE = pd.Timedelta(hours=20)
+
+
+def _timestamp(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+def _subtract(start, end, covered):
+    """Parts of [start, end) not inside any of the sorted, disjoint covered intervals."""
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_end <= cursor:
+            continue
+        if covered_start >= end:
+            break
+        if covered_start > cursor:
+            gaps.append((cursor, covered_start))
+        cursor = max(cursor, covered_end)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def _market_closed(start, end):
+    """True if [start, end) holds no weekday extended-hours trading time (holidays are not known)."""
+    days = pd.date_range(start.tz_convert(MARKET_TZ).normalize(), end.tz_convert(MARKET_TZ).normalize(), freq='D')
+    days = days[days.weekday < 5]
+    return not ((days + EXTENDED_OPEN < end) & (days + EXTENDED_CLOSE > start)).any()
+
+
+def _merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class BarCache:
+    """Local columnar store of OHLCV bars in front of the Alpaca ``get_bars`` call.
+
+    Bars are kept per symbol/timeframe/feed in one ``.npz`` file holding a
+    column per field plus the list of time ranges already fetched, so repeat
+    requests read from disk and only the missing ranges hit the API. ``api``
+    is anything with a ``tradeapi.REST``-compatible ``get_bars``.
+    """
+
+    def __init__(self, api, root=CACHE_DIR):
+        self.api = api
+        self.root = root
+
+    def path(self, symbol, timeframe, feed=None):
+        return os.path.join(self.root, feed or 'default', timeframe, f"{symbol}.npz")
+
+    def load(self, symbol, timeframe, feed=None):
+        """Return (bars, covered intervals) from disk, empty if nothing is cached yet."""
+        path = self.path(symbol, timeframe, feed)
+        if not os.path.exists(path):
+            return pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC', name='timestamp')), []
+        with np.load(path, allow_pickle=False) as store:
+            index = pd.DatetimeIndex(pd.to_datetime(store['timestamp'], unit='ns', utc=True), name='timestamp')
+            columns = [str(name) for name in store['columns']]
+            bars = pd.DataFrame({name: store[f"col_{name}"] for name in columns}, index=index)
+            covered = [(pd.Timestamp(s, tz='UTC'), pd.Timestamp(e, tz='UTC')) for s, e in store['covered']]
+        return bars, covered
+
+    def save(self, symbol, timeframe, feed, bars, covered):
+        path = self.path(symbol, timeframe, feed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {f"col_{name}": bars[name].to_numpy() for name in bars.columns}
+        arrays['columns'] = np.array(list(bars.columns), dtype=str)
+        arrays['timestamp'] = bars.index.as_unit('ns').asi8
+        arrays['covered'] = np.array([(s.value, e.value) for s, e in covered], dtype=np.int64).reshape(-1, 2)
+        # Write to a temp file and rename so readers never see a half-written store
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def _fetch(self, symbol, timeframe, start, end, feed):
+        kwargs = {'feed': feed} if feed else {}
+        bars = self.api.get_bars(symbol, timeframe, start=start.isoformat(), end=end.isoformat(), **kwargs).df
+        if bars.empty:
+            return bars
+        bars.index = pd.DatetimeIndex(bars.index, name='timestamp').as_unit('ns')
+        if bars.index.tz is None:
+            bars.index = bars.index.tz_localize('UTC')
+        return bars
+
+    def get_bars(self, symbol, timeframe, start, end=None, feed=None):
+        """Bars for [start, end), fetching only the ranges not cached yet."""
+        start = _timestamp(start)
+        end = _timestamp(end) if end is not None else pd.Timestamp.now(tz='UTC')
+        bars, covered = self.load(symbol, timeframe, feed)
+
+        gaps = _subtract(start, end, covered)
+        if gaps:
+            fetched, answered = [], []
+            try:
+                for gap_start, gap_end in gaps:
+                    frame = self._fetch(symbol, timeframe, gap_start, gap_end, feed)
+                    if not frame.empty:
+                        fetched.append(frame)
+                    if not frame.empty or _market_closed(gap_start, gap_end):
+                        answered.append((gap_start, gap_end))
+            finally:
+                # Keep what earlier gaps returned even if a later request fails
+                if fetched:
+                    bars = pd.concat([bars] + fetched) if not bars.empty else pd.concat(fetched)
+                    bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+                settled = pd.Timestamp.now(tz='UTC') - SETTLE_PERIOD
+                covered = _merge_intervals(
+                    covered + [(gap_start, min(gap_end, settled)) for gap_start, gap_end in answered
+                               if gap_start < settled])
+                if fetched or answered:
+                    self.save(symbol, timeframe, feed, bars, covered)
+
+        return bars[(bars.index >= start) & (bars.index < end)].copy()
@@ -0,0 +1,61 @@
+"""Job startup latency: a fresh interpreter per job against a fork of the preloaded worker pool.
+
+Each job is ``train_model.py --help``, which imports everything a training
+imports and then exits, so the wall time is the startup cost alone.
+
+Usage: python benchmarks/bench_job_startup.py [--jobs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from worker_pool import WorkerPool
+
+SCRIPT = os.path.join(REPO_ROOT, 'train_model.py')
+
+
+def fresh_interpreter():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, SCRIPT, '--help'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   check=True)
+    return time.perf_counter() - start
+
+
+def pool_fork(pool):
+    start = time.perf_counter()
+    process = pool.start(SCRIPT, ['--help'])
+    process.stdout.read()
+    if process.wait() != 0:
+        raise RuntimeError("train_model.py --help failed in the worker pool")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=5)
+    args = parser.parse_args()
+
+    pool = WorkerPool()
+    start = time.perf_counter()
+    pool.ensure_running()
+    pool_fork(pool)  # waits for the server's imports
+    warm_up = time.perf_counter() - start
+
+    fresh = [fresh_interpreter() for _ in range(args.jobs)]
+    forked = [pool_fork(pool) for _ in range(args.jobs)]
+    pool.shutdown()
+
+    print(f"pool server warm-up (once) : {warm_up * 1e3:10.1f} ms")
+    print(f"fresh interpreter per job  : {statistics.median(fresh) * 1e3:10.1f} ms median")
+    print(f"fork of preloaded server   : {statistics.median(forked) * 1e3:10.1f} ms median")
+    print(f"speedup                    : {statistics.median(fresh) / statistics.median(forked):10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
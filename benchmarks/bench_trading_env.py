@@ -0,0 +1,96 @@
+"""Steps/sec of TradingEnv on synthetic data, against the old per-step pandas lookups.
+
+Usage: python benchmarks/bench_trading_env.py [--bars 5000] [--steps 20000] [--envs 1 64 256]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from trading_env import TradingEnv
+from vec_trading_env import BatchTradingVecEnv
+from benchmarks.fixtures import synthetic_features
+
+
+class PandasTradingEnv(TradingEnv):
+    """Reference copy of the original iloc-based observation/step path."""
+
+    def _next_observation(self):
+        row = lambda col: self.data.iloc[self.current_step][col]
+        obs = np.array([
+            row('open') / 1000, row('high') / 1000, row('low') / 1000, row('close') / 1000,
+            row('RSI') / 100, row('MACD'), row('MACD_hist'),
+            row('Stochastic_K'), row('Stochastic_D'),
+            row('Upper_Band') / 1000, row('Lower_Band') / 1000,
+            self.shares_held / 1000, self.balance / self.initial_balance,
+            row('CCI') / 1000, row('OBV') / 1000000,
+        ])
+        return obs.astype(np.float32)
+
+    def step(self, action):
+        # Swap the arrays for the pandas lookups the original step made
+        self.prices = self.data['close']
+        self.sma_10 = self.data['SMA_10'] if 'SMA_10' in self.data.columns else None
+        return super().step(action)
+
+
+def run(env, actions):
+    observations, rewards = [env.reset()], []
+    for action in actions:
+        obs, reward, done, _ = env.step(action)
+        observations.append(obs)
+        rewards.append(reward)
+        if done:
+            observations.append(env.reset())
+    return np.array(observations), np.array(rewards)
+
+
+def steps_per_second(env, actions):
+    start = time.perf_counter()
+    run(env, actions)
+    return len(actions) / (time.perf_counter() - start)
+
+
+def batch_steps_per_second(data, n_envs, steps):
+    env = BatchTradingVecEnv(data, n_envs, episode_length=1000, seed=0)
+    actions = np.random.default_rng(0).integers(0, 3, (steps, n_envs))
+    env.reset()
+    start = time.perf_counter()
+    for action in actions:
+        env.step(action)
+    return steps * n_envs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bars', type=int, default=5000)
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--envs', type=int, nargs='*', default=[1, 64, 256],
+                        help="Episode counts to run through BatchTradingVecEnv")
+    args = parser.parse_args()
+
+    data = synthetic_features(args.bars)
+    actions = np.random.default_rng(0).integers(0, 3, args.steps)
+
+    # The array path must reproduce the pandas path exactly
+    new_obs, new_rewards = run(TradingEnv(data), actions[:2000])
+    old_obs, old_rewards = run(PandasTradingEnv(data), actions[:2000])
+    assert np.array_equal(new_obs, old_obs) and np.array_equal(new_rewards, old_rewards), \
+        "array-backed TradingEnv diverged from the pandas reference"
+
+    before = steps_per_second(PandasTradingEnv(data), actions[:max(args.steps // 10, 1)])
+    after = steps_per_second(TradingEnv(data), actions)
+    print(f"pandas iloc path : {before:12,.0f} steps/sec")
+    print(f"array path       : {after:12,.0f} steps/sec")
+    print(f"speedup          : {after / before:12.1f}x")
+    for n_envs in args.envs:
+        rate = batch_steps_per_second(data, n_envs, max(args.steps // n_envs, 100))
+        print(f"batch x{n_envs:<4}      : {rate:12,.0f} env-steps/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from indicators import add_indicators
+
+
+def synthetic_ohlcv(n_bars=5000, seed=0, start='2020-01-01', freq='h'):
+    """Random-walk 1H OHLCV bars shaped like the frames returned by Alpaca get_bars."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    open_ = close * (1 + rng.normal(0, 0.002, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n_bars)))
+    index = pd.date_range(start, periods=n_bars, freq=freq, tz='UTC', name='timestamp')
+    return pd.DataFrame({
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.integers(1000, 50000, n_bars).astype(np.float64),
+    }, index=index)
+
+
+def synthetic_features(n_bars=5000, seed=0):
+    """Synthetic bars plus every indicator column TradingEnv reads, with warm-up rows dropped."""
+    data = add_indicators(synthetic_ohlcv(n_bars + 50, seed=seed))
+    return data.dropna()
+
+
+class FakeBarsApi:
+    """Offline stand-in for ``tradeapi.REST.get_bars``: deterministic synthetic bars for any range.
+
+    Bars sit on a fixed hourly grid per symbol, so repeated and overlapping
+    requests agree with each other, as they would against Alpaca.
+    """
+
+    def __init__(self, origin='2015-01-01', freq='h'):
+        self.origin = pd.Timestamp(origin, tz='UTC')
+        self.freq = freq
+        self.calls = 0
+
+    class _Bars:
+        def __init__(self, df):
+            self.df = df
+
+    def get_bars(self, symbol, timeframe, start=None, end=None, feed=None, **kwargs):
+        self.calls += 1
+        start = pd.Timestamp(start).tz_localize('UTC') if pd.Timestamp(start).tzinfo is None else pd.Timestamp(start)
+        end = pd.Timestamp(end).tz_localize('UTC') if pd.Timestamp(end).tzinfo is None else pd.Timestamp(end)
+        n_bars = int((end - self.origin) / pd.Timedelta(1, self.freq)) + 1
+        seed = sum(map(ord, symbol))
+        bars = synthetic_ohlcv(max(n_bars, 1), seed=seed, start=self.origin, freq=self.freq)
+        return self._Bars(bars[(bars.index >= start) & (bars.index < end)])
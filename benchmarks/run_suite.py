@@ -0,0 +1,251 @@
+"""Offline benchmark suite: env, indicators, model loading, inference, backtest and /backtest, written as JSON.
+
+Everything runs in a temporary directory against synthetic bars (no Alpaca
+credentials or network): a tiny PPO model and its VecNormalize stats are
+trained there first, and Backtest_bot's API client is replaced by
+benchmarks.fixtures.FakeBarsApi. Every metric is the best of --repeats runs.
+
+With --compare, the run is checked against an earlier results file and the
+script exits with status 1 if any metric is worse by more than --threshold
+(a fraction, 0.2 = 20%), so it can gate CI or a pre-merge check.
+
+Usage: python benchmarks/run_suite.py [--output bench.json] [--compare baseline.json] [--threshold 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fixtures import FakeBarsApi, synthetic_features, synthetic_ohlcv
+
+STOCK = 'Apple'
+
+
+def best_of(repeats, fn):
+    """Shortest wall time of ``repeats`` calls of fn, in seconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def metric(value, unit, better):
+    return {'value': float(value), 'unit': unit, 'better': better}
+
+
+def train_fixture_model(timesteps):
+    """Tiny PPO + VecNormalize saved where Backtest_bot.policy_paths looks for them."""
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+
+    from trading_env import TradingEnv
+
+    data = synthetic_features(2000, seed=1)
+    env = VecNormalize(DummyVecEnv([lambda: TradingEnv(data)]), norm_obs=True, norm_reward=True)
+    model = PPO('MlpPolicy', env, n_steps=64, batch_size=64, n_epochs=1, verbose=0, seed=0)
+    model.learn(total_timesteps=timesteps)
+    os.makedirs('models', exist_ok=True)
+    model.save(f"models/trading_bot_ppo_{STOCK}.zip")
+    env.save(f"models/trading_env_normalize_{STOCK}.pkl")
+
+
+def bench_env(bars, steps, repeats):
+    from trading_env import TradingEnv
+
+    data = synthetic_features(bars)
+    actions = np.random.default_rng(0).integers(0, 3, steps)
+    env = TradingEnv(data, episode_length=1000, random_start=True)
+
+    def run_steps():
+        env.reset()
+        for action in actions:
+            if env.step(action)[2]:
+                env.reset()
+
+    resets = max(steps // 10, 1)
+
+    def run_resets():
+        for _ in range(resets):
+            env.reset()
+
+    return {
+        'env_step_per_sec': metric(steps / best_of(repeats, run_steps), 'steps/s', 'higher'),
+        'env_reset_per_sec': metric(resets / best_of(repeats, run_resets), 'resets/s', 'higher'),
+    }
+
+
+def bench_indicators(bars, repeats):
+    import train_model
+
+    ohlcv = synthetic_ohlcv(bars)
+    seconds = best_of(repeats, lambda: train_model.prepare_features(ohlcv.copy()))
+    return {'indicators_seconds': metric(seconds, 's', 'lower')}
+
+
+def bench_model(repeats, predictions):
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+
+    import Backtest_bot
+    from trading_env import TradingEnv
+
+    data = synthetic_features(500, seed=2)
+    model_path, env_path = Backtest_bot.policy_paths(STOCK)
+    loaded = {}
+
+    def load():
+        loaded['model'] = PPO.load(model_path)
+        loaded['env'] = VecNormalize.load(env_path, DummyVecEnv([lambda: TradingEnv(data)]))
+
+    load_seconds = best_of(repeats, load)
+    model, env = loaded['model'], loaded['env']
+    env.training = False
+    obs = env.normalize_obs(env.reset())
+    model.predict(obs, deterministic=True)
+    predict_seconds = best_of(repeats, lambda: [model.predict(obs, deterministic=True) for _ in range(predictions)])
+    return {
+        'model_load_seconds': metric(load_seconds, 's', 'lower'),
+        'predict_latency_us': metric(predict_seconds / predictions * 1e6, 'us', 'lower'),
+    }
+
+
+def bench_backtest(repeats):
+    import Backtest_bot
+
+    # Warm the bar cache once so every run measures the same work
+    Backtest_bot.backtest(STOCK)
+    seconds = best_of(repeats, lambda: Backtest_bot.backtest(STOCK))
+    return {'backtest_seconds': metric(seconds, 's', 'lower')}
+
+
+def bench_endpoint(repeats):
+    from fastapi.testclient import TestClient
+
+    import app
+
+    def uncached():
+        app.backtest_engine.clear_cache()
+        client.get('/backtest', params={'stock': STOCK}).raise_for_status()
+
+    with TestClient(app.app) as client:
+        # First request loads the model into the engine's registry
+        response = client.get('/backtest', params={'stock': STOCK})
+        response.raise_for_status()
+        miss_seconds = best_of(repeats, uncached)
+        # Unchanged model and bars: served from the result cache
+        seconds = best_of(repeats, lambda: client.get('/backtest', params={'stock': STOCK}).raise_for_status())
+    return {
+        'backtest_endpoint_ms': metric(seconds * 1e3, 'ms', 'lower'),
+        'backtest_endpoint_uncached_ms': metric(miss_seconds * 1e3, 'ms', 'lower'),
+    }
+
+
+def run_suite(args):
+    import Backtest_bot
+
+    Backtest_bot._api = FakeBarsApi()
+    print("Training fixture model...", file=sys.stderr)
+    train_fixture_model(args.train_timesteps)
+
+    metrics = {}
+    stages = [
+        ('env', lambda: bench_env(args.bars, args.steps, args.repeats)),
+        ('indicators', lambda: bench_indicators(args.bars, args.repeats)),
+        ('model', lambda: bench_model(args.repeats, args.predictions)),
+        ('backtest', lambda: bench_backtest(args.repeats)),
+        ('endpoint', lambda: bench_endpoint(args.repeats)),
+    ]
+    for name, stage in stages:
+        print(f"Running {name} benchmarks...", file=sys.stderr)
+        metrics.update(stage())
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'bars': args.bars,
+            'steps': args.steps,
+            'repeats': args.repeats,
+        },
+        'metrics': metrics,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Rows of (name, baseline, current, change) and the names that regressed past threshold.
+
+    change is the relative move in the "worse" direction, so positive means slower.
+    """
+    rows, regressions = [], []
+    for name, entry in current['metrics'].items():
+        base = baseline['metrics'].get(name)
+        if base is None or not base['value']:
+            continue
+        change = (entry['value'] - base['value']) / base['value']
+        if entry['better'] == 'higher':
+            change = -change
+        rows.append((name, base['value'], entry['value'], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default='bench_results.json', help="Where to write the results JSON")
+    parser.add_argument('--compare', default=None, help="Baseline results JSON to check against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed slowdown per metric (fraction)")
+    parser.add_argument('--bars', type=int, default=5000)
+    parser.add_argument('--steps', type=int, default=20000)
+    parser.add_argument('--predictions', type=int, default=500)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--train-timesteps', type=int, default=256, help="Timesteps of the fixture model")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='itrader-bench-')
+    os.chdir(workdir)
+    try:
+        results = run_suite(args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for name, entry in results['metrics'].items():
+        print(f"{name:<30} {entry['value']:14,.3f} {entry['unit']}")
+    print(f"Results written to {output}")
+
+    if baseline is not None:
+        rows, regressions = compare(results, baseline, args.threshold)
+        print(f"\nAgainst {args.compare} (threshold {args.threshold:.0%}):")
+        for name, before, after, change in rows:
+            flag = '  REGRESSION' if name in regressions else ''
+            print(f"{name:<30} {before:14,.3f} -> {after:14,.3f}  {change:+7.1%} worse{flag}")
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
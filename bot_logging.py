@@ -0,0 +1,122 @@
+"""Non-blocking, rotated and sampled logging for the trading bots.
+
+setup_logging() gives the root logger a single QueueHandler, so a logging
+call on the trading path only appends the record to an in-memory queue. A
+listener thread formats each record as one compact JSON line and writes it
+to a size-rotated file.
+
+Rotation renames files, which is only safe with one writer, so every
+process logs to its own file: log_path(name) under LOG_DIR, named per
+script and stock (logs/interactive_bot_Apple.jsonl, logs/live_engine.jsonl).
+
+Repetitive status messages (market closed, pending orders, ...) are logged
+with ``extra=SAMPLED``. Each such message is then written at most once per
+SAMPLE_INTERVAL seconds, and the next copy written carries the number of
+repeats dropped in between.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# One JSON-lines file per process in this directory
+LOG_DIR = os.getenv('ITRADER_LOG_DIR', 'logs')
+LOG_LEVEL = os.getenv('ITRADER_LOG_LEVEL', 'INFO')
+# Rotate at this size, keeping LOG_BACKUPS old files (live_engine.jsonl.1, ...)
+LOG_MAX_BYTES = int(os.getenv('ITRADER_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv('ITRADER_LOG_BACKUPS', '5'))
+# Seconds between two written copies of the same sampled message
+SAMPLE_INTERVAL = float(os.getenv('ITRADER_LOG_SAMPLE_SECONDS', '300'))
+
+# Pass as extra= to rate-limit a message; keep its text constant so repeats match
+SAMPLED = {'sampled': True}
+
+# LogRecord attributes that are not user extras
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'sampled'}
+
+
+class SampleFilter(logging.Filter):
+    """Drops repeats of SAMPLED messages within ``interval`` seconds and counts them."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._last = {}  # (logger, level, message) -> (last written, repeats dropped since)
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            written, dropped = self._last.get(key, (None, 0))
+            if written is not None and now - written < self.interval:
+                self._last[key] = (written, dropped + 1)
+                return False
+            self._last[key] = (now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class CompactFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message, plus any extras and the traceback."""
+
+    def format(self, record):
+        entry = {
+            'ts': f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            'level': record.levelname,
+            'msg': record.getMessage(),
+        }
+        if record.name != 'root':
+            entry['logger'] = record.name
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Only merge the arguments here; formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def log_path(name):
+    """This process's log file; name must be unique among processes running at once."""
+    return os.path.join(LOG_DIR, f"{name}.jsonl")
+
+
+def setup_logging(path, level=LOG_LEVEL, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                  sample_interval=SAMPLE_INTERVAL):
+    """Route all logging through a queue to a rotating JSON-lines file at path; returns the listener."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                        encoding='utf-8', delay=True)
+    file_handler.setFormatter(CompactFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(sample_interval))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    # Flush what is still queued when the bot exits
+    atexit.register(listener.stop)
+    return listener
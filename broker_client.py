@@ -0,0 +1,241 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, the limit stays per process
+    fcntl = None
+
+import alpaca_trade_api as tradeapi
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+import timing
+from constants import STOCK_MAPPINGS
+
+# Alpaca allows 200 requests/minute per account; stay a little under it
+REQUESTS_PER_SECOND = float(os.getenv('ITRADER_BROKER_RATE', '3'))
+REQUEST_BURST = int(os.getenv('ITRADER_BROKER_BURST', '10'))
+# The limit is per account, so every process on the host (one interactive_bot per stock, the app,
+# live_engine) takes its tokens from one bucket kept in this file
+RATE_LIMIT_FILE = os.getenv('ITRADER_BROKER_RATE_FILE', os.path.join(tempfile.gettempdir(), 'itrader_broker_tokens'))
+
+# Seconds each kind of response is reused before asking the API again
+CLOCK_TTL = 30.0
+ACCOUNT_TTL = 5.0
+ORDERS_TTL = 5.0
+POSITIONS_TTL = 5.0
+LATEST_TRADE_TTL = 2.0
+
+# Retries of rate-limited (429) or unavailable (5xx) requests, with exponential backoff
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+PAPER_URL = 'https://paper-api.alpaca.markets'
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, at most ``capacity`` saved up."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose state lives in a file under an exclusive flock, shared by every process using it.
+
+    The file holds the saved tokens and the wall-clock time they were
+    counted at; each acquire reads, refills and writes it back under the lock.
+    """
+
+    def __init__(self, path, rate, capacity):
+        super().__init__(rate, capacity)
+        self.path = path
+
+    def acquire(self):
+        """Take one token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    now = time.time()
+                    try:
+                        tokens, updated = map(float, os.pread(fd, 64, 0).split())
+                    except ValueError:  # New or unreadable file: start full
+                        tokens, updated = float(self.capacity), now
+                    tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+                    wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+                    if not wait:
+                        tokens -= 1
+                    state = f"{tokens!r} {now!r}".encode()
+                    os.pwrite(fd, state.ljust(64), 0)
+                finally:
+                    os.close(fd)  # Releases the flock
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+def _status_code(error):
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+class BrokerClient:
+    """Shared wrapper around ``tradeapi.REST`` that keeps outbound requests down.
+
+    - one keep-alive connection pool for every call;
+    - clock, account, open orders and positions are cached for a few seconds,
+      and the account/order/position caches are dropped whenever an order is sent;
+    - latest trades are fetched for the whole watchlist in one request;
+    - callers asking for the same uncached value at once share one request;
+    - every request takes a token from a rate limiter shared through
+      rate_limit_file by all processes on the host (per process if it is
+      None), and 429/5xx responses are retried with exponential backoff.
+    """
+
+    def __init__(self, api, symbols=None, rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST, pool_size=10,
+                 rate_limit_file=RATE_LIMIT_FILE):
+        self.api = api
+        self.symbols = list(symbols or STOCK_MAPPINGS.values())
+        if rate_limit_file and fcntl is not None:
+            self.bucket = SharedTokenBucket(rate_limit_file, rate, burst)
+        else:
+            self.bucket = TokenBucket(rate, burst)
+        self._cache = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        session = getattr(api, '_session', None)
+        if session is not None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # Retries are handled here with backoff instead of the SDK's fixed sleep
+            api._retry = 0
+
+    def _call(self, method, *args, retry_status_codes=RETRY_STATUS_CODES, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                with timing.span(f"broker.{method.__name__}"):
+                    return method(*args, **kwargs)
+            except (tradeapi.rest.APIError, requests.HTTPError) as e:
+                if _status_code(e) not in retry_status_codes or attempt == MAX_RETRIES:
+                    raise
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt * (1 + random.random()))
+
+    def _cached(self, key, ttl, fetch):
+        """Value for key, fetched at most once per ttl however many threads ask for it."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] < ttl:
+                return entry[1]
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = {'done': threading.Event()}
+
+        if not owner:
+            pending['done'].wait()
+            if 'error' in pending:
+                raise pending['error']
+            return pending['value']
+
+        try:
+            value = fetch()
+            pending['value'] = value
+            with self._lock:
+                self._cache[key] = (time.monotonic(), value)
+            return value
+        except Exception as e:
+            pending['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending['done'].set()
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def get_clock(self):
+        return self._cached('clock', CLOCK_TTL, lambda: self._call(self.api.get_clock))
+
+    def get_account(self):
+        return self._cached('account', ACCOUNT_TTL, lambda: self._call(self.api.get_account))
+
+    def list_open_orders(self):
+        return self._cached('orders', ORDERS_TTL, lambda: self._call(self.api.list_orders, status='open'))
+
+    def list_positions(self):
+        """Open positions keyed by symbol."""
+        return self._cached('positions', POSITIONS_TTL,
+                            lambda: {p.symbol: p for p in self._call(self.api.list_positions)})
+
+    def get_position(self, symbol):
+        """Open position for symbol, or None."""
+        return self.list_positions().get(symbol)
+
+    def latest_trades(self, symbols=None):
+        """Latest trade price per symbol, one request for the whole watchlist."""
+        symbols = list(symbols or self.symbols)
+        watchlist = sorted(set(self.symbols) | set(symbols))
+        trades = self._cached(('latest_trades', tuple(watchlist)), LATEST_TRADE_TTL,
+                              lambda: self._call(self.api.get_latest_trades, watchlist))
+        return {symbol: float(trades[symbol].price) for symbol in symbols if symbol in trades}
+
+    def latest_price(self, symbol):
+        return self.latest_trades([symbol])[symbol]
+
+    def submit_order(self, **kwargs):
+        try:
+            # Only a 429 guarantees the order was not accepted, so 5xx responses are not retried
+            return self._call(self.api.submit_order, retry_status_codes=(429,), **kwargs)
+        finally:
+            self.invalidate('account', 'orders', 'positions')
+
+    def get_order(self, order_id):
+        """Current state of one order; fills since the last call change the account, so its caches are dropped."""
+        order = self._call(self.api.get_order, order_id)
+        if float(order.filled_qty or 0):
+            self.invalidate('account', 'orders', 'positions')
+        return order
+
+    def close_all_positions(self, cancel_orders=False):
+        try:
+            return self._call(self.api.close_all_positions, cancel_orders=cancel_orders)
+        finally:
+            self.invalidate('account', 'orders', 'positions')
+
+
+def connect():
+    """BrokerClient for the Alpaca paper account in ALPACA_API_KEY / ALPACA_API_SECRET."""
+    load_dotenv()
+    return BrokerClient(tradeapi.REST(os.getenv('ALPACA_API_KEY'), os.getenv('ALPACA_API_SECRET'),
+                                      PAPER_URL, api_version='v2'))
@@ -0,0 +1,187 @@
+"""Versioned on-disk store of precomputed observation features, opened memory-mapped.
+
+Each entry holds exactly what TradingEnv reads, already scaled as float32
+observation rows plus float64 close and SMA_10 columns, for one symbol,
+timeframe and bar range. Entries are ``.npy`` files opened with
+``mmap_mode='r'``, so any number of training workers share one page-cache
+copy and a series larger than RAM is paged in on demand. Entries are also
+written chunk by chunk, so only one chunk of indicators is ever in memory.
+
+The entry directory name includes a hash of the source of indicators.py and
+of the observation layout and scaling, so any edit to either builds a new
+version instead of reading stale features.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import indicators
+from trading_env import OBSERVATION_LAYOUT, build_feature_matrix
+
+# Root directory of the feature store
+FEATURE_DIR = os.getenv('ITRADER_FEATURE_STORE', os.path.join('data', 'features'))
+
+# Bump when this module changes how the arrays are laid out; indicator and
+# observation changes are picked up from their source by config_version()
+FORMAT_VERSION = 2
+# Bars whose indicators are computed and written at a time
+CHUNK_BARS = int(os.getenv('ITRADER_FEATURE_CHUNK_BARS', '100000'))
+# Bars before each chunk that its indicators are computed from. Every rolling window fits in them,
+# and the recursive indicators (EMA/Wilder, longest span 26) forget anything older below float precision
+CHUNK_WARMUP_BARS = 1000
+
+ARRAYS = ('features', 'prices', 'sma_10', 'timestamps')
+
+
+@functools.lru_cache(maxsize=None)
+def config_version():
+    """Short hash of everything that determines the stored feature values.
+
+    Hashing the source rather than the parameters means even a comment edit
+    in indicators.py rebuilds the features, but no formula change can be
+    missed.
+    """
+    config = {
+        'format': FORMAT_VERSION,
+        'layout': OBSERVATION_LAYOUT,
+        'indicators': inspect.getsource(indicators),
+        'features': inspect.getsource(build_feature_matrix),
+    }
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class FeatureSet:
+    """The arrays TradingEnv and BatchTradingVecEnv read, in place of an indicator DataFrame.
+
+    Pickling a FeatureSet opened from the store, or a slice of one, pickles
+    only its directory and row range, so SubprocVecEnv workers re-open the
+    same memory-mapped files instead of receiving a copy of the data.
+    """
+
+    def __init__(self, features, prices, sma_10, timestamps, path=None, start=0):
+        self.features = features
+        self.prices = prices
+        self.sma_10 = sma_10
+        self.timestamps = timestamps
+        self.path = path
+        self.start = start  # First row of the stored files, when path is set
+
+    def __len__(self):
+        return len(self.prices)
+
+    @property
+    def index(self):
+        return pd.DatetimeIndex(pd.to_datetime(self.timestamps, unit='ns', utc=True), name='timestamp')
+
+    @classmethod
+    def from_frame(cls, data):
+        """In-memory FeatureSet from bars with indicators added and NaN rows dropped."""
+        return cls(build_feature_matrix(data),
+                   data['close'].to_numpy(dtype=np.float64),
+                   data['SMA_10'].to_numpy(dtype=np.float64),
+                   data.index.as_unit('ns').asi8 if isinstance(data.index, pd.DatetimeIndex)
+                   else np.arange(len(data), dtype=np.int64))
+
+    @classmethod
+    def open(cls, path, start=0, stop=None):
+        """Rows [start:stop] of the stored feature set at path, memory-mapped."""
+        # Files are sized for every input bar; meta.json has how many rows were filled
+        with open(os.path.join(path, 'meta.json')) as f:
+            bars = json.load(f)['bars']
+        stop = bars if stop is None else min(stop, bars)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')[start:stop] for name in ARRAYS}
+        return cls(path=path, start=start, **arrays)
+
+    def slice(self, start=None, stop=None):
+        """Bars [start:stop] as a FeatureSet of views into the same arrays."""
+        window = slice(start, stop)
+        first = window.indices(len(self))[0]
+        return FeatureSet(self.features[window], self.prices[window], self.sma_10[window], self.timestamps[window],
+                          self.path, self.start + first)
+
+    def __reduce__(self):
+        if self.path is None:
+            return super().__reduce__()
+        return FeatureSet.open, (self.path, self.start, self.start + len(self))
+
+
+def feature_chunks(bars, chunk_bars=CHUNK_BARS):
+    """FeatureSets of consecutive chunks of OHLCV bars, with the NaN warm-up rows dropped.
+
+    Each chunk's indicators are computed from CHUNK_WARMUP_BARS bars before
+    it, and OBV carries on from the previous chunk, so the chunks match the
+    indicators of the whole series.
+    """
+    obv = None
+    for start in range(0, len(bars), chunk_bars):
+        lead = min(start, CHUNK_WARMUP_BARS)
+        window = indicators.add_indicators(bars.iloc[start - lead:start + chunk_bars].copy())
+        if obv is not None:
+            window['OBV'] += obv - window['OBV'].iloc[lead - 1]
+        obv = window['OBV'].iloc[-1]
+        yield FeatureSet.from_frame(window.iloc[lead:].dropna())
+
+
+class FeatureStore:
+    """Feature sets per symbol/timeframe/bar range under ``root``, one directory per version."""
+
+    def __init__(self, root=FEATURE_DIR):
+        self.root = root
+
+    def path(self, symbol, timeframe, start, end):
+        key = f"{pd.Timestamp(start).strftime('%Y%m%d')}-{pd.Timestamp(end).strftime('%Y%m%d')}-{config_version()}"
+        return os.path.join(self.root, timeframe, symbol, key)
+
+    def open(self, symbol, timeframe, start, end):
+        """Memory-mapped FeatureSet, or None if this version has not been written yet."""
+        path = self.path(symbol, timeframe, start, end)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        return FeatureSet.open(path)
+
+    def write(self, symbol, timeframe, start, end, bars, chunk_bars=CHUNK_BARS):
+        """Compute and store the features of OHLCV ``bars`` chunk by chunk, and open them.
+
+        Each chunk goes straight into memory-mapped .npy files, so the
+        indicator columns and feature matrix of the whole series are never
+        in memory at once.
+        """
+        path = self.path(symbol, timeframe, start, end)
+        # Build in a temp directory and rename so readers never see a partial entry
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        n = len(bars)
+        shapes = {'features': (np.float32, (n, len(OBSERVATION_LAYOUT))), 'prices': (np.float64, (n,)),
+                  'sma_10': (np.float64, (n,)), 'timestamps': (np.int64, (n,))}
+        arrays = {name: np.lib.format.open_memmap(os.path.join(tmp_path, f"{name}.npy"), mode='w+',
+                                                  dtype=dtype, shape=shape)
+                  for name, (dtype, shape) in shapes.items()}
+        rows = 0
+        for chunk in feature_chunks(bars, chunk_bars):
+            for name, array in arrays.items():
+                array[rows:rows + len(chunk)] = getattr(chunk, name)
+            rows += len(chunk)
+        for array in arrays.values():
+            array.flush()
+        del arrays
+        meta = {
+            'symbol': symbol,
+            'timeframe': timeframe,
+            'start': str(start),
+            'end': str(end),
+            'bars': rows,
+            'config_version': config_version(),
+            'layout': [entry[0] if entry else None for entry in OBSERVATION_LAYOUT],
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return FeatureSet.open(path)
@@ -0,0 +1,333 @@
+"""Technical indicators used for the model's observations, in two modes.
+
+Batch mode (``add_indicators`` / ``compute_indicators``) computes every
+indicator over a whole history at once with vectorized pandas/NumPy. It
+reproduces the pandas_ta 0.3.14 definitions that train_model.py and
+Backtest_bot.py used before. The inputs may be Series (one symbol) or
+DataFrames with one column per price path.
+
+Streaming mode (``IndicatorStream``) keeps only the state each indicator
+needs. It updates all of them in constant time per new bar, so a live loop
+never recomputes the history. Both modes produce the same values.
+"""
+import math
+import sys
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+INDICATOR_COLUMNS = [
+    'RSI', 'MACD', 'MACD_hist', 'MACD_signal', 'SMA_10', 'SMA_20', 'SMA_50', 'STD_20',
+    'Upper_Band', 'Lower_Band', 'ATR', 'VWAP', 'Stochastic_K', 'Stochastic_D', 'CCI', 'OBV',
+]
+
+RSI_LENGTH = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+ATR_LENGTH = 14
+STOCH_K, STOCH_D, STOCH_SMOOTH_K = 14, 3, 3
+CCI_LENGTH, CCI_CONSTANT = 14, 0.015
+
+# pandas_ta's non_zero_range nudges flat high/low ranges by machine epsilon
+EPSILON = sys.float_info.epsilon
+
+
+# ---------------------------------------------------------------------------
+# Batch mode
+# ---------------------------------------------------------------------------
+
+def _rma(x, length):
+    """Wilder's moving average as pandas_ta computes it (adjusted EWM)."""
+    return x.ewm(alpha=1.0 / length, min_periods=length).mean()
+
+
+def _ema(x, length):
+    """EMA seeded with the SMA of the first ``length`` values."""
+    if len(x) < length:
+        return x * np.nan
+    x = x.copy()
+    x.iloc[length - 1] = x.iloc[0:length].mean()
+    x.iloc[:length - 1] = np.nan
+    return x.ewm(span=length, adjust=False).mean()
+
+
+def _from_first_valid(x):
+    valid = x.notna().to_numpy()
+    if valid.ndim == 2:
+        valid = valid.any(axis=1)
+    return x.iloc[int(np.argmax(valid)):]
+
+
+def _rolling_mean_mad(x, length):
+    """Rolling mean and mean absolute deviation around it, from the same window means."""
+    values = x.to_numpy(dtype=np.float64)
+    mean = np.full(values.shape, np.nan)
+    mad = np.full(values.shape, np.nan)
+    if len(values) >= length:
+        windows = np.lib.stride_tricks.sliding_window_view(values, length, axis=0)
+        mean[length - 1:] = windows.mean(axis=-1)
+        mad[length - 1:] = np.abs(windows - mean[length - 1:, ..., None]).mean(axis=-1)
+    wrap = lambda out: x._constructor(out, index=x.index, **({'columns': x.columns} if x.ndim == 2 else {}))
+    return wrap(mean), wrap(mad)
+
+
+def compute_indicators(open, high, low, close, volume):
+    """Every indicator in INDICATOR_COLUMNS for aligned OHLCV Series or DataFrames."""
+    out = {}
+
+    delta = close.diff(1)
+    rsi_up = _rma(delta.clip(lower=0), RSI_LENGTH)
+    rsi_down = _rma(delta.clip(upper=0), RSI_LENGTH).abs()
+    out['RSI'] = 100 * rsi_up / (rsi_up + rsi_down)
+
+    macd = _ema(close, MACD_FAST) - _ema(close, MACD_SLOW)
+    signal = _ema(_from_first_valid(macd), MACD_SIGNAL).reindex(macd.index)
+    out['MACD'] = macd
+    out['MACD_hist'] = macd - signal
+    out['MACD_signal'] = signal
+
+    out['SMA_10'] = close.rolling(window=10).mean()
+    out['SMA_20'] = close.rolling(window=20).mean()
+    out['SMA_50'] = close.rolling(window=50).mean()
+    out['STD_20'] = close.rolling(window=20).std()
+    out['Upper_Band'] = out['SMA_20'] + (2 * out['STD_20'])
+    out['Lower_Band'] = out['SMA_20'] - (2 * out['STD_20'])
+
+    previous_close = close.shift(1)
+    true_range = np.maximum(high - low, np.maximum((high - previous_close).abs(), (low - previous_close).abs()))
+    true_range.iloc[:1] = np.nan
+    out['ATR'] = _rma(true_range, ATR_LENGTH)
+
+    typical_price = (high + low + close) / 3
+    day = close.index.normalize() if isinstance(close.index, pd.DatetimeIndex) else np.zeros(len(close))
+    out['VWAP'] = (typical_price * volume).groupby(day).cumsum() / volume.groupby(day).cumsum()
+
+    lowest_low = low.rolling(STOCH_K).min()
+    highest_high = high.rolling(STOCH_K).max()
+    price_range = highest_high - lowest_low
+    stoch = 100 * (close - lowest_low) / price_range.where(price_range != 0, EPSILON)
+    stoch_k = _from_first_valid(stoch).rolling(STOCH_SMOOTH_K).mean()
+    stoch_d = _from_first_valid(stoch_k).rolling(STOCH_D).mean()
+    out['Stochastic_K'] = stoch_k.reindex(close.index)
+    out['Stochastic_D'] = stoch_d.reindex(close.index)
+
+    # Numerator and deviation share one window mean, as in IndicatorStream: in a flat
+    # window both are round-off, and the two modes must divide the same round-off
+    cci_mean, cci_mad = _rolling_mean_mad(typical_price, CCI_LENGTH)
+    out['CCI'] = (typical_price - cci_mean) / (CCI_CONSTANT * cci_mad)
+
+    direction = np.sign(delta)
+    direction.iloc[0] = 1
+    out['OBV'] = (direction * volume).cumsum()
+    return out
+
+
+def add_indicators(data):
+    """Add every indicator column to an OHLCV frame in place and return it.
+
+    Warm-up rows are left as NaN; callers drop them as before.
+    """
+    columns = compute_indicators(data['open'], data['high'], data['low'], data['close'], data['volume'])
+    for name in INDICATOR_COLUMNS:
+        data[name] = columns[name]
+    return data
+
+
+# ---------------------------------------------------------------------------
+# Streaming mode
+# ---------------------------------------------------------------------------
+
+def _divide(a, b):
+    # IEEE division like the vectorized path: x/0 -> +-inf, 0/0 -> nan
+    if b == 0:
+        return math.nan if a == 0 or math.isnan(a) else math.copysign(math.inf, a)
+    return a / b
+
+
+class _Wilder:
+    """Adjusted EWM with alpha=1/length and min_periods=length, updated in O(1)."""
+
+    def __init__(self, length):
+        self.decay = 1.0 - 1.0 / length
+        self.length = length
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.count = 0
+
+    def update(self, x):
+        self.numerator = x + self.decay * self.numerator
+        self.denominator = 1.0 + self.decay * self.denominator
+        self.count += 1
+        return self.numerator / self.denominator if self.count >= self.length else math.nan
+
+
+class _SeededEMA:
+    """EMA whose first value is the SMA of the first ``length`` inputs."""
+
+    def __init__(self, length):
+        self.alpha = 2.0 / (length + 1)
+        self.length = length
+        self.seed = []
+        self.value = math.nan
+
+    def update(self, x):
+        if self.seed is not None:
+            self.seed.append(x)
+            if len(self.seed) < self.length:
+                return math.nan
+            self.value = float(np.mean(self.seed))
+            self.seed = None
+            return self.value
+        self.value = (1.0 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class _RollingStats:
+    """Fixed-window mean and sample variance via a sliding Welford update."""
+
+    def __init__(self, length):
+        self.length = length
+        self.window = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        self.window.append(x)
+        if len(self.window) <= self.length:
+            delta = x - self.mean
+            self.mean += delta / len(self.window)
+            self.m2 += delta * (x - self.mean)
+        else:
+            old = self.window.popleft()
+            old_mean = self.mean
+            self.mean += (x - old) / self.length
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+        if len(self.window) < self.length:
+            return math.nan, math.nan
+        return self.mean, math.sqrt(max(self.m2, 0.0) / (self.length - 1))
+
+
+class _RollingExtreme:
+    """Rolling min (or max) with a monotonic deque, amortized O(1)."""
+
+    def __init__(self, length, maximum=False):
+        self.length = length
+        self.maximum = maximum
+        self.items = deque()
+        self.count = 0
+
+    def update(self, x):
+        index = self.count
+        self.count += 1
+        while self.items and (self.items[-1][1] <= x if self.maximum else self.items[-1][1] >= x):
+            self.items.pop()
+        self.items.append((index, x))
+        if self.items[0][0] <= index - self.length:
+            self.items.popleft()
+        return self.items[0][1] if self.count >= self.length else math.nan
+
+
+class _RollingMean:
+    """Rolling mean that, like pandas_ta, starts at the first non-NaN input."""
+
+    def __init__(self, length):
+        self.stats = _RollingStats(length)
+
+    def update(self, x):
+        if math.isnan(x):
+            return math.nan
+        return self.stats.update(x)[0]
+
+
+class IndicatorStream:
+    """Stateful version of ``compute_indicators`` for one symbol, one bar at a time."""
+
+    def __init__(self):
+        self.previous_close = None
+        self.rsi_up = _Wilder(RSI_LENGTH)
+        self.rsi_down = _Wilder(RSI_LENGTH)
+        self.ema_fast = _SeededEMA(MACD_FAST)
+        self.ema_slow = _SeededEMA(MACD_SLOW)
+        self.macd_signal = _SeededEMA(MACD_SIGNAL)
+        self.sma_10 = _RollingStats(10)
+        self.sma_20 = _RollingStats(20)
+        self.sma_50 = _RollingStats(50)
+        self.atr = _Wilder(ATR_LENGTH)
+        self.vwap_day = None
+        self.vwap_price_volume = 0.0
+        self.vwap_volume = 0.0
+        self.lowest_low = _RollingExtreme(STOCH_K)
+        self.highest_high = _RollingExtreme(STOCH_K, maximum=True)
+        self.stoch_k = _RollingMean(STOCH_SMOOTH_K)
+        self.stoch_d = _RollingMean(STOCH_D)
+        self.typical_prices = deque(maxlen=CCI_LENGTH)
+        self.obv = 0.0
+        self.values = dict.fromkeys(INDICATOR_COLUMNS, math.nan)
+
+    def update(self, open, high, low, close, volume, timestamp=None):
+        """Feed one bar and return the indicator values as of that bar."""
+        values = self.values
+        previous_close = self.previous_close
+        self.previous_close = close
+
+        if previous_close is None:
+            rsi_up = rsi_down = math.nan
+            true_range = math.nan
+            direction = 1.0
+        else:
+            delta = close - previous_close
+            rsi_up = self.rsi_up.update(max(delta, 0.0))
+            rsi_down = abs(self.rsi_down.update(min(delta, 0.0)))
+            true_range = max(high - low, abs(high - previous_close), abs(low - previous_close))
+            direction = float(np.sign(delta))
+        values['RSI'] = _divide(100 * rsi_up, rsi_up + rsi_down)
+        values['ATR'] = self.atr.update(true_range) if previous_close is not None else math.nan
+
+        fast = self.ema_fast.update(close)
+        slow = self.ema_slow.update(close)
+        macd = fast - slow
+        signal = self.macd_signal.update(macd) if not math.isnan(macd) else math.nan
+        values['MACD'] = macd
+        values['MACD_signal'] = signal
+        values['MACD_hist'] = macd - signal
+
+        values['SMA_10'] = self.sma_10.update(close)[0]
+        values['SMA_20'], values['STD_20'] = self.sma_20.update(close)
+        values['SMA_50'] = self.sma_50.update(close)[0]
+        values['Upper_Band'] = values['SMA_20'] + (2 * values['STD_20'])
+        values['Lower_Band'] = values['SMA_20'] - (2 * values['STD_20'])
+
+        typical_price = (high + low + close) / 3
+        day = timestamp.date() if timestamp is not None else None
+        if day != self.vwap_day:
+            self.vwap_day = day
+            self.vwap_price_volume = self.vwap_volume = 0.0
+        self.vwap_price_volume += typical_price * volume
+        self.vwap_volume += volume
+        values['VWAP'] = _divide(self.vwap_price_volume, self.vwap_volume)
+
+        lowest_low = self.lowest_low.update(low)
+        highest_high = self.highest_high.update(high)
+        price_range = highest_high - lowest_low
+        stoch = _divide(100 * (close - lowest_low), price_range if price_range != 0 else EPSILON)
+        values['Stochastic_K'] = self.stoch_k.update(stoch)
+        values['Stochastic_D'] = self.stoch_d.update(values['Stochastic_K'])
+
+        self.typical_prices.append(typical_price)
+        if len(self.typical_prices) == CCI_LENGTH:
+            window = np.fromiter(self.typical_prices, dtype=np.float64, count=CCI_LENGTH)
+            mean = window.mean()
+            values['CCI'] = _divide(typical_price - mean, CCI_CONSTANT * np.abs(window - mean).mean())
+        else:
+            values['CCI'] = math.nan
+
+        self.obv += direction * volume
+        values['OBV'] = self.obv
+        return dict(values)
+
+    def warm_up(self, data):
+        """Replay an OHLCV frame through the stream and return the values for its last bar."""
+        values = dict(self.values)
+        for row in data[['open', 'high', 'low', 'close', 'volume']].itertuples():
+            values = self.update(row.open, row.high, row.low, row.close, row.volume, row.Index)
+        return values
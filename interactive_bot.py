@@ -2,21 +2,20 @@ import os
 import pandas as pd
 import time
 from datetime import datetime
-from dotenv import load_dotenv
-import alpaca_trade_api as tradeapi
-import pandas_ta as ta
 import logging
 import warnings
 
 from trading_env import TradingEnv
-from stable_baselines3 import PPO
-from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+from broker_client import connect
+from policy_export import load_exported_policy
+from live_engine import ALLOCATION_PER_SYMBOL
+from performance import PERFORMANCE_FILE, SharedTrackerWriter
+import timing
+from bot_logging import SAMPLED, log_path, setup_logging
 import sys
 
 warnings.filterwarnings("ignore", category=UserWarning, module="stable_baselines3")
 
-logging.basicConfig(filename='trading_bot.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-
 # Stock mapping: full name to symbol
 stock_mapping = {
     "Apple": "AAPL",
@@ -38,14 +37,14 @@ def place_trade(api, stock_name, side):
         clock = api.get_clock()
         if not clock.is_open:
             print("Market is closed. Waiting for the next open session.")
-            logging.info("Market is closed. Skipping trade.")
+            logging.info("Market is closed. Skipping trade.", extra=SAMPLED)
             time.sleep(60)
             return
 
-        open_orders = api.list_orders(status='open')
+        open_orders = api.list_open_orders()
         if open_orders:
             print("There are pending orders. Skipping trade.")
-            logging.info("Skipping trade due to pending orders.")
+            logging.info("Skipping trade due to pending orders.", extra=SAMPLED)
             return
 
         print(f"Fetching account info for {stock_name} ({symbol})...")
@@ -54,22 +53,28 @@ def place_trade(api, stock_name, side):
         print(f"Cash Available: {cash_available}")
 
         print(f"Fetching last trade price for {stock_name} ({symbol})...")
-        last_trade = api.get_latest_trade(symbol)
-        stock_price = float(last_trade.price)
+        stock_price = api.latest_price(symbol)
         print(f"Stock price: {stock_price}")
 
         risk_percentage = 0.05
         qty = int((cash_available * risk_percentage) / stock_price)
+        if side == 'buy':
+            # The account's cash is shared by every bot; this one only spends its symbol's allocation
+            position = api.get_position(symbol)
+            invested = int(position.qty) * float(position.avg_entry_price) if position else 0.0
+            qty = min(qty, max(int((ALLOCATION_PER_SYMBOL - invested) / stock_price), 0))
 
         print(f"Placing {side} order for {qty} shares of {stock_name} ({symbol})...")
 
         if qty > 0:
             order = api.submit_order(symbol=symbol, qty=qty, side=side, type='market', time_in_force='day')
-            logging.info(f"Trade placed: {side.upper()} {qty} shares of {stock_name} ({symbol})")
-            print(f"Trade successful: {order}")
+            # Only the order's id and status; the full Order repr is several hundred characters
+            logging.info(f"Trade placed: {side.upper()} {qty} shares of {stock_name} ({symbol})",
+                         extra={'order_id': order.id, 'order_status': order.status})
+            print(f"Trade successful: order {order.id} ({order.status})")
         else:
             print(f"Not enough funds to buy {stock_name}.")
-            logging.info(f"Not enough funds to buy {stock_name}.")
+            logging.info(f"Not enough funds to buy {stock_name}.", extra=SAMPLED)
     except Exception as e:
         logging.error(f"Failed to place order for {stock_name} ({symbol}): {e}")
         print(f"Error placing order: {e}")
@@ -83,7 +88,10 @@ def analyze_trade(api, stock_name):
     
     try:
         position = api.get_position(symbol)
-        current_price = float(api.get_last_trade(symbol).price)
+        if position is None:
+            logging.info(f"No active position for {stock_name} ({symbol})", extra=SAMPLED)
+            return
+        current_price = api.latest_price(symbol)
         avg_entry_price = float(position.avg_entry_price)
         qty = int(position.qty)
         profit_loss = (current_price - avg_entry_price) * qty
@@ -91,6 +99,22 @@ def analyze_trade(api, stock_name):
     except Exception as e:
         logging.error(f"No active position for {stock_name} ({symbol}) or error fetching position: {e}")
 
+def record_performance(api, stock_name, now, performance):
+    """Queue this bot's position and latest price at now for the portfolio state read by /performance.
+
+    performance is a SharedTrackerWriter; it writes the one file every bot
+    process shares, at most every few minutes.
+    """
+    symbol = stock_mapping.get(stock_name)
+    try:
+        price = api.latest_price(symbol)
+        position = api.get_position(symbol)
+        qty, avg_entry_price = (int(position.qty), float(position.avg_entry_price)) if position else (0, 0.0)
+        performance.record(symbol, ALLOCATION_PER_SYMBOL, qty, avg_entry_price, price, now)
+        performance.flush()
+    except Exception as e:
+        logging.error(f"Failed to record performance for {stock_name} ({symbol}): {e}")
+
 def force_exit(api):
     try:
         print("exiting all positions...")
@@ -98,32 +122,49 @@ def force_exit(api):
     except Exception as e:
         print(f"Error exiting positions : {e}")
 
-def main(stock_name):
-    load_dotenv()
-    api = tradeapi.REST(os.getenv('ALPACA_API_KEY'), os.getenv('ALPACA_API_SECRET'), 'https://paper-api.alpaca.markets', api_version='v2')
-    stock_name = " "
+def main(stock_name, performance_path=PERFORMANCE_FILE, metrics_dir=timing.METRICS_DIR):
+    # Cached, rate-limited client: clock/account/orders/prices are not re-fetched on every loop
+    api = connect()
     
     print("Loading model...")
+    with timing.span('model_load'):
+        model = load_exported_policy(stock_name)
     model_path = f"models/trading_bot_ppo_{stock_name}.zip"
     env_path = f"models/trading_env_normalize_{stock_name}.pkl"
+
+    if model is not None:
+        # Exported NumPy policy (python policy_export.py): no torch / stable_baselines3 import needed
+        print("Model loaded.")
+    else:
+        if not os.path.exists(model_path):
+            print(f"Model file not found: {model_path}")
+            return
+        if not os.path.exists(env_path):
+            print(f"Environment file not found: {env_path}")
+            return
+
+        from stable_baselines3 import PPO
+        from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+        with timing.span('model_load'):
+            model = PPO.load(model_path)
+            env_norm = VecNormalize.load(env_path, DummyVecEnv([lambda: TradingEnv(pd.DataFrame())]))
+        print("Model loaded.")
     
-    if not os.path.exists(model_path):
-        print(f"Model file not found: {model_path}")
-        return
-    if not os.path.exists(env_path):
-        print(f"Environment file not found: {env_path}")
-        return
-    
-    model = PPO.load(model_path)
-    print("Model loaded.")
-    env_norm = VecNormalize.load(env_path, DummyVecEnv([lambda: TradingEnv(pd.DataFrame())]))
-    
+    performance = SharedTrackerWriter(performance_path)
     print("Entering while loop...")
-    while True:
-        logging.debug("Checking conditions and placing trades...")
-        place_trade(api, stock_name, 'buy')
-        analyze_trade(api, stock_name)
-        time.sleep(60)
+    try:
+        while True:
+            logging.debug("Checking conditions and placing trades...")
+            now = pd.Timestamp(time.time(), unit='s', tz='UTC')
+            with timing.span('trade_cycle'):
+                place_trade(api, stock_name, 'buy')
+                analyze_trade(api, stock_name)
+                record_performance(api, stock_name, now, performance)
+            # Broker call latencies (see broker_client.py) for the API's /metrics
+            timing.save('interactive_bot', metrics_dir, min_interval=timing.SAVE_INTERVAL)
+            time.sleep(60)
+    finally:
+        performance.flush(force=True)
 
 
 if __name__ == "__main__":
@@ -133,13 +174,11 @@ if __name__ == "__main__":
     
     # New Condition to address force_exit
     if sys.argv[1] == "force_exit":
-        load_dotenv()
-        api = tradeapi.REST(os.getenv('ALPACA_API_KEY'), 
-                          os.getenv('ALPACA_API_SECRET'), 
-                          'https://paper-api.alpaca.markets',
-                          api_version='v2')
-        force_exit(api)
+        force_exit(connect())
         print("Force exit completed")
     else:
+        # Log records are queued and written by a background thread, never on the trading path
         stock_name = sys.argv[1]
+        # One file per bot: /trade runs a bot process per stock
+        setup_logging(log_path(f"interactive_bot_{stock_name}"))
         main(stock_name)
@@ -0,0 +1,536 @@
+"""Event-driven live trading for every symbol in STOCK_MAPPINGS from one asyncio process.
+
+The feed delivers 1-minute bars. Each symbol's worker task aggregates them
+into bars of the timeframe the models were trained on (1H). Each completed
+bar updates that symbol's streaming indicators, runs its exported NumPy
+policy and submits any resulting order. The indicators are warmed up at
+start-up from the cached history of model bars, so the first live bar
+already has valid features. Symbols have their own worker task, so a slow
+order for one symbol never delays another. Decision latency is measured
+from the arrival of the feed bar that completes a model bar to order
+submission.
+
+Orders are settled in the background. The book takes the filled quantity
+and average price that the broker reports for each order, and is checked
+against the broker's positions after every fill.
+
+Usage: python live_engine.py [--simulate] [--stocks Apple Tesla]
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from bot_logging import log_path, setup_logging
+from broker_client import BrokerClient
+from constants import STOCK_MAPPINGS
+from indicators import IndicatorStream
+from performance import PERFORMANCE_FILE, PerformanceTracker, cadence
+from policy_export import load_exported_policy, policy_export_path
+from trading_env import BALANCE_IDX, OBSERVATION_LAYOUT, SHARES_IDX
+
+# Cash each symbol trades with, as in TradingEnv's initial_balance
+ALLOCATION_PER_SYMBOL = float(os.getenv('ITRADER_ALLOCATION_PER_SYMBOL', '10000'))
+TRANSACTION_FEE = 0.001
+# Seconds between writes of the performance state read by /performance
+PERFORMANCE_SAVE_INTERVAL = 5.0
+# Bar size the models were trained on (train_model.TIMEFRAME) and the feed's bar size
+MODEL_TIMEFRAME = pd.Timedelta(hours=1)
+FEED_INTERVAL = pd.Timedelta(minutes=1)
+# Days of model bars replayed into each symbol's indicators at start-up
+WARMUP_DAYS = 30
+# A model bar whose last minute bar never arrives (no trades) is closed this long after its end
+BAR_CLOSE_GRACE = pd.Timedelta(seconds=90)
+# Seconds between order status checks while an order is open
+ORDER_POLL_SECONDS = 1.0
+# Order states after which nothing more will fill
+FINAL_ORDER_STATES = {'filled', 'canceled', 'expired', 'rejected', 'done_for_day', 'replaced'}
+
+# received_at is time.perf_counter() when the bar reached this process
+Bar = namedtuple('Bar', 'symbol timestamp open high low close volume received_at')
+
+
+class BarAggregator:
+    """Builds model-timeframe bars from feed bars (e.g. 1H bars from 1-minute bars).
+
+    Bars are labelled with the start of their period, like Alpaca's. A
+    period is closed when its last feed bar arrives, when a bar of a later
+    period shows that it has ended, or by close_due() once BAR_CLOSE_GRACE has
+    passed after its end. Feed bars of periods up to ``after`` (the last bar
+    of the warm-up history) are ignored.
+    """
+
+    def __init__(self, symbol, timeframe=MODEL_TIMEFRAME, feed_interval=FEED_INTERVAL, after=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.feed_interval = feed_interval
+        self.after = after
+        self.start = None
+        self.open = self.high = self.low = self.close = self.volume = None
+
+    def update(self, bar):
+        """Add one feed bar; returns the model bars it completed (usually none or one)."""
+        timestamp = pd.Timestamp(bar.timestamp)
+        start = timestamp.floor(self.timeframe)
+        completed = []
+        if self.start is not None and start != self.start:
+            completed.append(self._close(bar.received_at))
+        if self.after is not None and start <= self.after:
+            return completed
+
+        if self.start is None:
+            self.start = start
+            self.open, self.high, self.low, self.close, self.volume = bar.open, bar.high, bar.low, bar.close, bar.volume
+        else:
+            self.high = max(self.high, bar.high)
+            self.low = min(self.low, bar.low)
+            self.close = bar.close
+            self.volume += bar.volume
+        if timestamp + self.feed_interval >= start + self.timeframe:
+            completed.append(self._close(bar.received_at))
+        return completed
+
+    def close_due(self, now, received_at):
+        """The open period as a bar if BAR_CLOSE_GRACE has passed since its end, else None."""
+        if self.start is not None and now >= self.start + self.timeframe + BAR_CLOSE_GRACE:
+            return self._close(received_at)
+        return None
+
+    def _close(self, received_at):
+        bar = Bar(self.symbol, self.start, self.open, self.high, self.low, self.close, self.volume, received_at)
+        self.start = None
+        return bar
+
+
+class SymbolTrader:
+    """Bar aggregator, indicator stream, policy and position book of one symbol.
+
+    Orders follow TradingEnv's rules: buy with half the cash while the price
+    is below SMA_10, sell half the shares above SMA_10 or at 2% profit. No
+    new order is placed while one is still open.
+    """
+
+    def __init__(self, stock_name, symbol, policy, initial_balance=ALLOCATION_PER_SYMBOL,
+                 transaction_fee=TRANSACTION_FEE):
+        self.stock = stock_name
+        self.symbol = symbol
+        self.policy = policy
+        self.stream = IndicatorStream()
+        self.aggregator = BarAggregator(symbol)
+        self.open_orders = {}  # order id -> (side, model bar timestamp)
+        self.initial_balance = initial_balance
+        self.transaction_fee = transaction_fee
+        self.balance = initial_balance
+        self.shares_held = 0
+        self.net_worth = initial_balance
+        self._obs = np.zeros(len(OBSERVATION_LAYOUT), dtype=np.float32)
+
+    def warm_up(self, history):
+        """Replay model-timeframe OHLCV history into the indicators; later feed bars continue from it."""
+        if len(history):
+            self.stream.warm_up(history)
+            self.aggregator.after = pd.Timestamp(history.index[-1])
+
+    def observation(self, bar, values):
+        """TradingEnv observation for this bar, or None while indicators are warming up."""
+        obs = self._obs
+        for i, entry in enumerate(OBSERVATION_LAYOUT):
+            if entry is None:
+                continue
+            column, scale = entry
+            value = values[column] if column in values else getattr(bar, column)
+            if math.isnan(value):
+                return None
+            obs[i] = value / scale
+        obs[SHARES_IDX] = self.shares_held / 1000
+        obs[BALANCE_IDX] = self.balance / self.initial_balance
+        return obs
+
+    def decide(self, bar):
+        """Update indicators with a model bar and return (side, qty), or None to do nothing."""
+        values = self.stream.update(bar.open, bar.high, bar.low, bar.close, bar.volume, bar.timestamp)
+        self.net_worth = self.balance + self.shares_held * bar.close
+        obs = self.observation(bar, values)
+        if obs is None or self.open_orders:
+            return None
+
+        action, _ = self.policy.predict(obs)
+        price, sma_10 = bar.close, values['SMA_10']
+        if action == 1 and price < sma_10:
+            qty = int((self.balance * 0.5) // price)
+            if qty > 0 and qty * price * (1 + self.transaction_fee) <= self.balance:
+                return 'buy', qty
+        elif action == 2 and self.shares_held > 0:
+            if price > sma_10 or (self.net_worth / self.initial_balance - 1) >= 0.02:
+                return 'sell', max(int(self.shares_held * 0.5), 1)
+        return None
+
+    def fill(self, side, qty, price):
+        if side == 'buy':
+            self.balance -= qty * price * (1 + self.transaction_fee)
+            self.shares_held += qty
+        else:
+            self.balance += qty * price * (1 - self.transaction_fee)
+            self.shares_held -= qty
+        self.net_worth = self.balance + self.shares_held * price
+
+    def adopt_position(self, qty, price):
+        """Take the broker's share count as the truth, paying or receiving cash for the difference at price."""
+        self.balance -= (qty - self.shares_held) * price
+        self.shares_held = qty
+        self.net_worth = self.balance + self.shares_held * price
+
+
+def _log_write_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"Failed to save performance state: {future.exception()}")
+
+
+class LiveEngine:
+    """Routes feed bars to one worker task per symbol and submits their orders to the broker."""
+
+    def __init__(self, traders, broker, performance_path=None, order_poll_interval=ORDER_POLL_SECONDS,
+                 close_bars_on_clock=False):
+        self.traders = {trader.symbol: trader for trader in traders}
+        self.broker = broker
+        self.latencies = []  # Seconds from bar arrival to order submission
+        self.orders = []
+        # Marked once per model bar, so its Sharpe ratio is annualized from hourly returns
+        sharpe_window, periods_per_year = cadence(MODEL_TIMEFRAME.total_seconds())
+        self.performance = PerformanceTracker({trader.symbol: trader.initial_balance for trader in traders},
+                                              sharpe_window=sharpe_window, periods_per_year=periods_per_year)
+        self.performance_path = performance_path
+        self.order_poll_interval = order_poll_interval
+        # Live feeds close bars whose last minute never comes once the wall clock passes their end
+        self.close_bars_on_clock = close_bars_on_clock
+        self._performance_saved = time.monotonic()
+        self._performance_write = None
+        self._queues = {}
+        self._settlements = set()
+
+    def _save_performance(self):
+        """Every PERFORMANCE_SAVE_INTERVAL, snapshot the performance state and write it from a thread."""
+        if not self.performance_path or time.monotonic() - self._performance_saved < PERFORMANCE_SAVE_INTERVAL:
+            return
+        if self._performance_write is not None and not self._performance_write.done():
+            return  # The previous write is still running; the next bar tries again
+        self._performance_saved = time.monotonic()
+        state = self.performance.snapshot()
+        self._performance_write = asyncio.get_running_loop().run_in_executor(
+            None, self.performance.save, self.performance_path, state)
+        self._performance_write.add_done_callback(_log_write_error)
+
+    async def sync_positions(self):
+        """Start every book from the broker's open positions, charged at their average entry price."""
+        positions = await self.broker.positions()
+        for symbol, trader in self.traders.items():
+            qty, price = positions.get(symbol, (0, 0.0))
+            if qty != trader.shares_held:
+                trader.adopt_position(qty, price)
+                logging.info(f"{symbol}: starting from the broker's position of {qty} @ {price:.2f}")
+
+    async def _worker(self, trader, queue):
+        while True:
+            item = await queue.get()
+            try:
+                if isinstance(item, Bar):
+                    bars = trader.aggregator.update(item)
+                else:  # Wall-clock tick: close the open bar if its last minute never came
+                    bar = trader.aggregator.close_due(item, time.perf_counter())
+                    bars = [bar] if bar is not None else []
+                for bar in bars:
+                    await self._on_model_bar(trader, bar)
+            except Exception as e:
+                logging.error(f"Failed to handle {trader.symbol} bar: {e}")
+            finally:
+                queue.task_done()
+
+    async def _on_model_bar(self, trader, bar):
+        decision = trader.decide(bar)
+        self.performance.on_mark(trader.symbol, bar.close, bar.timestamp)
+        self._save_performance()
+        if decision is None:
+            return
+        side, qty = decision
+        self.latencies.append(time.perf_counter() - bar.received_at)
+        order = await self.broker.submit_order(trader.symbol, qty, side)
+        self.orders.append(order)
+        trader.open_orders[order['id']] = (side, bar.timestamp)
+        logging.info(f"{side.upper()} {qty} {trader.symbol} submitted at bar {bar.timestamp}")
+        settlement = asyncio.create_task(self._settle(trader, order['id'], bar.close))
+        self._settlements.add(settlement)
+        settlement.add_done_callback(self._settlements.discard)
+
+    async def _settle(self, trader, order_id, last_price):
+        """Wait for an order to finish, book what actually filled, then check the broker's position."""
+        side, timestamp = trader.open_orders[order_id]
+        try:
+            while True:
+                order = await self.broker.get_order(order_id)
+                if order['status'] in FINAL_ORDER_STATES:
+                    break
+                await asyncio.sleep(self.order_poll_interval)
+            filled_qty = order['filled_qty']
+            if filled_qty:
+                price = order['filled_avg_price']
+                trader.fill(side, filled_qty, price)
+                self.performance.on_fill(trader.symbol, side, filled_qty, price, timestamp, trader.transaction_fee)
+                last_price = price
+                logging.info(f"{side.upper()} {filled_qty} {trader.symbol} @ {price:.2f} ({order['status']}); "
+                             f"net worth {trader.net_worth:.2f}")
+            else:
+                logging.warning(f"{side.upper()} order for {trader.symbol} ended {order['status']} without fills")
+
+            qty, _ = (await self.broker.positions()).get(trader.symbol, (0, 0.0))
+            if qty != trader.shares_held:
+                logging.warning(f"{trader.symbol}: book has {trader.shares_held} shares, broker {qty}; "
+                                f"taking the broker's position")
+                trader.adopt_position(qty, last_price)
+        except Exception as e:
+            logging.error(f"Failed to settle {trader.symbol} order {order_id}: {e}")
+        finally:
+            del trader.open_orders[order_id]
+
+    async def _tick(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            now = pd.Timestamp.now(tz='UTC')
+            for queue in self._queues.values():
+                queue.put_nowait(now)
+
+    async def run(self, feed):
+        """Consume the feed until it ends, then wait for every queued bar and open order to be handled."""
+        await self.sync_positions()
+        workers = []
+        for symbol, trader in self.traders.items():
+            self._queues[symbol] = asyncio.Queue()
+            workers.append(asyncio.create_task(self._worker(trader, self._queues[symbol])))
+        if self.close_bars_on_clock:
+            workers.append(asyncio.create_task(self._tick()))
+        try:
+            async for bar in feed:
+                queue = self._queues.get(bar.symbol)
+                if queue is not None:
+                    queue.put_nowait(bar)
+            await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+            await asyncio.gather(*self._settlements)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if self._performance_write is not None:
+                await asyncio.gather(self._performance_write, return_exceptions=True)
+            if self.performance_path:
+                self.performance.save(self.performance_path)
+
+    def latency_stats(self):
+        """Decision latency percentiles in microseconds."""
+        if not self.latencies:
+            return {'count': 0}
+        latencies = np.array(self.latencies) * 1e6
+        return {
+            'count': len(latencies),
+            'p50_us': float(np.percentile(latencies, 50)),
+            'p99_us': float(np.percentile(latencies, 99)),
+            'max_us': float(latencies.max()),
+        }
+
+
+class SimulatedBroker:
+    """In-memory broker filling market orders at the latest bar close."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.prices = {}
+        self.orders = {}
+        self.holdings = {}  # symbol -> (qty, average entry price)
+
+    def mark(self, symbol, price):
+        self.prices[symbol] = price
+
+    async def submit_order(self, symbol, qty, side):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        price = self.prices[symbol]
+        order = {'id': str(len(self.orders)), 'symbol': symbol, 'qty': qty, 'side': side,
+                 'status': 'filled', 'filled_qty': qty, 'filled_avg_price': price}
+        self.orders[order['id']] = order
+        self._book(symbol, qty if side == 'buy' else -qty, price)
+        return dict(order)
+
+    def _book(self, symbol, delta, price):
+        held, entry = self.holdings.get(symbol, (0, 0.0))
+        qty = held + delta
+        if qty == 0:
+            self.holdings.pop(symbol, None)
+        else:
+            self.holdings[symbol] = (qty, (held * entry + delta * price) / qty if delta > 0 else entry)
+
+    async def get_order(self, order_id):
+        return dict(self.orders[order_id])
+
+    async def positions(self):
+        return dict(self.holdings)
+
+
+class SimulatedFeed:
+    """Replays OHLCV frames ({symbol: DataFrame}) as one bar stream ordered by timestamp."""
+
+    def __init__(self, frames, broker=None, interval=0.0):
+        self.frames = frames
+        self.broker = broker
+        self.interval = interval
+
+    async def __aiter__(self):
+        columns = ['open', 'high', 'low', 'close', 'volume']
+        events = sorted(
+            (timestamp, symbol, row)
+            for symbol, frame in self.frames.items()
+            for timestamp, row in zip(frame.index, frame[columns].itertuples(index=False)))
+        last_timestamp = None
+        for timestamp, symbol, row in events:
+            if timestamp != last_timestamp:
+                # Let the workers run between bar times, as a real stream would
+                await asyncio.sleep(self.interval)
+                last_timestamp = timestamp
+            if self.broker is not None:
+                self.broker.mark(symbol, row.close)
+            yield Bar(symbol, timestamp, row.open, row.high, row.low, row.close, row.volume, time.perf_counter())
+
+
+class AlpacaBroker:
+    """Orders and positions through a rate-limited BrokerClient, run off the event loop."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def submit_order(self, symbol, qty, side):
+        order = await asyncio.to_thread(
+            self.client.submit_order, symbol=symbol, qty=qty, side=side, type='market', time_in_force='day')
+        return {'symbol': symbol, 'qty': qty, 'side': side, 'id': order.id}
+
+    async def get_order(self, order_id):
+        order = await asyncio.to_thread(self.client.get_order, order_id)
+        filled_avg_price = getattr(order, 'filled_avg_price', None)
+        return {'id': order.id, 'status': order.status, 'filled_qty': int(float(order.filled_qty or 0)),
+                'filled_avg_price': float(filled_avg_price) if filled_avg_price else None}
+
+    async def positions(self):
+        """{symbol: (qty, average entry price)} of the account's open positions."""
+        positions = await asyncio.to_thread(self.client.list_positions)
+        return {symbol: (int(float(p.qty)), float(p.avg_entry_price)) for symbol, p in positions.items()}
+
+
+class AlpacaFeed:
+    """Minute bars for the given symbols from Alpaca's market data stream.
+
+    The SDK's Stream runs its own event loop, so it is run in a thread and
+    hands bars over to this loop.
+    """
+
+    def __init__(self, symbols, key_id, secret_key, data_feed='iex'):
+        from alpaca_trade_api.stream import Stream
+
+        self.symbols = list(symbols)
+        self.stream = Stream(key_id, secret_key, data_feed=data_feed)
+        self._queue = asyncio.Queue()
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+
+        async def on_bar(bar):
+            timestamp = pd.Timestamp(bar.timestamp)
+            timestamp = timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+            loop.call_soon_threadsafe(self._queue.put_nowait, Bar(
+                bar.symbol, timestamp, bar.open, bar.high, bar.low, bar.close, bar.volume, time.perf_counter()))
+
+        self.stream.subscribe_bars(on_bar, *self.symbols)
+        runner = asyncio.create_task(asyncio.to_thread(self.stream.run))
+        try:
+            while True:
+                yield await self._queue.get()
+        finally:
+            self.stream.stop()
+            await asyncio.gather(runner, return_exceptions=True)
+
+
+def load_history(api, symbol, end=None):
+    """Completed model bars of the last WARMUP_DAYS, from the local bar cache."""
+    from bar_cache import BarCache
+
+    end = (end or pd.Timestamp.now(tz='UTC')).floor(MODEL_TIMEFRAME)
+    return BarCache(api).get_bars(symbol, '1H', start=end - pd.Timedelta(days=WARMUP_DAYS), end=end, feed='iex')
+
+
+def load_traders(stock_names):
+    traders = []
+    for stock_name in stock_names:
+        policy = load_exported_policy(stock_name)
+        if policy is None:
+            raise FileNotFoundError(f"{policy_export_path(stock_name)} missing or older than the trained model. "
+                                    f"Run python policy_export.py {stock_name} first.")
+        traders.append(SymbolTrader(stock_name, STOCK_MAPPINGS[stock_name], policy))
+    return traders
+
+
+async def simulate(traders, bars=200, broker_latency=0.0, performance_path=None):
+    """Warm up every trader on synthetic model bars, then run the engine on minute bars after them."""
+    from benchmarks.fixtures import synthetic_ohlcv
+
+    broker = SimulatedBroker(latency=broker_latency)
+    frames = {}
+    for i, trader in enumerate(traders):
+        history = synthetic_ohlcv(500, seed=i)
+        trader.warm_up(history)
+        minutes = synthetic_ohlcv(bars * 60, seed=100 + i, start=history.index[-1] + MODEL_TIMEFRAME, freq='min')
+        minutes[['open', 'high', 'low', 'close']] *= history['close'].iloc[-1] / minutes['open'].iloc[0]
+        frames[trader.symbol] = minutes
+    engine = LiveEngine(traders, broker, performance_path, order_poll_interval=0)
+    await engine.run(SimulatedFeed(frames, broker))
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stocks', nargs='+', choices=list(STOCK_MAPPINGS), default=list(STOCK_MAPPINGS))
+    parser.add_argument('--simulate', action='store_true', help="Replay synthetic bars into a simulated broker")
+    parser.add_argument('--bars', type=int, default=200, help="Model bars (60 minute bars each) per symbol with --simulate")
+    args = parser.parse_args()
+
+    # Log records are queued and written by a background thread, off the event loop
+    setup_logging(log_path('live_engine'))
+    traders = load_traders(args.stocks)
+
+    if args.simulate:
+        engine = asyncio.run(simulate(traders, args.bars, performance_path=PERFORMANCE_FILE))
+    else:
+        import alpaca_trade_api as tradeapi
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        key_id, secret_key = os.getenv('ALPACA_API_KEY'), os.getenv('ALPACA_API_SECRET')
+        api = tradeapi.REST(key_id, secret_key, 'https://paper-api.alpaca.markets', api_version='v2')
+        for trader in traders:
+            trader.warm_up(load_history(api, trader.symbol))
+        engine = LiveEngine(traders, AlpacaBroker(BrokerClient(api)), performance_path=PERFORMANCE_FILE,
+                            close_bars_on_clock=True)
+        feed = AlpacaFeed([trader.symbol for trader in traders], key_id, secret_key)
+        try:
+            asyncio.run(engine.run(feed))
+        except KeyboardInterrupt:
+            pass
+
+    for trader in traders:
+        print(f"{trader.stock:<10} net worth {trader.net_worth:10.2f}  shares {trader.shares_held}")
+    print(f"{len(engine.orders)} orders, decision latency {engine.latency_stats()}")
+    print(f"Portfolio: {engine.performance.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""Incremental portfolio performance from the live engine's fills and mark-to-market prices.
+
+Every event updates per-symbol and total equity in O(1): the equity series
+goes into fixed-size ring buffers, and return, max drawdown, rolling Sharpe
+and win rate are kept as running values. All-time summaries therefore cost
+the same however long the bot has run. A time-window summary only reads the
+ring buffer slice inside that window.
+
+live_engine.py feeds one tracker from its fills. The separate
+interactive_bot processes started by /trade share one saved tracker through
+shared_tracker() and book the position changes they see. Each tracker
+annualizes its Sharpe ratio for its feeder's mark interval (see cadence()),
+so hourly and per-minute trackers report comparable ratios.
+"""
+import contextlib
+import copy
+import math
+import os
+import pickle
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, concurrent bots may overwrite each other's updates
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+# Equity points / closed trades kept per series for windowed queries
+HISTORY_CAPACITY = 20000
+# Regular-session seconds per trading day and trading days per year, to annualize per-mark returns
+SESSION_SECONDS = 6.5 * 3600
+TRADING_DAYS_PER_YEAR = 252
+# Trading days of returns in the rolling Sharpe ratio, whatever the feeder's mark interval
+SHARPE_WINDOW_DAYS = 5
+# Seconds between marks assumed when a feeder does not give its own (interactive_bot marks every ~60s)
+MARK_INTERVAL = 60
+
+
+def cadence(mark_interval):
+    """(sharpe_window, periods_per_year) of a feeder marking every mark_interval seconds.
+
+    Sharpe ratios annualized with these are comparable between feeders of
+    different cadences, e.g. live_engine's 1H bars and interactive_bot's minutes.
+    """
+    marks_per_day = SESSION_SECONDS / mark_interval
+    return max(round(SHARPE_WINDOW_DAYS * marks_per_day), 2), TRADING_DAYS_PER_YEAR * marks_per_day
+
+
+SHARPE_WINDOW, PERIODS_PER_YEAR = cadence(MARK_INTERVAL)
+
+PERFORMANCE_FILE = os.getenv('ITRADER_PERFORMANCE_FILE', 'performance_state.pkl')
+# Real seconds between a bot process's locked updates of the shared performance file
+SHARED_SAVE_INTERVAL = float(os.getenv('ITRADER_PERFORMANCE_SAVE_SECONDS', '300'))
+TOTAL = 'total'
+
+
+def _seconds(timestamp):
+    return pd.Timestamp(timestamp).timestamp()
+
+
+class RingBuffer:
+    """The last ``capacity`` (time, value) pairs, appended in time order."""
+
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.values))
+
+    def append(self, time, value):
+        i = self.count % len(self.values)
+        self.times[i] = time
+        self.values[i] = value
+        self.count += 1
+
+    def since(self, start=None):
+        """(times, values) in time order, only those at or after start."""
+        capacity = len(self.values)
+        if self.count <= capacity:
+            times, values = self.times[:self.count], self.values[:self.count]
+        else:
+            head = self.count % capacity
+            times = np.concatenate([self.times[head:], self.times[:head]])
+            values = np.concatenate([self.values[head:], self.values[:head]])
+        if start is not None:
+            first = int(np.searchsorted(times, start))
+            times, values = times[first:], values[first:]
+        return times, values
+
+
+class RollingMoments:
+    """Mean and standard deviation of the last ``window`` values, updated in O(1)."""
+
+    def __init__(self, window=SHARPE_WINDOW):
+        self.values = np.zeros(window)
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+
+    def update(self, value):
+        i = self.count % len(self.values)
+        if self.count >= len(self.values):
+            old = self.values[i]
+            self.total -= old
+            self.total_squares -= old * old
+        self.values[i] = value
+        self.total += value
+        self.total_squares += value * value
+        self.count += 1
+
+    def mean_std(self):
+        n = min(self.count, len(self.values))
+        if n < 2:
+            return math.nan, math.nan
+        mean = self.total / n
+        variance = max(self.total_squares / n - mean * mean, 0.0) * n / (n - 1)
+        return mean, math.sqrt(variance)
+
+
+def sharpe_ratio(mean, std, periods_per_year=PERIODS_PER_YEAR):
+    if not std or math.isnan(std):
+        return None
+    return float(mean / std * math.sqrt(periods_per_year))
+
+
+class EquitySeries:
+    """Running performance of one equity curve (a symbol or the whole portfolio)."""
+
+    def __init__(self, initial_equity, capacity=HISTORY_CAPACITY, sharpe_window=SHARPE_WINDOW):
+        self.initial_equity = initial_equity
+        self.equity = initial_equity
+        self.peak = initial_equity
+        self.max_drawdown = 0.0
+        self.returns = RollingMoments(sharpe_window)
+        self.history = RingBuffer(capacity)
+        self.trades = RingBuffer(capacity)  # realized P/L of each closing fill
+        self.closed_trades = 0
+        self.winning_trades = 0
+        self.updated = None
+
+    def mark(self, time, equity):
+        if self.equity:
+            self.returns.update(equity / self.equity - 1)
+        self.equity = equity
+        self.peak = max(self.peak, equity)
+        if self.peak > 0:
+            self.max_drawdown = max(self.max_drawdown, 1 - equity / self.peak)
+        self.history.append(time, equity)
+        self.updated = time
+
+    def close_trade(self, time, pnl):
+        self.closed_trades += 1
+        self.winning_trades += pnl > 0
+        self.trades.append(time, pnl)
+
+    def summary(self, window=None, periods_per_year=PERIODS_PER_YEAR):
+        """Metrics over the whole run, or over the last ``window`` seconds of history."""
+        if window is None or self.updated is None:
+            start_equity, end_equity = self.initial_equity, self.equity
+            max_drawdown = self.max_drawdown
+            mean, std = self.returns.mean_std()
+            closed, wins = self.closed_trades, self.winning_trades
+        else:
+            start = self.updated - window
+            _, equity = self.history.since(start)
+            _, pnl = self.trades.since(start)
+            start_equity, end_equity = (equity[0], equity[-1]) if len(equity) else (self.equity, self.equity)
+            max_drawdown = float(np.max(1 - equity / np.maximum.accumulate(equity))) if len(equity) else 0.0
+            returns = equity[1:] / equity[:-1] - 1
+            mean, std = (returns.mean(), returns.std(ddof=1)) if len(returns) > 1 else (math.nan, math.nan)
+            closed, wins = len(pnl), int(np.sum(pnl > 0))
+
+        profit_loss = end_equity - start_equity
+        return {
+            "net_worth": end_equity,
+            "profit_loss": profit_loss,
+            "return_percentage": profit_loss / start_equity * 100 if start_equity else 0.0,
+            "max_drawdown_percentage": max_drawdown * 100,
+            "sharpe_ratio": sharpe_ratio(mean, std, periods_per_year),
+            "win_rate": wins / closed if closed else None,
+            "closed_trades": closed,
+            "as_of": pd.Timestamp(self.updated, unit='s', tz='UTC').isoformat() if self.updated else None,
+        }
+
+
+class PerformanceTracker:
+    """Per-symbol books and equity series, plus the portfolio total, fed by the trading engine."""
+
+    def __init__(self, initial_balances, capacity=HISTORY_CAPACITY, sharpe_window=SHARPE_WINDOW,
+                 periods_per_year=PERIODS_PER_YEAR):
+        self.periods_per_year = periods_per_year
+        # symbol -> [cash, shares, average cost per share, last price]
+        self.books = {symbol: [float(balance), 0, 0.0, 0.0] for symbol, balance in initial_balances.items()}
+        self.series = {symbol: EquitySeries(balance, capacity, sharpe_window)
+                       for symbol, balance in initial_balances.items()}
+        self.series[TOTAL] = EquitySeries(sum(initial_balances.values()), capacity, sharpe_window)
+        # The total is marked once per bar time, when the next bar time starts,
+        # so its returns are per bar rather than per symbol event
+        self.total_equity = self.series[TOTAL].equity
+        self.total_time = None
+        self._lock = threading.Lock()
+
+    def _mark(self, symbol, time):
+        if self.total_time is not None and time > self.total_time:
+            self.series[TOTAL].mark(self.total_time, self.total_equity)
+        cash, shares, _, price = self.books[symbol]
+        series = self.series[symbol]
+        previous = series.equity
+        series.mark(time, cash + shares * price)
+        self.total_equity += series.equity - previous
+        self.total_time = time if self.total_time is None else max(self.total_time, time)
+
+    def add_symbol(self, symbol, balance):
+        """Start tracking symbol with balance of cash, which is added to the portfolio total."""
+        with self._lock:
+            total = self.series[TOTAL]
+            self.books[symbol] = [float(balance), 0, 0.0, 0.0]
+            self.series[symbol] = EquitySeries(balance, len(total.history.values), len(total.returns.values))
+            total.initial_equity += balance
+            total.equity += balance
+            total.peak += balance
+            self.total_equity += balance
+
+    def on_mark(self, symbol, price, timestamp):
+        """New market price for symbol."""
+        with self._lock:
+            self.books[symbol][3] = price
+            self._mark(symbol, _seconds(timestamp))
+
+    def on_fill(self, symbol, side, qty, price, timestamp, fee=0.0):
+        """Executed order; fee is the fraction of notional charged, as in TradingEnv."""
+        time = _seconds(timestamp)
+        with self._lock:
+            book = self.books[symbol]
+            cash, shares, average_cost, _ = book
+            if side == 'buy':
+                cost = qty * price * (1 + fee)
+                book[0] = cash - cost
+                book[1] = shares + qty
+                book[2] = (average_cost * shares + cost) / book[1]
+            else:
+                revenue = qty * price * (1 - fee)
+                book[0] = cash + revenue
+                book[1] = shares - qty
+                pnl = revenue - qty * average_cost
+                self.series[symbol].close_trade(time, pnl)
+                self.series[TOTAL].close_trade(time, pnl)
+                if book[1] == 0:
+                    book[2] = 0.0
+            book[3] = price
+            self._mark(symbol, time)
+
+    def sync_position(self, symbol, qty, average_entry_price, price, timestamp):
+        """Book the change from the recorded share count to the broker's qty as one fill.
+
+        For callers that see positions rather than fills. Bought shares are
+        priced from the change in the broker's average entry price, sold ones
+        at price.
+        """
+        held, average_cost = self.books[symbol][1], self.books[symbol][2]
+        if qty > held:
+            fill_price = (qty * average_entry_price - held * average_cost) / (qty - held)
+            self.on_fill(symbol, 'buy', qty - held, fill_price if fill_price > 0 else price, timestamp)
+        elif qty < held:
+            self.on_fill(symbol, 'sell', held - qty, price, timestamp)
+
+    def summary(self, symbol=None, window=None):
+        """Metrics for one symbol (default: the portfolio), optionally over the last window seconds."""
+        with self._lock:
+            series = self.series[symbol or TOTAL]
+            result = series.summary(window, self.periods_per_year)
+            if symbol is not None:
+                result["shares_held"] = self.books[symbol][1]
+            elif window is None and self.total_time is not None:
+                # Include the bar time still being marked
+                profit_loss = self.total_equity - series.initial_equity
+                result.update(net_worth=self.total_equity, profit_loss=profit_loss,
+                              return_percentage=profit_loss / series.initial_equity * 100,
+                              as_of=pd.Timestamp(self.total_time, unit='s', tz='UTC').isoformat())
+            return result
+
+    def snapshot(self):
+        """Copy of the state, for save() to write from another thread while events keep coming.
+
+        Copying the arrays is a memcpy; pickling and writing them is what
+        takes time.
+        """
+        with self._lock:
+            return copy.deepcopy({name: value for name, value in self.__dict__.items() if name != '_lock'})
+
+    def save(self, path=PERFORMANCE_FILE, state=None):
+        """Write state (default: a snapshot taken now) to path atomically."""
+        state = pickle.dumps(self.snapshot() if state is None else state)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(state)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=PERFORMANCE_FILE):
+        tracker = cls.__new__(cls)
+        with open(path, 'rb') as f:
+            tracker.__dict__.update(pickle.load(f))
+        tracker._lock = threading.Lock()
+        return tracker
+
+
+@contextlib.contextmanager
+def shared_tracker(path=PERFORMANCE_FILE, mark_interval=MARK_INTERVAL):
+    """PerformanceTracker saved at path, locked against other processes for the block and saved after it.
+
+    Starts an empty tracker for feeders marking every mark_interval seconds
+    if there is none yet; callers add their symbol.
+    """
+    with open(f"{path}.lock", 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(path):
+            tracker = PerformanceTracker.load(path)
+        else:
+            sharpe_window, periods_per_year = cadence(mark_interval)
+            tracker = PerformanceTracker({}, sharpe_window=sharpe_window, periods_per_year=periods_per_year)
+        yield tracker
+        tracker.save(path)
+
+
+class SharedTrackerWriter:
+    """Position and price updates of one bot process, booked into the shared tracker in batches.
+
+    record() only queues; flush() applies the queue in one shared_tracker()
+    block, at most every min_interval real seconds unless forced, so the
+    file is not loaded and rewritten on every trading cycle.
+    """
+
+    def __init__(self, path=PERFORMANCE_FILE, mark_interval=MARK_INTERVAL, min_interval=SHARED_SAVE_INTERVAL):
+        self.path = path
+        self.mark_interval = mark_interval
+        self.min_interval = min_interval
+        self.pending = []
+        self._flushed = time.monotonic()
+
+    def record(self, symbol, allocation, qty, average_entry_price, price, timestamp):
+        """Queue the broker's position in symbol and its price at timestamp.
+
+        A symbol new to the tracker starts with allocation of cash, or the
+        cost of the position it already holds if that is more.
+        """
+        self.pending.append((symbol, allocation, qty, average_entry_price, price, timestamp))
+
+    def flush(self, force=False):
+        if not self.pending or (not force and time.monotonic() - self._flushed < self.min_interval):
+            return
+        with shared_tracker(self.path, self.mark_interval) as tracker:
+            for symbol, allocation, qty, average_entry_price, price, timestamp in self.pending:
+                if symbol not in tracker.books:
+                    tracker.add_symbol(symbol, max(allocation, qty * average_entry_price))
+                tracker.sync_position(symbol, qty, average_entry_price, price, timestamp)
+                tracker.on_mark(symbol, price, timestamp)
+        self.pending.clear()
+        self._flushed = time.monotonic()
@@ -0,0 +1,165 @@
+"""Export trained PPO policies to plain NumPy weights and run them without torch.
+
+Each export folds the saved VecNormalize observation stats (mean, variance,
+epsilon, clip) together with the policy MLP and action head into
+``models/trading_policy_<Stock>.npz``. ``NumpyPolicy`` loads that file and
+returns the same deterministic actions as ``PPO.predict`` on raw observations.
+
+Equivalence with PPO.predict is checked by tests/test_policy_export.py.
+
+Usage: python policy_export.py [Stock ...]
+"""
+import argparse
+import contextlib
+import os
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, each model file is still replaced atomically on its own
+    fcntl = None
+
+from constants import STOCK_MAPPINGS
+
+ACTIVATIONS = {
+    'Tanh': np.tanh,
+    'ReLU': lambda x: np.maximum(x, 0),
+}
+
+
+def policy_export_path(stock_name):
+    return f"models/trading_policy_{stock_name}.npz"
+
+
+@contextlib.contextmanager
+def model_files_lock(stock_name, exclusive=False):
+    """Lock on a stock's trained files: shared while loading them, exclusive while train_model replaces them.
+
+    A reader holding it never pairs a model with the normalizer of another
+    training run.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs('models', exist_ok=True)
+    with open(f"models/.trading_bot_ppo_{stock_name}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def load_exported_policy(stock_name):
+    """NumpyPolicy for stock_name, or None if there is no export newer than the trained files."""
+    export_path = policy_export_path(stock_name)
+    if not os.path.exists(export_path):
+        return None
+    exported = os.stat(export_path).st_mtime_ns
+    for path in (f"models/trading_bot_ppo_{stock_name}.zip", f"models/trading_env_normalize_{stock_name}.pkl"):
+        if os.path.exists(path) and os.stat(path).st_mtime_ns > exported:
+            return None
+    return NumpyPolicy.load(export_path)
+
+
+class NumpyPolicy:
+    """Deterministic PPO policy (observation normalization + MLP + argmax) in NumPy."""
+
+    def __init__(self, layers, activation, obs_mean, obs_scale, clip_obs):
+        # layers: [(weight (in, out), bias (out,)), ...]; the last one is the action head
+        self.layers = [(np.ascontiguousarray(w, dtype=np.float32), np.asarray(b, dtype=np.float32))
+                       for w, b in layers]
+        self.activation_name = activation
+        self.activation = ACTIVATIONS[activation]
+        self.obs_mean = np.asarray(obs_mean, dtype=np.float64)
+        self.obs_scale = np.asarray(obs_scale, dtype=np.float64)
+        self.clip_obs = float(clip_obs)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            layers = [(f[f"weight_{i}"], f[f"bias_{i}"]) for i in range(int(f['n_layers']))]
+            return cls(layers, str(f['activation']), f['obs_mean'], f['obs_scale'], f['clip_obs'])
+
+    def save(self, path):
+        arrays = {f"weight_{i}": w for i, (w, _) in enumerate(self.layers)}
+        arrays.update({f"bias_{i}": b for i, (_, b) in enumerate(self.layers)})
+        np.savez(path, n_layers=len(self.layers), activation=self.activation_name,
+                 obs_mean=self.obs_mean, obs_scale=self.obs_scale, clip_obs=self.clip_obs, **arrays)
+
+    def normalize(self, obs):
+        """Same transform as VecNormalize.normalize_obs with frozen stats."""
+        return np.clip((obs - self.obs_mean) / self.obs_scale, -self.clip_obs, self.clip_obs).astype(np.float32)
+
+    def action_logits(self, normalized_obs):
+        x = np.asarray(normalized_obs, dtype=np.float32)
+        for weight, bias in self.layers[:-1]:
+            x = self.activation(x @ weight + bias)
+        weight, bias = self.layers[-1]
+        return x @ weight + bias
+
+    def predict_normalized(self, normalized_obs):
+        return self.action_logits(normalized_obs).argmax(axis=-1)
+
+    def predict(self, observation, deterministic=True):
+        """Mirror of PPO.predict(normalize(obs), deterministic=True) for raw observations."""
+        if not deterministic:
+            raise ValueError("NumpyPolicy only supports deterministic actions.")
+        obs = np.asarray(observation, dtype=np.float32)
+        actions = self.predict_normalized(self.normalize(obs.reshape(-1, obs.shape[-1])))
+        return (actions if obs.ndim > 1 else actions[0]), None
+
+
+def policy_from_ppo(model, normalizer):
+    """Build a NumpyPolicy from a loaded PPO model and its VecNormalize stats."""
+    from torch import nn
+
+    policy = model.policy
+    layers, activation = [], None
+    for module in policy.mlp_extractor.policy_net:
+        if isinstance(module, nn.Linear):
+            layers.append((module.weight.detach().cpu().numpy().T, module.bias.detach().cpu().numpy()))
+        elif type(module).__name__ in ACTIVATIONS:
+            activation = type(module).__name__
+        else:
+            raise ValueError(f"Unsupported layer in policy network: {module}")
+    action_net = policy.action_net
+    layers.append((action_net.weight.detach().cpu().numpy().T, action_net.bias.detach().cpu().numpy()))
+
+    obs_rms = normalizer.obs_rms
+    return NumpyPolicy(layers, activation or 'Tanh', obs_rms.mean,
+                       np.sqrt(obs_rms.var + normalizer.epsilon), normalizer.clip_obs)
+
+
+def load_ppo(stock_name):
+    from stable_baselines3 import PPO
+    import Backtest_bot
+
+    with model_files_lock(stock_name):
+        model_path, env_path = Backtest_bot.policy_paths(stock_name)
+        return PPO.load(model_path), Backtest_bot.load_normalizer(env_path)
+
+
+def export_policy(stock_name):
+    model, normalizer = load_ppo(stock_name)
+    numpy_policy = policy_from_ppo(model, normalizer)
+    numpy_policy.save(policy_export_path(stock_name))
+    return numpy_policy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stocks', nargs='*', help=f"Stocks to export (default: all of {list(STOCK_MAPPINGS)})")
+    args = parser.parse_args()
+    unknown = [stock_name for stock_name in args.stocks if stock_name not in STOCK_MAPPINGS]
+    if unknown:
+        parser.error(f"unknown stock(s) {unknown}; choose from {list(STOCK_MAPPINGS)}")
+
+    for stock_name in args.stocks or list(STOCK_MAPPINGS):
+        start = time.perf_counter()
+        export_policy(stock_name)
+        print(f"💾 Exported {stock_name} policy to {policy_export_path(stock_name)} "
+              f"({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
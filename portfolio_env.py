@@ -0,0 +1,191 @@
+"""Portfolio variant of TradingEnv: one policy trades every symbol from shared cash.
+
+PortfolioData aligns the features of several symbols on one timeline, a
+(time x symbol x feature) array. PortfolioEnv steps all symbols at once. It
+takes one hold/buy/sell action per symbol, keeps per-symbol positions, and
+applies TradingEnv's buy/sell rules and fee model to each of them.
+
+A single training run and a single saved model then cover the whole universe
+instead of one model per STOCK_MAPPINGS entry.
+"""
+import gym
+from gym import spaces
+import numpy as np
+
+from trading_env import BALANCE_IDX, OBSERVATION_LAYOUT, SHARES_IDX, start_cdf
+
+N_FEATURES = len(OBSERVATION_LAYOUT)
+
+
+class PortfolioData:
+    """Bars of several symbols on one timeline.
+
+    features is (time, symbol, feature) float32 in the TradingEnv observation
+    layout, prices and sma_10 are (time, symbol) float64, and tradable is
+    (time, symbol) bool: False where the symbol had no bar at that time and
+    its previous bar was carried forward.
+    """
+
+    def __init__(self, symbols, features, prices, sma_10, tradable, timestamps):
+        self.symbols = list(symbols)
+        self.features = features
+        self.prices = prices
+        self.sma_10 = sma_10
+        self.tradable = tradable
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def align(cls, feature_sets):
+        """Align {symbol: FeatureSet} on the union of their bar times.
+
+        The timeline runs from the latest first bar to the earliest last bar,
+        so every symbol has a price at every step. A symbol missing a bar
+        inside that range repeats its previous bar and is not tradable there.
+        """
+        symbols = list(feature_sets)
+        if not symbols:
+            raise ValueError("PortfolioData.align needs at least one symbol.")
+        first = max(int(fs.timestamps[0]) for fs in feature_sets.values())
+        last = min(int(fs.timestamps[-1]) for fs in feature_sets.values())
+        if first >= last:
+            raise ValueError("The symbols' bar ranges do not overlap.")
+        timeline = np.unique(np.concatenate([
+            np.asarray(fs.timestamps)[(fs.timestamps >= first) & (fs.timestamps <= last)]
+            for fs in feature_sets.values()]))
+
+        shape = (len(timeline), len(symbols))
+        features = np.empty(shape + (N_FEATURES,), dtype=np.float32)
+        prices = np.empty(shape, dtype=np.float64)
+        sma_10 = np.empty(shape, dtype=np.float64)
+        tradable = np.empty(shape, dtype=bool)
+        for j, fs in enumerate(feature_sets.values()):
+            # Latest bar at or before each timeline point: forward fill in one lookup
+            rows = np.searchsorted(fs.timestamps, timeline, side='right') - 1
+            features[:, j] = fs.features[rows]
+            prices[:, j] = fs.prices[rows]
+            sma_10[:, j] = fs.sma_10[rows]
+            tradable[:, j] = fs.timestamps[rows] == timeline
+        return cls(symbols, features, prices, sma_10, tradable, timeline)
+
+    def slice(self, start=None, stop=None):
+        window = slice(start, stop)
+        return PortfolioData(self.symbols, self.features[window], self.prices[window], self.sma_10[window],
+                             self.tradable[window], self.timestamps[window])
+
+    def missing_bars(self):
+        """{symbol: number of carried-forward bars}."""
+        return dict(zip(self.symbols, (~self.tradable).sum(axis=0).tolist()))
+
+
+def portfolio_trade_step(balance, shares_held, net_worth, price, sma_10, tradable, actions,
+                         initial_balance=10000, transaction_fee=0.001):
+    """Apply the TradingEnv.step buy/sell rules to every symbol of one portfolio at once.
+
+    Buying symbols split 50% of the cash equally, so with one symbol this is
+    exactly TradingEnv.step. Sells use the same SMA_10 / 2% portfolio profit
+    rule. Symbols without a fresh bar are not traded. Returns the new
+    (balance, shares_held, net_worth).
+    """
+    candidates = (actions == 1) & tradable & (price < sma_10)
+    budget = balance * 0.5 / max(int(candidates.sum()), 1)
+    shares_to_buy = np.where(candidates, np.floor_divide(budget, price), 0)
+    cost = shares_to_buy * price * (1 + transaction_fee)
+    buy = candidates & (shares_to_buy > 0)
+
+    sell = (actions == 2) & tradable & (shares_held > 0) & (
+        (price > sma_10) | ((net_worth / initial_balance - 1) >= 0.02))
+    shares_to_sell = np.trunc(shares_held * 0.5)
+    shares_to_sell = np.where(shares_to_sell < 1, shares_held, shares_to_sell)
+    revenue = shares_to_sell * price * (1 - transaction_fee)
+
+    balance = float(balance - cost[buy].sum() + revenue[sell].sum())
+    shares_held = np.where(buy, shares_held + shares_to_buy,
+                           np.where(sell, shares_held - shares_to_sell, shares_held))
+    net_worth = balance + float(shares_held @ price)
+    return balance, shares_held, net_worth
+
+
+class PortfolioEnv(gym.Env):
+    """TradingEnv over every symbol of a PortfolioData, with shared cash.
+
+    The observation is one TradingEnv observation row per symbol (its
+    shares_held slot holds that symbol's position, its balance slot the
+    shared cash) followed by the symbols' tradable flags. The action is one
+    hold/buy/sell per symbol. Episode windows work as in TradingEnv.
+    """
+
+    def __init__(self, data, initial_balance=10000, transaction_fee=0.001,
+                 episode_length=None, random_start=False, start_weights=None):
+        super().__init__()
+        self.data = data
+        self.n_symbols = len(data.symbols)
+        self.initial_balance = initial_balance
+        self.transaction_fee = transaction_fee
+        self.max_steps = len(data) - 1
+        self.episode_length = min(episode_length, self.max_steps) if episode_length else None
+        self.random_start = random_start
+        self._start_cdf = start_cdf(start_weights, self.max_steps - (self.episode_length or 1))
+        self._rng = np.random.default_rng()
+
+        self.current_step = 0
+        self.end_step = self.max_steps
+        self.balance = initial_balance
+        self.shares_held = np.zeros(self.n_symbols)
+        self.net_worth = initial_balance
+        self._obs = np.zeros((self.n_symbols, N_FEATURES), dtype=np.float32)
+
+        self.action_space = spaces.MultiDiscrete([3] * self.n_symbols)
+        self.observation_space = spaces.Box(low=0, high=1, shape=(self.n_symbols * (N_FEATURES + 1),),
+                                            dtype=np.float32)
+
+    def seed(self, seed=None):
+        self._rng = np.random.default_rng(seed)
+
+    def reset(self):
+        self.balance = self.initial_balance
+        self.shares_held = np.zeros(self.n_symbols)
+        self.net_worth = self.initial_balance
+        self.current_step = 0
+        if self.random_start and self._start_cdf is not None:
+            self.current_step = int(np.searchsorted(self._start_cdf, self._rng.random(), side='right'))
+        elif self.random_start:
+            self.current_step = int(self._rng.integers(0, self.max_steps - (self.episode_length or 1) + 1))
+        self.end_step = self.max_steps
+        if self.episode_length:
+            self.end_step = min(self.current_step + self.episode_length, self.max_steps)
+        return self._next_observation()
+
+    def _next_observation(self):
+        obs = self._obs
+        obs[:] = self.data.features[self.current_step]
+        obs[:, SHARES_IDX] = self.shares_held / 1000
+        obs[:, BALANCE_IDX] = self.balance / self.initial_balance
+        return np.concatenate([obs.ravel(), self.data.tradable[self.current_step]]).astype(np.float32)
+
+    def step(self, action):
+        price = self.data.prices[self.current_step]
+        tradable = self.data.tradable[self.current_step]
+        self.current_step += 1
+        sma_10 = self.data.sma_10[self.current_step]
+
+        previous_net_worth = self.net_worth
+        self.balance, self.shares_held, self.net_worth = portfolio_trade_step(
+            self.balance, self.shares_held, self.net_worth, price, sma_10, tradable,
+            np.asarray(action).reshape(self.n_symbols), self.initial_balance, self.transaction_fee)
+        reward = (self.net_worth - previous_net_worth) / previous_net_worth
+
+        done = self.current_step >= self.end_step
+        info = {"net_worth": self.net_worth}
+        if done:
+            info["TimeLimit.truncated"] = self.end_step < self.max_steps  # As in TradingEnv.step
+        return self._next_observation(), reward, done, info
+
+    def render(self, mode='human'):
+        positions = ", ".join(f"{s}: {n:g}" for s, n in zip(self.data.symbols, self.shares_held))
+        print(f'Step: {self.current_step}, Net Worth: {self.net_worth}, Positions: {positions}')
+
+    def get_portfolio_value(self):
+        return self.net_worth
@@ -0,0 +1,374 @@
+"""Replay the live trading loop against historical bars on a virtual clock.
+
+ReplayBroker implements the part of ``tradeapi.REST`` the bots use:
+get_clock, get_account, list_orders, list_positions, get_position,
+get_latest_trade(s), submit_order and close_all_positions. It answers from
+bars in the local bar cache and returns the SDK's own entity types. Market
+orders fill after FILL_DELAY_SECONDS at the then-current price, moved
+against the order by SLIPPAGE_BPS.
+
+VirtualClock stands in for the ``time`` module of interactive_bot and
+broker_client. Every sleep, cache TTL and rate-limit wait then advances
+simulated time instead of waiting, so months of the 60-second loop replay
+as fast as the CPU runs it: on synthetic hourly bars, 91 days (78k trade
+cycles) take about 18s, roughly 450,000x real time. The replay ends when
+the clock passes the last bar. The bot's performance state and metrics go
+to temporary files, not to those of the live bots.
+
+Usage: python replay_broker.py Apple [--start 2024-01-01] [--end 2024-06-30] [--timeframe 1H] [--verbose]
+"""
+import argparse
+import contextlib
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import alpaca_trade_api as tradeapi
+from alpaca_trade_api.entity import Account, Clock, Order, Position
+from alpaca_trade_api.entity_v2 import LatestTradesV2, TradeV2
+import numpy as np
+import pandas as pd
+
+import timing
+from bar_cache import BarCache
+from constants import STOCK_MAPPINGS
+from performance import PerformanceTracker
+
+# Simulated execution of market orders
+SLIPPAGE_BPS = float(os.getenv('ITRADER_REPLAY_SLIPPAGE_BPS', '5'))  # Fill price moved against the order
+FILL_DELAY_SECONDS = float(os.getenv('ITRADER_REPLAY_FILL_DELAY', '1'))  # Virtual seconds from submit to fill
+INITIAL_CASH = 100000.0
+
+# Regular NYSE session (holidays are not modelled; days without bars simply have no price change)
+MARKET_TZ = 'America/New_York'
+MARKET_OPEN = pd.Timedelta(hours=9, minutes=30)
+MARKET_CLOSE = pd.Timedelta(hours=16)
+
+
+class ReplayFinished(BaseException):
+    """Raised by VirtualClock once it passes the end of the replay.
+
+    A BaseException, like KeyboardInterrupt, so the bots' ``except Exception``
+    handlers let it through and the loop stops.
+    """
+
+
+class VirtualClock:
+    """Simulated time in nanoseconds since the epoch; sleep() moves it forward instantly."""
+
+    def __init__(self, start, end):
+        self.now_ns = pd.Timestamp(start).value
+        self.end_ns = pd.Timestamp(end).value
+
+    def now(self):
+        return pd.Timestamp(self.now_ns, tz='UTC')
+
+    def time(self):
+        return self.now_ns / 1e9
+
+    monotonic = time
+
+    def sleep(self, seconds):
+        self.now_ns += int(max(seconds, 0) * 1e9)
+        if self.now_ns >= self.end_ns:
+            raise ReplayFinished()
+
+
+class _TimeModule:
+    """``time`` module whose sleep/time/monotonic follow a VirtualClock; everything else is the real one."""
+
+    def __init__(self, clock):
+        self.sleep = clock.sleep
+        self.time = clock.time
+        self.monotonic = clock.monotonic
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@contextlib.contextmanager
+def virtual_time(clock, *modules):
+    """Point the ``time`` global of each module at clock for the duration of the block."""
+    shim = _TimeModule(clock)
+    saved = [module.time for module in modules]
+    for module in modules:
+        module.time = shim
+    try:
+        yield clock
+    finally:
+        for module, original in zip(modules, saved):
+            module.time = original
+
+
+def market_sessions(start, end):
+    """(open, close) times in ns of every weekday session from the week before start to the week after end."""
+    days = pd.date_range(pd.Timestamp(start).tz_convert(MARKET_TZ).normalize() - pd.Timedelta(days=7),
+                         pd.Timestamp(end).tz_convert(MARKET_TZ).normalize() + pd.Timedelta(days=7), freq='D')
+    days = days[days.weekday < 5]
+    return (days + MARKET_OPEN).as_unit('ns').asi8, (days + MARKET_CLOSE).as_unit('ns').asi8
+
+
+def _api_error(message, code=403):
+    return tradeapi.rest.APIError({'code': code, 'message': message})
+
+
+class ReplayBroker:
+    """Paper account over historical bars ({symbol: OHLCV DataFrame}) on a VirtualClock.
+
+    The latest trade price of a symbol is the close of its last finished
+    bar, or the open of the bar in progress. The account is cash only: buys
+    must fit in the cash and sells in the position.
+    """
+
+    def __init__(self, bars, clock, timeframe='1H', initial_cash=INITIAL_CASH,
+                 slippage_bps=SLIPPAGE_BPS, fill_delay=FILL_DELAY_SECONDS):
+        self.clock = clock
+        self.bar_ns = pd.to_timedelta(timeframe.lower()).value
+        self.slippage = slippage_bps / 1e4
+        self.fill_delay_ns = int(fill_delay * 1e9)
+        self._times, self._open, self._close = {}, {}, {}
+        for symbol, frame in bars.items():
+            self._times[symbol] = frame.index.as_unit('ns').asi8
+            self._open[symbol] = frame['open'].to_numpy(dtype=np.float64)
+            self._close[symbol] = frame['close'].to_numpy(dtype=np.float64)
+        self._opens, self._closes = market_sessions(pd.Timestamp(clock.now_ns, tz='UTC'),
+                                                    pd.Timestamp(clock.end_ns, tz='UTC'))
+        self.cash = float(initial_cash)
+        self.positions = {}  # symbol -> [qty, avg_entry_price]
+        self.orders = []
+        self._pending = []  # (fill time ns, order raw dict)
+        self._ids = itertools.count(1)
+
+    # -- market data -------------------------------------------------------
+
+    def price_at(self, symbol, at_ns):
+        times = self._times.get(symbol)
+        if times is None:
+            raise _api_error(f"symbol {symbol} not found", 404)
+        i = int(np.searchsorted(times, at_ns, side='right')) - 1
+        if i < 0:
+            raise _api_error(f"no trades for {symbol} before {pd.Timestamp(at_ns, tz='UTC')}", 404)
+        return float(self._close[symbol][i] if at_ns >= times[i] + self.bar_ns else self._open[symbol][i])
+
+    def get_latest_trade(self, symbol, feed=None):
+        self._settle()
+        return TradeV2({'S': symbol, 'p': self.price_at(symbol, self.clock.now_ns), 's': 100,
+                        't': self.clock.now().isoformat()})
+
+    def get_latest_trades(self, symbols, feed=None):
+        self._settle()
+        return LatestTradesV2({symbol: {'S': symbol, 'p': self.price_at(symbol, self.clock.now_ns), 's': 100,
+                                        't': self.clock.now().isoformat()}
+                               for symbol in symbols if symbol in self._times})
+
+    def market_session(self, at_ns):
+        """(is_open, next_open ns, next_close ns) of the regular session at at_ns."""
+        i = int(np.searchsorted(self._closes, at_ns, side='right'))
+        is_open = bool(self._opens[i] <= at_ns)
+        return is_open, int(self._opens[i + 1] if is_open else self._opens[i]), int(self._closes[i])
+
+    def get_clock(self):
+        is_open, next_open, next_close = self.market_session(self.clock.now_ns)
+        return Clock({'timestamp': self.clock.now().isoformat(), 'is_open': is_open,
+                      'next_open': pd.Timestamp(next_open, tz='UTC').isoformat(),
+                      'next_close': pd.Timestamp(next_close, tz='UTC').isoformat()})
+
+    # -- account -----------------------------------------------------------
+
+    def _settle(self):
+        """Fill every pending order whose fill time has come."""
+        now = self.clock.now_ns
+        while self._pending and self._pending[0][0] <= now:
+            fill_ns, order = self._pending.pop(0)
+            symbol, qty, sign = order['symbol'], int(order['qty']), 1 if order['side'] == 'buy' else -1
+            price = self.price_at(symbol, fill_ns) * (1 + sign * self.slippage)
+            position = self.positions.setdefault(symbol, [0, 0.0])
+            if sign > 0:
+                position[1] = (position[0] * position[1] + qty * price) / (position[0] + qty)
+            position[0] += sign * qty
+            if position[0] == 0:
+                del self.positions[symbol]
+            self.cash -= sign * qty * price
+            filled_at = pd.Timestamp(fill_ns, tz='UTC').isoformat()
+            order.update(status='filled', filled_qty=str(qty), filled_avg_price=f"{price:.4f}",
+                         filled_at=filled_at, updated_at=filled_at)
+
+    def _equity(self):
+        return self.cash + sum(qty * self.price_at(symbol, self.clock.now_ns)
+                               for symbol, (qty, _) in self.positions.items())
+
+    def get_account(self):
+        self._settle()
+        equity = f"{self._equity():.2f}"
+        return Account({'id': 'replay', 'status': 'ACTIVE', 'currency': 'USD', 'cash': f"{self.cash:.2f}",
+                        'buying_power': f"{self.cash:.2f}", 'equity': equity, 'portfolio_value': equity})
+
+    def _position(self, symbol):
+        qty, avg_entry_price = self.positions[symbol]
+        price = self.price_at(symbol, self.clock.now_ns)
+        return Position({'symbol': symbol, 'side': 'long', 'qty': str(qty), 'avg_entry_price': f"{avg_entry_price:.4f}",
+                         'current_price': f"{price:.4f}", 'market_value': f"{qty * price:.2f}",
+                         'unrealized_pl': f"{qty * (price - avg_entry_price):.2f}"})
+
+    def list_positions(self):
+        self._settle()
+        return [self._position(symbol) for symbol in self.positions]
+
+    def get_position(self, symbol):
+        self._settle()
+        if symbol not in self.positions:
+            raise _api_error("position does not exist", 404)
+        return self._position(symbol)
+
+    # -- orders ------------------------------------------------------------
+
+    def list_orders(self, status='open', limit=None, **kwargs):
+        self._settle()
+        if status == 'open':
+            orders = [order for _, order in self._pending]
+        elif status == 'closed':
+            orders = [order for order in self.orders if order['status'] != 'new']
+        else:
+            orders = self.orders
+        orders = orders[::-1][:limit]
+        return [Order(dict(order)) for order in orders]
+
+    def submit_order(self, symbol, qty, side, type='market', time_in_force='day', **kwargs):
+        self._settle()
+        if type != 'market':
+            raise _api_error(f"replay broker only fills market orders, not {type}", 422)
+        qty = int(qty)
+        price = self.price_at(symbol, self.clock.now_ns)
+        if side == 'buy' and qty * price > self.cash:
+            raise _api_error("insufficient buying power")
+        if side == 'sell' and qty > self.positions.get(symbol, [0])[0]:
+            raise _api_error("insufficient qty available for order")
+
+        now = self.clock.now()
+        is_open, next_open, _ = self.market_session(now.value)
+        # Day orders sent outside the session wait for the next open
+        fill_ns = (now.value if is_open else next_open) + self.fill_delay_ns
+        order = {'id': f"replay-{next(self._ids)}", 'symbol': symbol, 'qty': str(qty), 'side': side,
+                 'type': type, 'time_in_force': time_in_force, 'status': 'new', 'filled_qty': '0',
+                 'filled_avg_price': None, 'submitted_at': now.isoformat(), 'filled_at': None}
+        self.orders.append(order)
+        self._pending.append((fill_ns, order))
+        self._pending.sort(key=lambda entry: entry[0])
+        return Order(dict(order))
+
+    def close_all_positions(self, cancel_orders=False):
+        self._settle()
+        if cancel_orders:
+            for _, order in self._pending:
+                order['status'] = 'canceled'
+            self._pending.clear()
+        return [self.submit_order(symbol, qty, 'sell') for symbol, (qty, _) in list(self.positions.items())]
+
+
+# ---------------------------------------------------------------------------
+# Replaying interactive_bot
+# ---------------------------------------------------------------------------
+
+class _AlpacaOnDemand:
+    """get_bars through Backtest_bot's client, created only if the bar cache misses a range."""
+
+    def get_bars(self, *args, **kwargs):
+        import Backtest_bot
+        return Backtest_bot.get_api().get_bars(*args, **kwargs)
+
+
+def replay(stock_name, start, end, timeframe='1H', feed='iex', api=None, initial_cash=INITIAL_CASH,
+           slippage_bps=SLIPPAGE_BPS, fill_delay=FILL_DELAY_SECONDS, verbose=False, performance_path=None):
+    """Run interactive_bot.main(stock_name) from start to end on a ReplayBroker; returns a summary dict.
+
+    The bot's performance state goes to performance_path (default: a
+    temporary file) and its metrics to a temporary directory, never to the
+    live bots' files read by /performance and /metrics.
+    """
+    import broker_client
+    import interactive_bot
+
+    symbol = STOCK_MAPPINGS[stock_name]
+    bars = BarCache(api or _AlpacaOnDemand()).get_bars(symbol, timeframe, start=start, end=end, feed=feed)
+    if bars.empty:
+        raise ValueError(f"No {timeframe} bars for {symbol} between {start} and {end}.")
+    clock = VirtualClock(bars.index[0], bars.index[-1] + pd.to_timedelta(timeframe.lower()))
+    broker = ReplayBroker({symbol: bars}, clock, timeframe, initial_cash, slippage_bps, fill_delay)
+
+    cycles_before = timing.REGISTRY.snapshot().get('trade_cycle')
+    connect = interactive_bot.connect
+    # Rate-limit waits run on the virtual clock, so they must not share the real bots' bucket
+    interactive_bot.connect = lambda: broker_client.BrokerClient(broker, symbols=[symbol], rate_limit_file=None)
+    scratch = tempfile.TemporaryDirectory(prefix='replay-')
+    performance_path = performance_path or os.path.join(scratch.name, 'performance_state.pkl')
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull, virtual_time(clock, interactive_bot, broker_client), \
+                (contextlib.nullcontext() if verbose else contextlib.redirect_stdout(devnull)):
+            interactive_bot.main(stock_name, performance_path, os.path.join(scratch.name, 'metrics'))
+    except ReplayFinished:
+        pass
+    finally:
+        interactive_bot.connect = connect
+    wall_seconds = time.perf_counter() - started
+    performance = (PerformanceTracker.load(performance_path).summary(symbol)
+                   if os.path.exists(performance_path) else None)
+    scratch.cleanup()
+
+    cycles = timing.REGISTRY.snapshot().get('trade_cycle')
+    virtual_seconds = (min(clock.now_ns, clock.end_ns) - bars.index[0].value) / 1e9
+    return {
+        'stock': stock_name,
+        'start': bars.index[0].isoformat(),
+        'end': pd.Timestamp(min(clock.now_ns, clock.end_ns), tz='UTC').isoformat(),
+        'bars': len(bars),
+        'virtual_seconds': virtual_seconds,
+        'wall_seconds': wall_seconds,
+        'speedup': virtual_seconds / wall_seconds if wall_seconds else None,
+        'trade_cycles': (cycles.count if cycles else 0) - (cycles_before.count if cycles_before else 0),
+        'orders': len(broker.orders),
+        'filled': sum(order['status'] == 'filled' for order in broker.orders),
+        'cash': round(broker.cash, 2),
+        'equity': round(broker._equity(), 2),
+        'performance': performance,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stock', choices=list(STOCK_MAPPINGS))
+    parser.add_argument('--start', default=(pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=90)).strftime('%Y-%m-%d'))
+    parser.add_argument('--end', default=pd.Timestamp.now(tz='UTC').strftime('%Y-%m-%d'))
+    parser.add_argument('--timeframe', default='1H', help="Bar size served by the broker (1H, 1Min, ...)")
+    parser.add_argument('--feed', default='iex')
+    parser.add_argument('--cash', type=float, default=INITIAL_CASH)
+    parser.add_argument('--slippage-bps', type=float, default=SLIPPAGE_BPS)
+    parser.add_argument('--fill-delay', type=float, default=FILL_DELAY_SECONDS, help="Virtual seconds to fill")
+    parser.add_argument('--performance-file',
+                        help="Keep the replayed bot's performance state here (default: a discarded temp file)")
+    parser.add_argument('--log-file', help="Where the replayed bot's log goes (default logs/replay_<stock>.jsonl)")
+    parser.add_argument('--verbose', action='store_true', help="Show the bot's own output")
+    args = parser.parse_args()
+
+    from bot_logging import log_path, setup_logging
+    setup_logging(args.log_file or log_path(f"replay_{args.stock}"))
+    summary = replay(args.stock, args.start, args.end, args.timeframe, args.feed, initial_cash=args.cash,
+                     slippage_bps=args.slippage_bps, fill_delay=args.fill_delay, verbose=args.verbose,
+                     performance_path=args.performance_file)
+
+    days = summary['virtual_seconds'] / 86400
+    print(f"Replayed {days:.1f} days of {summary['stock']} ({summary['start']} to {summary['end']}) "
+          f"in {summary['wall_seconds']:.2f}s: {summary['speedup']:,.0f}x real time", file=sys.stderr)
+    print(f"{summary['trade_cycles']} trade cycles, {summary['orders']} orders ({summary['filled']} filled), "
+          f"cash {summary['cash']:,.2f}, equity {summary['equity']:,.2f}", file=sys.stderr)
+    if summary['performance']:
+        performance = summary['performance']
+        print(f"Bot book: return {performance['return_percentage']:.2f}%, "
+              f"max drawdown {performance['max_drawdown_percentage']:.2f}%", file=sys.stderr)
+    print(timing.report(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+"""Monte Carlo stress backtests of a trained model over block-bootstrapped price paths.
+
+Thousands of synthetic price paths are resampled from a stock's cached bar
+history. Each path is built from random blocks of consecutive bars, so
+volatility clusters and intraday patterns survive. Every path starts from the
+same real warm-up bars. The indicators of all paths in a chunk are computed
+in one batch, with one DataFrame column per path. The policy then trades all
+paths in lockstep: each bar costs one batched forward pass, and the accounting
+is TradingEnv.step vectorized over paths (walk_forward.evaluate_windows).
+
+Chunks of paths run in a process pool, one process per core. The report
+gives the return and max drawdown distributions, VaR/CVaR and throughput.
+
+Usage: python stress_test.py Google [--paths 5000] [--block 24] [--days 365] [--path-days 90] [--workers 4]
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from constants import STOCK_MAPPINGS
+from indicators import compute_indicators
+from trading_env import OBSERVATION_LAYOUT
+from worker_pool import thread_limits
+
+# Real bars before each synthetic path, enough for SMA_50 and the MACD signal to be valid
+WARMUP_BARS = 100
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+
+# ---------------------------------------------------------------------------
+# Path generation
+# ---------------------------------------------------------------------------
+
+class BarReturns:
+    """Per-bar moves of a bar history relative to the previous close.
+
+    open, high, low are ratios to the previous close, log_close the log
+    return of the close, volume the raw volume. Resampling these rows keeps
+    every bar's shape (high >= open, close >= low) intact.
+    """
+
+    def __init__(self, bars):
+        close = bars['close'].to_numpy(dtype=np.float64)
+        previous_close = close[:-1]
+        self.open = bars['open'].to_numpy(dtype=np.float64)[1:] / previous_close
+        self.high = bars['high'].to_numpy(dtype=np.float64)[1:] / previous_close
+        self.low = bars['low'].to_numpy(dtype=np.float64)[1:] / previous_close
+        self.log_close = np.log(close[1:] / previous_close)
+        self.volume = bars['volume'].to_numpy(dtype=np.float64)[1:]
+
+    def __len__(self):
+        return len(self.log_close)
+
+
+def block_bootstrap_indices(n_source, n_paths, length, block, rng):
+    """(n_paths, length) source rows made of random runs of ``block`` consecutive bars."""
+    block = min(block, n_source)
+    n_blocks = -(-length // block)
+    starts = rng.integers(0, n_source - block + 1, size=(n_paths, n_blocks))
+    return (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :length]
+
+
+def synthetic_paths(returns, last_close, n_paths, length, block, rng):
+    """{'open', 'high', 'low', 'close', 'volume'}: (n_paths, length) bars continuing from last_close."""
+    rows = block_bootstrap_indices(len(returns), n_paths, length, block, rng)
+    close = last_close * np.exp(np.cumsum(returns.log_close[rows], axis=1))
+    previous_close = np.empty_like(close)
+    previous_close[:, 0] = last_close
+    previous_close[:, 1:] = close[:, :-1]
+    return {
+        'open': previous_close * returns.open[rows],
+        'high': previous_close * returns.high[rows],
+        'low': previous_close * returns.low[rows],
+        'close': close,
+        'volume': returns.volume[rows],
+    }
+
+
+def path_features(warmup, paths, index):
+    """Indicators of every path in one batch, as flat arrays for evaluate_windows.
+
+    Each path is the warm-up bars followed by its synthetic bars. Returns
+    (features, prices, sma_10) with path p at rows p * len(index) onward.
+    """
+    n_paths = len(paths['close'])
+    columns = {}
+    for name in ('open', 'high', 'low', 'close', 'volume'):
+        values = np.empty((len(index), n_paths))
+        values[:len(warmup)] = warmup[name].to_numpy(dtype=np.float64)[:, None]
+        values[len(warmup):] = paths[name].T
+        columns[name] = pd.DataFrame(values, index=index)
+    indicators = compute_indicators(columns['open'], columns['high'], columns['low'], columns['close'],
+                                     columns['volume'])
+    indicators.update(columns)
+
+    features = np.zeros((n_paths, len(index), len(OBSERVATION_LAYOUT)), dtype=np.float32)
+    for i, entry in enumerate(OBSERVATION_LAYOUT):
+        if entry is None:
+            continue
+        column, scale = entry
+        features[:, :, i] = indicators[column].to_numpy(dtype=np.float64).T / scale
+    # A flat stretch of resampled bars can give a 0/0 indicator; the real data would drop that row
+    np.nan_to_num(features, copy=False, posinf=0.0, neginf=0.0)
+    return (features.reshape(-1, len(OBSERVATION_LAYOUT)),
+            indicators['close'].to_numpy().T.ravel(),
+            indicators['SMA_10'].to_numpy().T.ravel())
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+_policies = {}  # (stock, numpy) -> batched policy, loaded once per worker process
+
+
+@contextlib.contextmanager
+def _environment(variables):
+    """os.environ with variables set for the block, e.g. for the processes spawned in it."""
+    saved = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _worker_init(threads):
+    # The BLAS/OpenMP limits came with the environment the worker was spawned with: this module
+    # imported numpy and pandas before any initializer runs
+    import torch
+    torch.set_num_threads(threads)
+
+
+def load_policy(stock_name, numpy_policy=False):
+    """Batched obs -> actions function for stock_name's model."""
+    key = (stock_name, numpy_policy)
+    if key not in _policies:
+        if numpy_policy:
+            from policy_export import load_exported_policy
+            exported = load_exported_policy(stock_name)
+            if exported is None:
+                raise FileNotFoundError(f"No up-to-date NumPy export for {stock_name}; run policy_export.py first.")
+            _policies[key] = lambda obs: exported.predict(obs)[0]
+        else:
+            from backtest_engine import ModelRegistry
+            from walk_forward import ppo_policy
+            _policies[key] = ppo_policy(*ModelRegistry().get(stock_name))
+    return _policies[key]
+
+
+def simulate_chunk(task):
+    """Generate, featurize and trade one chunk of paths; returns per-path results and stage seconds."""
+    from walk_forward import evaluate_windows
+
+    seconds = {}
+    began = time.perf_counter()
+    rng = np.random.default_rng(task['seed'])
+    warmup = task['warmup']
+    paths = synthetic_paths(task['returns'], float(warmup['close'].iloc[-1]), task['n_paths'],
+                            task['length'], task['block'], rng)
+    seconds['bootstrap'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    features, prices, sma_10 = path_features(warmup, paths, task['index'])
+    seconds['indicators'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    policy = load_policy(task['stock'], task['numpy'])
+    seconds['model_load'] = time.perf_counter() - began
+
+    began = time.perf_counter()
+    rows = len(task['index'])
+    starts = np.arange(task['n_paths']) * rows + len(warmup)
+    results = evaluate_windows(policy, features, prices, sma_10, starts, starts + task['length'] - 1,
+                               initial_balance=task['initial_balance'])
+    seconds['simulation'] = time.perf_counter() - began
+
+    results['market_return'] = paths['close'][:, -1] / paths['close'][:, 0] - 1
+    return results, seconds
+
+
+def stress_test(stock_name, bars, n_paths, length, block=24, batch=1024, workers=1, threads=1,
+                numpy_policy=False, initial_balance=10000, seed=0):
+    """Trade n_paths bootstrapped paths of ``length`` bars; returns per-path results and timings.
+
+    bars is the stock's bar history (open/high/low/close/volume, time-indexed).
+    Paths resample all of it and start after its last WARMUP_BARS bars before
+    the final ``length``; their bars take the timestamps of that final stretch.
+    """
+    if len(bars) < WARMUP_BARS + length + 1:
+        raise ValueError(f"Need at least {WARMUP_BARS + length + 1} bars for {length}-bar paths, got {len(bars)}.")
+    warmup = bars.iloc[-(WARMUP_BARS + length):-length]
+    index = bars.index[-(WARMUP_BARS + length):]
+    returns = BarReturns(bars)
+
+    chunk_sizes = [min(batch, n_paths - start) for start in range(0, n_paths, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    tasks = [{'stock': stock_name, 'numpy': numpy_policy, 'warmup': warmup, 'index': index, 'returns': returns,
+              'n_paths': size, 'length': length, 'block': block, 'seed': chunk_seed,
+              'initial_balance': initial_balance}
+             for size, chunk_seed in zip(chunk_sizes, seeds)]
+
+    began = time.perf_counter()
+    if workers > 1:
+        with _environment(thread_limits(threads)), \
+                ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn'),
+                                    initializer=_worker_init, initargs=(threads,)) as pool:
+            chunks = list(pool.map(simulate_chunk, tasks))
+    else:
+        chunks = [simulate_chunk(task) for task in tasks]
+    elapsed = time.perf_counter() - began
+
+    results = {key: np.concatenate([chunk[key] for chunk, _ in chunks]) for key in chunks[0][0]}
+    stage_seconds = {stage: sum(seconds[stage] for _, seconds in chunks) for stage in chunks[0][1]}
+    return results, {'seconds': elapsed, 'stage_seconds': stage_seconds, 'workers': workers,
+                     'paths_per_second': n_paths / elapsed}
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def summarize(results, timings, initial_balance=10000):
+    returns = results['final_net_worth'] / initial_balance - 1
+    drawdowns = results['max_drawdown']
+    losses = -returns
+    summary = {
+        'paths': len(returns),
+        'return_mean_percentage': returns.mean() * 100,
+        'return_std_percentage': returns.std() * 100,
+        'return_percentiles': {p: v * 100 for p, v in zip(PERCENTILES, np.percentile(returns, PERCENTILES))},
+        'probability_of_loss': float((returns < 0).mean()),
+        'market_return_percentiles': {p: v * 100 for p, v in
+                                      zip(PERCENTILES, np.percentile(results['market_return'], PERCENTILES))},
+        'max_drawdown_percentiles': {p: v * 100 for p, v in zip([50, 95, 99], np.percentile(drawdowns, [50, 95, 99]))},
+        'worst_drawdown_percentage': drawdowns.max() * 100,
+        'mean_trades': results['trades'].mean(),
+    }
+    for level in (95, 99):
+        var = np.percentile(losses, level)
+        summary[f'var_{level}_percentage'] = var * 100
+        summary[f'cvar_{level}_percentage'] = losses[losses >= var].mean() * 100
+    summary.update(timings)
+    return {key: (float(value) if isinstance(value, np.floating) else
+                  {k: float(v) for k, v in value.items()} if isinstance(value, dict) else value)
+            for key, value in summary.items()}
+
+
+def print_summary(stock_name, summary, length, block):
+    def row(values):
+        return '  '.join(f"p{p}: {v:7.2f}%" for p, v in values.items())
+
+    print(f"{stock_name}: {summary['paths']} paths of {length} bars (blocks of {block})")
+    print(f"  return         {row(summary['return_percentiles'])}")
+    print(f"  buy and hold   {row(summary['market_return_percentiles'])}")
+    print(f"  max drawdown   {row(summary['max_drawdown_percentiles'])}  worst: {summary['worst_drawdown_percentage']:.2f}%")
+    print(f"  mean return {summary['return_mean_percentage']:.2f}% (std {summary['return_std_percentage']:.2f}%), "
+          f"P(loss) {summary['probability_of_loss']:.1%}, {summary['mean_trades']:.1f} trades per path")
+    print(f"  VaR 95% {summary['var_95_percentage']:.2f}%  CVaR 95% {summary['cvar_95_percentage']:.2f}%  "
+          f"VaR 99% {summary['var_99_percentage']:.2f}%  CVaR 99% {summary['cvar_99_percentage']:.2f}%")
+    stages = ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in summary['stage_seconds'].items())
+    print(f"  {summary['seconds']:.1f}s on {summary['workers']} worker(s): "
+          f"{summary['paths_per_second']:.0f} paths/s (CPU time: {stages})")
+
+
+def load_bars(stock_name, start, end, api=None):
+    import Backtest_bot
+    from bar_cache import BarCache
+
+    return BarCache(api or Backtest_bot.get_api()).get_bars(STOCK_MAPPINGS[stock_name], '1H', start=start, end=end,
+                                                            feed='iex')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('stock', choices=list(STOCK_MAPPINGS))
+    parser.add_argument('--paths', type=int, default=5000)
+    parser.add_argument('--block', type=int, default=24, help="Bars per bootstrap block")
+    parser.add_argument('--days', type=int, default=365, help="History the paths are resampled from")
+    parser.add_argument('--path-days', type=int, default=90, help="Each path is as long as this many days of bars")
+    parser.add_argument('--batch', type=int, default=1024, help="Paths per chunk (one batched run)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processes running chunks")
+    parser.add_argument('--threads', type=int, default=1, help="Torch and BLAS threads per worker")
+    parser.add_argument('--numpy', action='store_true', help="Use the exported NumPy policy instead of PPO")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="Also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    end = pd.Timestamp(datetime.now().date(), tz='UTC')
+    bars = load_bars(args.stock, end - timedelta(days=args.days), end)
+    length = int((bars.index >= end - timedelta(days=args.path_days)).sum())
+    workers = max(1, min(args.workers, -(-args.paths // args.batch)))
+    try:
+        results, timings = stress_test(args.stock, bars, args.paths, length, args.block, args.batch, workers,
+                                       args.threads, args.numpy, seed=args.seed)
+    except (ValueError, FileNotFoundError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    summary = summarize(results, timings)
+    print_summary(args.stock, summary, length, args.block)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'stock': args.stock, 'length': length, 'block': args.block, **summary}, f, indent=2)
+        print(f"Summary saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Parallel PPO hyperparameter sweep with successive halving and a sqlite leaderboard.
+
+Trials sample PPO settings from a search space and train on the first part
+of each stock's stored features. They are scored by the return of a
+deterministic run over the held-out tail. All trials start with a small
+timestep budget. After each rung only the best 1/eta of them (per stock)
+keep training with eta times the budget, so bad configurations stop early.
+
+Trials run in a process pool. Each worker is pinned to its own CPU cores
+and opens the same memory-mapped feature files, so the dataset is loaded
+once, not once per trial.
+
+Usage: python sweep.py [--stocks Apple Tesla] [--trials 16] [--workers 4] [--space space.json]
+"""
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import STOCK_MAPPINGS
+
+# Default search space: a list is a choice; {"log_uniform"|"uniform"|"int": [low, high]} a range
+SEARCH_SPACE = {
+    'learning_rate': {'log_uniform': [1e-5, 1e-3]},
+    'n_steps': [1024, 2048, 4096],
+    'batch_size': [64, 128, 256],
+    'gamma': [0.95, 0.98, 0.99],
+    'gae_lambda': {'uniform': [0.85, 0.98]},
+    'clip_range': [0.1, 0.2, 0.3],
+    'ent_coef': {'log_uniform': [1e-4, 5e-2]},
+}
+
+SWEEP_DB = 'sweeps.sqlite'
+SWEEP_DIR = os.path.join('models', 'sweeps')
+# Fraction of the stored bars held out (at the end) for scoring
+VALIDATION_FRACTION = 0.2
+
+
+def sample_params(space, rng):
+    params = {}
+    for name, spec in space.items():
+        if isinstance(spec, list):
+            params[name] = rng.choice(spec)
+        elif 'log_uniform' in spec:
+            low, high = spec['log_uniform']
+            params[name] = math.exp(rng.uniform(math.log(low), math.log(high)))
+        elif 'uniform' in spec:
+            params[name] = rng.uniform(*spec['uniform'])
+        elif 'int' in spec:
+            params[name] = rng.randint(*spec['int'])
+        else:
+            raise ValueError(f"Unsupported search space entry for {name}: {spec}")
+    return params
+
+
+def rung_budgets(min_timesteps, max_timesteps, eta):
+    budgets = [min_timesteps]
+    while budgets[-1] * eta <= max_timesteps:
+        budgets.append(budgets[-1] * eta)
+    return budgets
+
+
+# ---------------------------------------------------------------------------
+# Leaderboard
+# ---------------------------------------------------------------------------
+
+def open_leaderboard(path=SWEEP_DB):
+    db = sqlite3.connect(path)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS trials (
+            sweep TEXT, trial INTEGER, stock TEXT, params TEXT, status TEXT,
+            rung INTEGER, timesteps INTEGER, score REAL, seconds REAL, updated_at REAL,
+            PRIMARY KEY (sweep, trial)
+        )""")
+    return db
+
+
+def record(db, sweep_id, trial, **fields):
+    fields['updated_at'] = time.time()
+    columns = ', '.join(fields)
+    db.execute(f"INSERT INTO trials (sweep, trial, {columns}) VALUES (?, ?, {', '.join('?' * len(fields))}) "
+               f"ON CONFLICT (sweep, trial) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in fields)}",
+               (sweep_id, trial, *fields.values()))
+    db.commit()
+
+
+def leaderboard(db, sweep_id=None, limit=10):
+    query = "SELECT sweep, trial, stock, status, timesteps, score, params FROM trials"
+    args = ()
+    if sweep_id:
+        query += " WHERE sweep = ?"
+        args = (sweep_id,)
+    query += " ORDER BY stock, timesteps DESC, score DESC"
+    rows = db.execute(query, args).fetchall()
+    best = {}
+    for row in rows:
+        best.setdefault(row[2], []).append(row)
+    return {stock: stock_rows[:limit] for stock, stock_rows in best.items()}
+
+
+# ---------------------------------------------------------------------------
+# Workers
+# ---------------------------------------------------------------------------
+
+def _pin_worker(core_sets):
+    """Pool initializer: claim a free set of cores and size torch's thread pool to it."""
+    cores = core_sets.get()
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(len(cores))
+    import torch
+    torch.set_num_threads(len(cores))
+
+
+def run_trial(task):
+    """Train one trial up to task['timesteps'] (resuming its saved state) and score it."""
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import VecNormalize
+
+    import train_model
+    from feature_store import FeatureSet
+    from walk_forward import evaluate_windows, ppo_policy
+
+    start = time.perf_counter()
+    data = FeatureSet.open(task['features_path'])
+    split = int(len(data) * (1 - VALIDATION_FRACTION))
+    train_set, validation = data.slice(0, split), data.slice(split)
+
+    model_path = os.path.join(task['trial_dir'], 'model.zip')
+    env_path = os.path.join(task['trial_dir'], 'normalize.pkl')
+    env = train_model.make_env(train_set, task['n_envs'], 'batch', train_model.episode_length, task['seed'])
+    if os.path.exists(model_path):
+        env = VecNormalize.load(env_path, env)
+        model = PPO.load(model_path, env=env)
+    else:
+        params = dict(train_model.PPO_PARAMS, **task['params'])
+        params['n_steps'] = max(params['n_steps'] // task['n_envs'], 64)
+        env = VecNormalize(env, norm_obs=True, norm_reward=True, gamma=params['gamma'])
+        model = PPO('MlpPolicy', env, verbose=0, seed=task['seed'], **params)
+
+    model.learn(total_timesteps=task['timesteps'] - model.num_timesteps, reset_num_timesteps=False)
+    os.makedirs(task['trial_dir'], exist_ok=True)
+    model.save(model_path)
+    env.save(env_path)
+
+    results = evaluate_windows(ppo_policy(model, env), validation.features, validation.prices,
+                               validation.sma_10, [0], [len(validation) - 1])
+    score = float(results['final_net_worth'][0] / 10000 - 1) * 100
+    return task['trial'], model.num_timesteps, score, time.perf_counter() - start
+
+
+# ---------------------------------------------------------------------------
+# Sweep
+# ---------------------------------------------------------------------------
+
+def sweep(stock_names, n_trials, min_timesteps, max_timesteps, eta=3, workers=None, threads=1,
+          space=SEARCH_SPACE, n_envs=16, seed=0, db_path=SWEEP_DB):
+    """Successive-halving sweep of n_trials configurations per stock; returns the sweep id."""
+    import train_model
+
+    sweep_id = time.strftime('%Y%m%d-%H%M%S')
+    db = open_leaderboard(db_path)
+    rng = random.Random(seed)
+
+    # Load (or build) every stock's features once; workers memory-map the same files
+    features = {stock_name: train_model.load_training_features(stock_name).path for stock_name in stock_names}
+
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    workers = workers or max(1, len(cores) // threads)
+    ctx = mp.get_context('spawn')
+    core_sets = ctx.Queue()
+    for i in range(workers):
+        core_sets.put({cores[(i * threads + j) % len(cores)] for j in range(threads)})
+
+    tasks = {}
+    for stock_name in stock_names:
+        for _ in range(n_trials):
+            trial = len(tasks)
+            tasks[trial] = {
+                'trial': trial,
+                'stock': stock_name,
+                'features_path': features[stock_name],
+                'params': sample_params(space, rng),
+                'trial_dir': os.path.join(SWEEP_DIR, sweep_id, f"trial_{trial}"),
+                'n_envs': n_envs,
+                'seed': seed + trial,
+            }
+            record(db, sweep_id, trial, stock=stock_name, params=json.dumps(tasks[trial]['params']),
+                   status='queued', rung=0, timesteps=0)
+
+    alive = list(tasks)
+    budgets = rung_budgets(min_timesteps, max_timesteps, eta)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_pin_worker,
+                             initargs=(core_sets,)) as pool:
+        for rung, budget in enumerate(budgets):
+            print(f"Rung {rung}: {len(alive)} trial(s) to {budget} timesteps")
+            for trial in alive:
+                record(db, sweep_id, trial, status='running', rung=rung)
+            scores = {}
+            for trial, timesteps, score, seconds in pool.map(run_trial, [dict(tasks[t], timesteps=budget) for t in alive]):
+                scores[trial] = score
+                record(db, sweep_id, trial, timesteps=timesteps, score=score, seconds=seconds)
+                print(f"  trial {trial:3d} {tasks[trial]['stock']:<10} {timesteps:>8} steps  "
+                      f"validation return {score:7.2f}%  ({seconds:.0f}s)")
+
+            if rung == len(budgets) - 1:
+                for trial in alive:
+                    record(db, sweep_id, trial, status='complete')
+                break
+            survivors = []
+            for stock_name in stock_names:
+                ranked = sorted((t for t in alive if tasks[t]['stock'] == stock_name), key=scores.get, reverse=True)
+                keep = max(1, len(ranked) // eta)
+                survivors += ranked[:keep]
+                for trial in ranked[keep:]:
+                    record(db, sweep_id, trial, status='pruned')
+            alive = survivors
+
+    db.close()
+    return sweep_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stocks', nargs='+', choices=list(STOCK_MAPPINGS), default=list(STOCK_MAPPINGS))
+    parser.add_argument('--trials', type=int, default=16, help="Configurations sampled per stock")
+    parser.add_argument('--min-timesteps', type=int, default=50000, help="Budget of the first rung")
+    parser.add_argument('--max-timesteps', type=int, default=1000000, help="Largest rung budget")
+    parser.add_argument('--eta', type=int, default=3, help="Keep the best 1/eta trials at each rung")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel trials (default: cores / threads)")
+    parser.add_argument('--threads', type=int, default=1, help="CPU cores pinned to each trial")
+    parser.add_argument('--n-envs', type=int, default=16, help="Batched envs per trial")
+    parser.add_argument('--space', default=None, help="JSON file with the search space")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', default=SWEEP_DB)
+    args = parser.parse_args()
+
+    space = SEARCH_SPACE
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    sweep_id = sweep(args.stocks, args.trials, args.min_timesteps, args.max_timesteps, args.eta, args.workers,
+                     args.threads, space, args.n_envs, args.seed, args.db)
+
+    db = open_leaderboard(args.db)
+    print(f"\nLeaderboard for sweep {sweep_id} ({args.db}):")
+    for stock_name, rows in leaderboard(db, sweep_id, limit=3).items():
+        for _, trial, _, status, timesteps, score, params in rows:
+            print(f"  {stock_name:<10} trial {trial:3d} {status:<9} {timesteps:>8} steps  {score:7.2f}%  {params}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Regenerate tests/data/indicators_reference.csv with pandas_ta, the library indicators.py replaced.
+
+The calls are the ones train_model.py made before indicators.py existed.
+pandas_ta 0.3.14b0 is no longer on PyPI; its maintained fork
+pandas_ta_classic (0.3.14b1) is used when pandas_ta is not installed.
+
+Usage: python tests/make_indicator_reference.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fixtures import synthetic_ohlcv
+
+REFERENCE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'indicators_reference.csv')
+REFERENCE_BARS = 200
+REFERENCE_SEED = 11
+
+
+def _pandas_ta():
+    try:
+        import pandas_ta
+    except ImportError:
+        import pandas_ta_classic as pandas_ta
+    return pandas_ta
+
+
+def reference_frame():
+    ta = _pandas_ta()
+    data = synthetic_ohlcv(REFERENCE_BARS, seed=REFERENCE_SEED)
+    data['RSI'] = ta.rsi(data['close'], length=14)
+    macd = ta.macd(data['close'], fast=12, slow=26, signal=9)
+    data['MACD'] = macd['MACD_12_26_9']
+    data['MACD_hist'] = macd['MACDh_12_26_9']
+    data['MACD_signal'] = macd['MACDs_12_26_9']
+    data['SMA_10'] = data['close'].rolling(window=10).mean()
+    data['SMA_20'] = data['close'].rolling(window=20).mean()
+    data['SMA_50'] = data['close'].rolling(window=50).mean()
+    data['STD_20'] = data['close'].rolling(window=20).std()
+    data['Upper_Band'] = data['SMA_20'] + (2 * data['STD_20'])
+    data['Lower_Band'] = data['SMA_20'] - (2 * data['STD_20'])
+    data['ATR'] = ta.atr(data['high'], data['low'], data['close'], length=14)
+    data['VWAP'] = ta.vwap(data['high'], data['low'], data['close'], data['volume'])
+    stoch = ta.stoch(data['high'], data['low'], data['close'], k=14, d=3)
+    data['Stochastic_K'] = stoch['STOCHk_14_3_3']
+    data['Stochastic_D'] = stoch['STOCHd_14_3_3']
+    data['CCI'] = ta.cci(data['high'], data['low'], data['close'], length=14)
+    data['OBV'] = ta.obv(data['close'], data['volume'])
+    return data
+
+
+if __name__ == '__main__':
+    os.makedirs(os.path.dirname(REFERENCE_PATH), exist_ok=True)
+    reference_frame().to_csv(REFERENCE_PATH, float_format='%.17g')
+    print(f"Wrote {REFERENCE_PATH} (pandas_ta {_pandas_ta().version})")
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import backtest_engine
+import Backtest_bot
+from backtest_engine import ModelRegistry
+from constants import STOCK_MAPPINGS
+
+
+@pytest.fixture
+def model_files(tmp_path, monkeypatch):
+    """policy_paths pointing at small files in tmp_path, and a slow, counting PPO.load."""
+    loads = []
+
+    def policy_paths(stock_name):
+        paths = tmp_path / f"{stock_name}.zip", tmp_path / f"{stock_name}.pkl"
+        return str(paths[0]), str(paths[1])
+
+    # Written up front: creating them on first lookup races with the mtimes other threads read
+    for stock_name in STOCK_MAPPINGS:
+        for path in policy_paths(stock_name):
+            with open(path, 'wb') as f:
+                f.write(b'\x80\x04N.')  # pickled None
+
+    def slow_load(path):
+        loads.append((path, time.perf_counter()))
+        time.sleep(0.2)
+        return object()
+
+    monkeypatch.chdir(tmp_path)  # model_files_lock keeps its lock files under models/
+    monkeypatch.setattr(Backtest_bot, 'policy_paths', policy_paths)
+    monkeypatch.setattr(backtest_engine.PPO, 'load', slow_load)
+    return loads
+
+
+def run_concurrently(fn, args):
+    results = [None] * len(args)
+    threads = [threading.Thread(target=lambda i=i: results.__setitem__(i, fn(args[i]))) for i in range(len(args))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_cold_loads_of_different_stocks_overlap(model_files):
+    registry = ModelRegistry()
+    began = time.perf_counter()
+    run_concurrently(registry.get, ['Apple', 'Tesla', 'Google'])
+    assert len(model_files) == 3
+    assert time.perf_counter() - began < 0.5
+    assert sorted(registry.loaded()) == ['Apple', 'Google', 'Tesla']
+
+
+def test_concurrent_requests_for_one_stock_load_once(model_files):
+    registry = ModelRegistry()
+    results = run_concurrently(registry.get, ['Apple'] * 4)
+    assert len(model_files) == 1
+    assert len({id(model) for model, _ in results}) == 1
+
+
+def test_failed_load_is_retried(model_files, monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(backtest_engine.PPO, 'load', lambda path: (_ for _ in ()).throw(ValueError("corrupt")))
+    with pytest.raises(ValueError):
+        registry.get('Apple')
+    monkeypatch.setattr(backtest_engine.PPO, 'load', lambda path: object())
+    model, normalizer = registry.get('Apple')
+    assert normalizer is None and registry.loaded() == ['Apple']
+
+
+@pytest.fixture
+def engine(model_files, monkeypatch):
+    """A BacktestEngine over counted bar fetches and a stub backtest run."""
+    from benchmarks.fixtures import synthetic_ohlcv
+
+    fetches = []
+    runs = []
+
+    def fetch(stock_name):
+        fetches.append(stock_name)
+        return synthetic_ohlcv(300, seed=1)
+
+    def run_backtest(stock_name, data, model, normalizer):
+        runs.append(stock_name)
+        time.sleep(0.2)
+        return {'stock': stock_name, 'series': {}}
+
+    monkeypatch.setattr(Backtest_bot, 'fetch_backtest_bars', fetch)
+    monkeypatch.setattr(Backtest_bot, 'run_backtest', run_backtest)
+    monkeypatch.setattr(Backtest_bot, 'save_results', lambda stock_name, results: {'stock': stock_name})
+    engine = backtest_engine.BacktestEngine(bars_ttl=60)
+    yield engine, fetches, runs
+    engine.shutdown()
+
+
+def test_cache_hit_within_the_bars_ttl_fetches_nothing(engine):
+    engine, fetches, runs = engine
+    first = engine.backtest('Apple')
+    assert engine.backtest('Apple') == first
+    assert fetches == ['Apple'] and runs == ['Apple']
+
+    engine.bars_ttl = 0
+    assert engine.backtest('Apple') == first  # Refetched, but the same bars
+    assert fetches == ['Apple'] * 2 and runs == ['Apple']
+
+
+def test_requests_after_a_retrain_do_not_join_the_old_run(engine):
+    import asyncio
+    import os
+
+    engine, fetches, runs = engine
+    model_path = Backtest_bot.policy_paths('Apple')[0]
+
+    async def requests():
+        first = asyncio.ensure_future(engine.run('Apple'))
+        same = asyncio.ensure_future(engine.run('Apple'))
+        await asyncio.sleep(0.05)
+        with open(model_path, 'ab') as f:
+            f.write(b'retrained')
+        os.utime(model_path, ns=(time.time_ns(), time.time_ns() + 1))
+        retrained = asyncio.ensure_future(engine.run('Apple'))
+        return await asyncio.gather(first, same, retrained)
+
+    first, same, retrained = asyncio.run(requests())
+    assert first == same and retrained[0] != first[0]
+    assert runs == ['Apple'] * 2
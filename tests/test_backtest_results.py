@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+import pytest
+
+import backtest_results
+from backtest_results import BacktestResults, summarize
+
+
+@pytest.fixture
+def saved(tmp_path):
+    """A 10-bar backtest saved and read back."""
+    rng = np.random.default_rng(0)
+    net_worth = 10000 + np.cumsum(rng.normal(0, 50, 10))
+    results = summarize('Apple', rng.integers(0, 3, 10), rng.normal(0, 0.01, 10), net_worth)
+    path = backtest_results.save('Apple', results, str(tmp_path / 'results.npz'))
+    return results, BacktestResults(path)
+
+
+def test_round_trip_keeps_summary_and_typed_series(saved):
+    results, loaded = saved
+
+    assert loaded.summary == {key: value for key, value in results.items() if key != 'series'}
+    assert loaded.summary['bars'] == len(loaded) == 10
+    for name, dtype in backtest_results.SERIES_DTYPES.items():
+        assert loaded.series[name].dtype == dtype
+        np.testing.assert_array_equal(loaded.series[name], results['series'][name])
+
+
+def test_pages_cover_the_series_once(saved):
+    _, loaded = saved
+    pages = [loaded.page(0, 4)]
+    while pages[-1]['next_offset'] is not None:
+        pages.append(loaded.page(pages[-1]['next_offset'], 4))
+
+    assert [page['offset'] for page in pages] == [0, 4, 8]
+    assert [len(page['series']['net_worth']) for page in pages] == [4, 4, 2]
+    assert all(page['total'] == 10 for page in pages)
+    joined = sum((page['series']['net_worth'] for page in pages), [])
+    np.testing.assert_array_equal(np.float32(joined), loaded.series['net_worth'])
+    assert loaded.page(10, 4)['series']['net_worth'] == []
+
+
+def test_downsampled_page_and_stream(saved):
+    _, loaded = saved
+    page = loaded.page(0, 100, every=3)
+    series = loaded.series
+
+    # Buckets [0:3], [3:6], [6:9], [9:10]: last action and net worth, summed reward
+    assert page['total'] == 4 and page['next_offset'] is None
+    assert page['series']['action'] == series['action'][[2, 5, 8, 9]].tolist()
+    assert page['series']['net_worth'] == series['net_worth'][[2, 5, 8, 9]].tolist()
+    np.testing.assert_allclose(page['series']['reward'],
+                               [series['reward'][i:i + 3].sum() for i in (0, 3, 6, 9)], rtol=1e-6)
+
+    lines = [json.loads(line) for line in loaded.stream(every=3, chunk_bars=3)]
+    assert lines[0] == loaded.summary
+    assert [line['offset'] for line in lines[1:]] == [0, 3]
+    assert sum((line['net_worth'] for line in lines[1:]), []) == page['series']['net_worth']
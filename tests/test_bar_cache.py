@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from bar_cache import BarCache
+from benchmarks.fixtures import FakeBarsApi
+
+
+class FakeRest(FakeBarsApi):
+    """FakeBarsApi that records each request and can answer empty or fail for chosen ranges."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+        self.empty = False
+        self.fail_after = None  # raise for requests starting at or after this time
+
+    def get_bars(self, symbol, timeframe, start=None, end=None, feed=None, **kwargs):
+        self.requests.append((pd.Timestamp(start), pd.Timestamp(end)))
+        if self.fail_after is not None and pd.Timestamp(start) >= self.fail_after:
+            raise ConnectionError("simulated network failure")
+        bars = super().get_bars(symbol, timeframe, start=start, end=end, feed=feed)
+        if self.empty:
+            bars.df = bars.df.iloc[:0]
+        return bars
+
+
+@pytest.fixture
+def api():
+    return FakeRest()
+
+
+@pytest.fixture
+def cache(api, tmp_path):
+    return BarCache(api, root=str(tmp_path))
+
+
+def ts(value):
+    return pd.Timestamp(value, tz='UTC')
+
+
+def test_second_call_is_served_from_disk(api, cache):
+    first = cache.get_bars('AAPL', '1H', start='2021-01-04', end='2021-02-01')
+    assert len(api.requests) == 1 and not first.empty
+
+    second = BarCache(api, root=cache.root).get_bars('AAPL', '1H', start='2021-01-04', end='2021-02-01')
+    assert len(api.requests) == 1
+    pd.testing.assert_frame_equal(first, second, check_freq=False)
+
+    inner = cache.get_bars('AAPL', '1H', start='2021-01-10', end='2021-01-20')
+    assert len(api.requests) == 1
+    assert inner.index.min() >= ts('2021-01-10') and inner.index.max() < ts('2021-01-20')
+
+
+def test_only_missing_ranges_are_requested(api, cache):
+    cache.get_bars('AAPL', '1H', start='2021-01-04', end='2021-01-15')
+    cache.get_bars('AAPL', '1H', start='2021-01-01', end='2021-01-20')
+    assert api.requests[1:] == [(ts('2021-01-01'), ts('2021-01-04')), (ts('2021-01-15'), ts('2021-01-20'))]
+
+
+def test_empty_answer_on_trading_days_is_asked_again(api, cache):
+    api.empty = True
+    assert cache.get_bars('AAPL', '1H', start='2021-01-04', end='2021-01-09').empty
+
+    api.empty = False
+    bars = cache.get_bars('AAPL', '1H', start='2021-01-04', end='2021-01-09')
+    assert len(api.requests) == 2 and not bars.empty
+
+
+def test_empty_answer_for_a_weekend_is_final(api, cache):
+    api.empty = True
+    # Saturday 2021-01-09 and Sunday 2021-01-10, New York time
+    cache.get_bars('AAPL', '1H', start='2021-01-09T06:00', end='2021-01-11T06:00')
+    cache.get_bars('AAPL', '1H', start='2021-01-09T06:00', end='2021-01-11T06:00')
+    assert len(api.requests) == 1
+
+
+def test_failed_gap_keeps_bars_of_earlier_gaps(api, cache):
+    cache.get_bars('AAPL', '1H', start='2021-01-11', end='2021-01-18')
+    api.fail_after = ts('2021-01-18')
+    with pytest.raises(ConnectionError):
+        cache.get_bars('AAPL', '1H', start='2021-01-04', end='2021-01-25')
+
+    bars, covered = cache.load('AAPL', '1H')
+    assert bars.index.min() < ts('2021-01-05')
+    assert covered == [(ts('2021-01-04'), ts('2021-01-18'))]
+
+    api.fail_after = None
+    cache.get_bars('AAPL', '1H', start='2021-01-04', end='2021-01-25')
+    assert api.requests[-1] == (ts('2021-01-18'), ts('2021-01-25'))
+
+
+def test_recent_bars_are_fetched_again(api, cache):
+    now = pd.Timestamp.now(tz='UTC').floor('h')
+    cache.get_bars('AAPL', '1H', start=now - pd.Timedelta(days=5), end=now)
+    cache.get_bars('AAPL', '1H', start=now - pd.Timedelta(days=5), end=now)
+    assert len(api.requests) == 2
+    assert api.requests[1][0] >= now - pd.Timedelta(days=1, hours=1)
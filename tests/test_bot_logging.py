@@ -0,0 +1,76 @@
+import atexit
+import json
+import logging
+import os
+import time
+
+import pytest
+
+import bot_logging
+from bot_logging import SAMPLED, log_path, setup_logging
+
+
+@pytest.fixture
+def log_to(tmp_path, monkeypatch):
+    """setup_logging for one test: returns a function that stops the listener and reads the lines written."""
+    monkeypatch.setattr(bot_logging, 'LOG_DIR', str(tmp_path / 'logs'))
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    listeners = []
+
+    def start(name, **kwargs):
+        path = log_path(name)
+        listeners.append(setup_logging(path, **kwargs))
+        return path
+
+    def read(path):
+        for listener in listeners:
+            listener.stop()
+            atexit.unregister(listener.stop)
+        listeners.clear()
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    yield start, read
+    for listener in listeners:
+        listener.stop()
+        atexit.unregister(listener.stop)
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_each_process_logs_to_its_own_file(log_to, tmp_path):
+    start, read = log_to
+    path = start('interactive_bot_Apple')
+    logging.info("Trade placed", extra={'order_id': 'abc'})
+
+    assert path == os.path.join(str(tmp_path / 'logs'), 'interactive_bot_Apple.jsonl')
+    [entry] = read(path)
+    assert entry['msg'] == "Trade placed" and entry['order_id'] == 'abc' and entry['level'] == 'INFO'
+
+
+def test_repeated_sampled_records_are_counted_not_written(log_to):
+    start, read = log_to
+    path = start('sampled', sample_interval=0.2)
+    for _ in range(5):
+        logging.info("Market is closed. Skipping trade.", extra=SAMPLED)
+    logging.info("Trade placed")  # Not sampled: always written
+    logging.info("Trade placed")
+    time.sleep(0.25)
+    logging.info("Market is closed. Skipping trade.", extra=SAMPLED)
+
+    entries = read(path)
+    assert [entry['msg'] for entry in entries] == ["Market is closed. Skipping trade.", "Trade placed",
+                                                   "Trade placed", "Market is closed. Skipping trade."]
+    assert 'suppressed' not in entries[0] and entries[-1]['suppressed'] == 4
+
+
+def test_log_file_rotates(log_to):
+    start, read = log_to
+    path = start('rotating', max_bytes=500, backups=2)
+    for i in range(50):
+        logging.info(f"line {i}")
+
+    entries = read(path)
+    assert os.path.exists(f"{path}.1") and os.path.exists(f"{path}.2") and not os.path.exists(f"{path}.3")
+    assert entries[-1]['msg'] == "line 49" and os.path.getsize(path) <= 500
@@ -0,0 +1,187 @@
+import json
+import multiprocessing
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import alpaca_trade_api as tradeapi
+import pytest
+
+import broker_client
+from broker_client import BrokerClient
+from constants import STOCK_MAPPINGS
+
+NOW = '2025-01-02T15:00:00Z'
+
+
+class FakeAlpaca(BaseHTTPRequestHandler):
+    """Minimal Alpaca v2 API; counts requests per endpoint in server.requests."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')[1:]  # drop the version prefix
+        endpoint = f"{method} /{'/'.join('{symbol}' if p in STOCK_MAPPINGS.values() else p for p in parts)}"
+        server = self.server
+        with server.lock:
+            server.requests[endpoint] += 1
+            server.times.append(time.monotonic())
+            server.total += 1
+            throttled = server.fail_every and server.total % server.fail_every == 0
+        if throttled:
+            return self._send(429, {'message': 'too many requests'})
+
+        if parts == ['clock']:
+            return self._send(200, {'timestamp': NOW, 'is_open': True, 'next_open': NOW, 'next_close': NOW})
+        if parts == ['account']:
+            return self._send(200, {'id': 'fake', 'cash': '100000', 'equity': '100000', 'status': 'ACTIVE'})
+        if parts == ['orders'] and method == 'GET':
+            return self._send(200, [])
+        if parts == ['orders'] and method == 'POST':
+            length = int(self.headers.get('Content-Length', 0))
+            order = json.loads(self.rfile.read(length) or b'{}')
+            return self._send(200, dict(order, id=f"order-{server.total}", status='accepted'))
+        if parts == ['positions']:
+            return self._send(200, [{'symbol': s, 'qty': '10', 'avg_entry_price': '100'}
+                                    for s in STOCK_MAPPINGS.values()])
+        if len(parts) == 2 and parts[0] == 'positions':
+            return self._send(200, {'symbol': parts[1], 'qty': '10', 'avg_entry_price': '100'})
+        if parts == ['stocks', 'trades', 'latest']:
+            symbols = parse_qs(url.query)['symbols'][0].split(',')
+            return self._send(200, {'trades': {s: {'t': NOW, 'p': 101.0, 's': 100} for s in symbols}})
+        if len(parts) == 4 and parts[0] == 'stocks' and parts[2:] == ['trades', 'latest']:
+            return self._send(200, {'symbol': parts[1], 'trade': {'t': NOW, 'p': 101.0, 's': 100}})
+        return self._send(404, {'message': f"unknown endpoint {url.path}"})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def start_server(fail_every=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAlpaca)
+    server.requests = Counter()
+    server.times = []
+    server.total = 0
+    server.fail_every = fail_every
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def direct_loop(api, symbol):
+    """interactive_bot.py's per-iteration calls before BrokerClient."""
+    api.get_clock()
+    if api.list_orders(status='open'):
+        return
+    cash = float(api.get_account().cash)
+    price = float(api.get_latest_trade(symbol).price)
+    api.submit_order(symbol=symbol, qty=int(cash * 0.05 / price), side='buy', type='market', time_in_force='day')
+    api.get_position(symbol)
+    api.get_latest_trade(symbol)
+
+
+def client_loop(client, symbol):
+    """The same iteration through BrokerClient, as interactive_bot.py now does it."""
+    client.get_clock()
+    if client.list_open_orders():
+        return
+    cash = float(client.get_account().cash)
+    price = client.latest_price(symbol)
+    client.submit_order(symbol=symbol, qty=int(cash * 0.05 / price), side='buy', type='market', time_in_force='day')
+    client.get_position(symbol)
+    client.latest_price(symbol)
+
+
+def rest(server, monkeypatch):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setenv('APCA_API_DATA_URL', url)
+    api = tradeapi.REST('key', 'secret', url, api_version='v2')
+    api._retry_wait = 0
+    return api
+
+
+@pytest.fixture
+def server():
+    server = start_server()
+    yield server
+    server.shutdown()
+
+
+def test_client_sends_fewer_requests(server, monkeypatch, tmp_path):
+    api = rest(server, monkeypatch)
+    symbols = list(STOCK_MAPPINGS.values())
+    for symbol in symbols:
+        direct_loop(api, symbol)
+    direct = server.requests.copy()
+
+    server.requests.clear()
+    client = BrokerClient(api, rate=1000, burst=1000, rate_limit_file=str(tmp_path / 'tokens'))
+    for symbol in symbols:
+        client_loop(client, symbol)
+
+    assert direct['GET /clock'] == len(symbols) and server.requests['GET /clock'] == 1
+    assert direct['GET /stocks/{symbol}/trades/latest'] == 2 * len(symbols)
+    assert server.requests['GET /stocks/{symbol}/trades/latest'] == 0
+    assert server.requests['GET /stocks/trades/latest'] == 1  # The whole watchlist, reused within its TTL
+    assert server.requests['POST /orders'] == direct['POST /orders'] == len(symbols)
+    assert sum(server.requests.values()) < sum(direct.values())
+
+
+def test_client_retries_rate_limited_requests(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(broker_client, 'BACKOFF_SECONDS', 0.0)
+    server.fail_every = 3
+    client = BrokerClient(rest(server, monkeypatch), rate=1000, burst=1000, rate_limit_file=str(tmp_path / 'tokens'))
+
+    for symbol in STOCK_MAPPINGS.values():
+        client.invalidate('clock', 'account')
+        assert client.get_clock().is_open
+        assert float(client.get_account().cash) == 100000
+    assert server.total > 2 * len(STOCK_MAPPINGS)
+
+
+def _bot_process(url, rate_limit_file, rate, burst, calls):
+    """One bot process: calls uncached requests through its own BrokerClient."""
+    api = tradeapi.REST('key', 'secret', url, api_version='v2')
+    client = BrokerClient(api, rate=rate, burst=burst, rate_limit_file=rate_limit_file)
+    for _ in range(calls):
+        client.invalidate('clock')
+        client.get_clock()
+
+
+@pytest.mark.parametrize('shared', [True, False])
+def test_rate_limit_is_shared_by_processes(server, tmp_path, shared):
+    rate, burst, processes, calls = 20.0, 2, 3, 10
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    rate_limit_file = str(tmp_path / 'tokens') if shared else None
+    context = multiprocessing.get_context('spawn')
+    bots = [context.Process(target=_bot_process, args=(url, rate_limit_file, rate, burst, calls))
+            for _ in range(processes)]
+    for bot in bots:
+        bot.start()
+    for bot in bots:
+        bot.join()
+    assert all(bot.exitcode == 0 for bot in bots)
+
+    times = sorted(server.times)
+    assert len(times) == processes * calls
+    # The shared bucket lets through at most burst + rate * elapsed requests; separate ones `processes` times that
+    fastest = (len(times) - burst) / rate
+    if shared:
+        assert times[-1] - times[0] >= 0.9 * fastest
+    else:
+        assert times[-1] - times[0] < 0.9 * fastest
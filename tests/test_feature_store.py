@@ -0,0 +1,50 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import synthetic_ohlcv
+from feature_store import FeatureSet, FeatureStore, config_version
+from indicators import add_indicators
+
+
+@pytest.fixture
+def bars():
+    return synthetic_ohlcv(5000, seed=4)
+
+
+def test_chunked_write_matches_whole_series(tmp_path, bars):
+    expected = FeatureSet.from_frame(add_indicators(bars.copy()).dropna())
+    stored = FeatureStore(str(tmp_path)).write('X', '1H', '2020-01-01', '2020-08-01', bars, chunk_bars=1500)
+
+    assert len(stored) == len(expected)
+    np.testing.assert_array_equal(stored.timestamps, expected.timestamps)
+    np.testing.assert_array_equal(stored.prices, expected.prices)
+    np.testing.assert_allclose(stored.sma_10, expected.sma_10, rtol=1e-12)
+    np.testing.assert_allclose(stored.features, expected.features, rtol=1e-6, atol=1e-7)
+
+
+def test_entry_is_memory_mapped_and_pickles_by_path(tmp_path, bars):
+    store = FeatureStore(str(tmp_path))
+    store.write('X', '1H', '2020-01-01', '2020-08-01', bars, chunk_bars=2000)
+    opened = store.open('X', '1H', '2020-01-01', '2020-08-01')
+
+    assert isinstance(opened.features, np.memmap)
+    assert store.path('X', '1H', '2020-01-01', '2020-08-01').endswith(config_version())
+    assert len(pickle.dumps(opened)) < 1000
+    np.testing.assert_array_equal(pickle.loads(pickle.dumps(opened)).features, opened.features)
+
+
+def test_slices_pickle_by_path_and_row_range(tmp_path, bars):
+    store = FeatureStore(str(tmp_path))
+    store.write('X', '1H', '2020-01-01', '2020-08-01', bars, chunk_bars=2000)
+    opened = store.open('X', '1H', '2020-01-01', '2020-08-01')
+    split = int(len(opened) * 0.8)
+
+    # train()'s training / validation split, then the validation windows cut from it
+    for part in (opened.slice(0, split), opened.slice(split), opened.slice(split).slice(10, -10)):
+        assert len(pickle.dumps(part)) < 1000
+        restored = pickle.loads(pickle.dumps(part))
+        assert isinstance(restored.features, np.memmap)
+        np.testing.assert_array_equal(restored.features, part.features)
+        np.testing.assert_array_equal(restored.timestamps, part.timestamps)
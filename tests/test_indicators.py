@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.fixtures import synthetic_ohlcv
+from indicators import INDICATOR_COLUMNS, IndicatorStream, add_indicators, compute_indicators
+from make_indicator_reference import REFERENCE_BARS, REFERENCE_PATH, REFERENCE_SEED
+
+
+def streamed(bars):
+    stream = IndicatorStream()
+    rows = [stream.update(row.open, row.high, row.low, row.close, row.volume, row.Index)
+            for row in bars.itertuples()]
+    return pd.DataFrame(rows, index=bars.index)
+
+
+def flat_and_idle_bars():
+    """Bars with runs of unchanged prices, zero high-low ranges and zero volume."""
+    bars = synthetic_ohlcv(400, seed=3)
+    bars.iloc[100:130, :4] = bars['close'].iloc[99]
+    bars.iloc[200:220, bars.columns.get_loc('volume')] = 0.0
+    return bars
+
+
+# pandas' rolling std of a flat window is ~1e-6 of round-off where the streaming update gives 0
+@pytest.mark.parametrize('bars, atol', [
+    (synthetic_ohlcv(2000, seed=0), 1e-9),
+    (synthetic_ohlcv(500, seed=1, freq='min'), 1e-9),
+    (synthetic_ohlcv(60, seed=2), 1e-9),
+    (flat_and_idle_bars(), 1e-5),
+], ids=['hourly', 'minute', 'short', 'flat'])
+def test_streaming_matches_batch(bars, atol):
+    batch = add_indicators(bars.copy())
+    stream = streamed(bars)
+    for column in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(stream[column], batch[column], rtol=1e-9, atol=atol, equal_nan=True,
+                                   err_msg=column)
+
+
+def test_warm_up_returns_last_bar():
+    bars = synthetic_ohlcv(310, seed=4)
+    stream = IndicatorStream()
+    values = stream.warm_up(bars.iloc[:300])
+    batch = add_indicators(bars.iloc[:300].copy()).iloc[-1]
+    for column in INDICATOR_COLUMNS:
+        assert values[column] == pytest.approx(batch[column], rel=1e-9), column
+
+    # Later bars continue from the warmed-up state
+    for row in bars.iloc[300:].itertuples():
+        values = stream.update(row.open, row.high, row.low, row.close, row.volume, row.Index)
+    expected = add_indicators(bars.copy()).iloc[-1]
+    for column in INDICATOR_COLUMNS:
+        assert values[column] == pytest.approx(expected[column], rel=1e-9), column
+
+
+def test_per_path_columns_match_single_series():
+    bars = [synthetic_ohlcv(300, seed=seed) for seed in (5, 6, 7)]
+    frames = {name: pd.concat([b[name] for b in bars], axis=1, ignore_index=True)
+              for name in ('open', 'high', 'low', 'close', 'volume')}
+    batch = compute_indicators(frames['open'], frames['high'], frames['low'], frames['close'], frames['volume'])
+    for path, single in enumerate(bars):
+        expected = add_indicators(single.copy())
+        for column in INDICATOR_COLUMNS:
+            np.testing.assert_allclose(batch[column][path], expected[column], rtol=1e-12, equal_nan=True,
+                                       err_msg=column)
+
+
+def test_matches_stored_pandas_ta_values():
+    reference = pd.read_csv(REFERENCE_PATH, index_col='timestamp', parse_dates=True)
+    bars = synthetic_ohlcv(REFERENCE_BARS, seed=REFERENCE_SEED)
+    np.testing.assert_allclose(reference[['open', 'high', 'low', 'close', 'volume']], bars, rtol=1e-15)
+
+    batch = add_indicators(bars.copy())
+    stream = streamed(bars)
+    for column in INDICATOR_COLUMNS:
+        np.testing.assert_allclose(batch[column], reference[column], rtol=1e-9, atol=1e-9, equal_nan=True,
+                                   err_msg=column)
+        np.testing.assert_allclose(stream[column], reference[column], rtol=1e-9, atol=1e-9, equal_nan=True,
+                                   err_msg=column)
@@ -0,0 +1,42 @@
+import os
+
+import pandas as pd
+import pytest
+
+import interactive_bot
+from benchmarks.fixtures import FakeBarsApi
+from live_engine import ALLOCATION_PER_SYMBOL
+from performance import PERFORMANCE_FILE, PerformanceTracker
+from replay_broker import replay
+
+
+@pytest.fixture
+def replay_apple(tmp_path, monkeypatch):
+    """Replays interactive_bot on Apple over synthetic bars, in tmp_path."""
+    monkeypatch.chdir(tmp_path)  # Bar cache, metrics and the performance state stay in tmp_path
+    monkeypatch.setattr(interactive_bot, 'load_exported_policy', lambda stock_name: object())
+
+    def run(start, end, **kwargs):
+        return replay('Apple', start, end, api=FakeBarsApi(origin='2024-01-01'), **kwargs)
+    return run
+
+
+def test_bot_book_stays_within_its_allocation(replay_apple, tmp_path):
+    path = str(tmp_path / 'replay_performance.pkl')
+    summary = replay_apple('2024-03-04', '2024-03-20', performance_path=path)
+    assert summary['filled'] > 0
+
+    tracker = PerformanceTracker.load(path)
+    cash, shares, average_cost, _ = tracker.books['AAPL']
+    assert cash >= 0 and shares * average_cost <= ALLOCATION_PER_SYMBOL
+    result = tracker.summary('AAPL')
+    assert result['net_worth'] > 0 and result['max_drawdown_percentage'] < 100
+    # Marked on the replay's clock, not the wall clock
+    assert pd.Timestamp(result['as_of']) <= pd.Timestamp(summary['end'])
+
+
+def test_replay_leaves_the_live_state_alone(replay_apple, tmp_path):
+    summary = replay_apple('2024-03-04', '2024-03-08')
+
+    assert summary['performance']['net_worth'] > 0
+    assert not os.path.exists(PERFORMANCE_FILE) and not os.path.exists('metrics')
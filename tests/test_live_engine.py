@@ -0,0 +1,166 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.fixtures import synthetic_ohlcv
+from indicators import add_indicators
+from live_engine import (BAR_CLOSE_GRACE, Bar, BarAggregator, LiveEngine, SimulatedBroker, SimulatedFeed,
+                         SymbolTrader)
+from trading_env import BALANCE_IDX, SHARES_IDX, build_feature_matrix
+
+
+class ScriptedPolicy:
+    """Records every observation and returns the actions it was given, then holds."""
+
+    def __init__(self, actions=()):
+        self.actions = list(actions)
+        self.observations = []
+
+    def predict(self, obs):
+        self.observations.append(obs.copy())
+        return (self.actions.pop(0) if self.actions else 0), None
+
+
+class ScriptedBroker(SimulatedBroker):
+    """SimulatedBroker whose orders fill after a few status checks, partly and at another price."""
+
+    def __init__(self, fill_ratio=1.0, slippage=0.0, polls_until_filled=0):
+        super().__init__()
+        self.fill_ratio = fill_ratio
+        self.slippage = slippage
+        self.polls_until_filled = polls_until_filled
+        self.polls = 0
+
+    async def submit_order(self, symbol, qty, side):
+        price = self.prices[symbol] * (1 + self.slippage)
+        filled = int(qty * self.fill_ratio)
+        order = {'id': str(len(self.orders)), 'symbol': symbol, 'qty': qty, 'side': side,
+                 'status': 'new', 'filled_qty': 0, 'filled_avg_price': None}
+        self.orders[order['id']] = order
+        self._pending = (order, filled, price)
+        return dict(order)
+
+    async def get_order(self, order_id):
+        order, filled, price = self._pending
+        self.polls += 1
+        if self.polls > self.polls_until_filled and order['status'] == 'new':
+            order.update(status='filled' if filled == order['qty'] else 'canceled',
+                         filled_qty=filled, filled_avg_price=price)
+            self._book(order['symbol'], filled if order['side'] == 'buy' else -filled, price)
+        return dict(order)
+
+
+def minute_bars(symbol, frame):
+    return [Bar(symbol, timestamp, row.open, row.high, row.low, row.close, row.volume, 0.0)
+            for timestamp, row in zip(frame.index, frame.itertuples(index=False))]
+
+
+def resample_hourly(frame):
+    return frame.resample('1h').agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).dropna()
+
+
+def feed_frames(n_hours=30):
+    """Hourly warm-up history and the minute bars of the n_hours after it."""
+    history = synthetic_ohlcv(300, seed=1)
+    minutes = synthetic_ohlcv(n_hours * 60, seed=2, start=history.index[-1] + pd.Timedelta(hours=1), freq='min')
+    minutes[['open', 'high', 'low', 'close']] *= history['close'].iloc[-1] / minutes['open'].iloc[0]
+    return history, minutes
+
+
+def run_engine(traders, frames, broker):
+    engine = LiveEngine(traders, broker, order_poll_interval=0)
+    asyncio.run(engine.run(SimulatedFeed(frames, broker)))
+    return engine
+
+
+def test_aggregator_matches_hourly_resample():
+    _, minutes = feed_frames(5)
+    aggregator = BarAggregator('X')
+    bars = [bar for minute in minute_bars('X', minutes) for bar in aggregator.update(minute)]
+
+    expected = resample_hourly(minutes)
+    assert [bar.timestamp for bar in bars] == list(expected.index)
+    got = np.array([[bar.open, bar.high, bar.low, bar.close, bar.volume] for bar in bars])
+    np.testing.assert_allclose(got, expected.to_numpy())
+
+
+def test_aggregator_closes_a_bar_without_its_last_minute():
+    _, minutes = feed_frames(2)
+    minutes = minutes.drop(minutes.index[59])  # No trades in the last minute of the first hour
+    aggregator = BarAggregator('X')
+    bars = minute_bars('X', minutes)
+
+    assert not any(aggregator.update(bar) for bar in bars[:59])
+    hour_end = minutes.index[0] + pd.Timedelta(hours=1)
+    assert aggregator.close_due(hour_end, 0.0) is None
+    closed = aggregator.close_due(hour_end + BAR_CLOSE_GRACE, 0.0)
+    assert closed.timestamp == minutes.index[0]
+    assert closed.close == minutes['close'].iloc[58]
+    # The next hour's bars start a new bar instead of closing the first one again
+    assert aggregator.update(bars[59]) == []
+    assert aggregator.start == minutes.index[59]
+
+
+def test_aggregator_skips_periods_covered_by_history():
+    history, minutes = feed_frames(2)
+    early = synthetic_ohlcv(30, seed=3, start=history.index[-1] + pd.Timedelta(minutes=30), freq='min')
+    aggregator = BarAggregator('X', after=history.index[-1])
+
+    assert all(aggregator.update(bar) == [] for bar in minute_bars('X', early))
+    assert aggregator.start is None
+    assert len([bar for bar in minute_bars('X', minutes) for bar in aggregator.update(bar)]) == 2
+
+
+def test_engine_decides_on_warmed_up_model_bars():
+    history, minutes = feed_frames()
+    policy = ScriptedPolicy()
+    trader = SymbolTrader('Stock', 'X', policy)
+    trader.warm_up(history)
+    run_engine([trader], {'X': minutes}, SimulatedBroker())
+
+    # One decision per completed hour, starting with the first, on the features of history + resampled minutes
+    hourly = pd.concat([history, resample_hourly(minutes)])
+    expected = build_feature_matrix(add_indicators(hourly))[len(history):]
+    got = np.array(policy.observations)
+    assert got.shape == expected.shape
+    columns = [i for i in range(expected.shape[1]) if i not in (SHARES_IDX, BALANCE_IDX)]
+    np.testing.assert_allclose(got[:, columns], expected[:, columns], rtol=1e-5, atol=1e-6)
+
+
+def test_book_takes_the_broker_fill():
+    history, minutes = feed_frames()
+    trader = SymbolTrader('Stock', 'X', ScriptedPolicy([1] * 30))
+    trader.warm_up(history)
+    broker = ScriptedBroker(fill_ratio=0.5, slippage=0.01, polls_until_filled=2)
+    engine = run_engine([trader], {'X': minutes}, broker)
+
+    buys = [order for order in broker.orders.values() if order['side'] == 'buy' and order['filled_qty']]
+    assert buys
+    assert trader.shares_held == sum(order['filled_qty'] for order in buys) == broker.holdings['X'][0]
+    spent = sum(o['filled_qty'] * o['filled_avg_price'] * (1 + trader.transaction_fee) for o in buys)
+    assert trader.balance == pytest.approx(trader.initial_balance - spent)
+    assert engine.performance.summary('X')['shares_held'] == trader.shares_held
+
+
+def test_book_adopts_external_position_changes():
+    history, minutes = feed_frames()
+    trader = SymbolTrader('Stock', 'X', ScriptedPolicy([1] * 30))
+    trader.warm_up(history)
+    broker = SimulatedBroker()
+    broker.holdings['X'] = (7, 100.0)  # Held before the engine started
+    original_book = broker._book
+
+    def book(symbol, delta, price):
+        original_book(symbol, delta, price)
+        held, entry = broker.holdings[symbol]
+        broker.holdings[symbol] = (held - 2, entry)  # Two shares sold outside the engine
+
+    broker._book = book
+    engine = run_engine([trader], {'X': minutes}, broker)
+
+    assert engine.orders
+    bought = sum(order['qty'] for order in engine.orders)
+    assert trader.shares_held == broker.holdings['X'][0] == 7 + bought - 2 * len(engine.orders)
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from performance import PerformanceTracker, cadence, shared_tracker
+
+T0 = pd.Timestamp('2025-01-02 15:00', tz='UTC')
+
+
+def test_bots_share_one_saved_tracker(tmp_path):
+    path = str(tmp_path / 'performance.pkl')
+    # Two bot processes, each booking its own symbol into the same file
+    for minute, (symbol, price) in enumerate([('AAPL', 100.0), ('TSLA', 200.0), ('AAPL', 110.0)]):
+        with shared_tracker(path) as tracker:
+            if symbol not in tracker.books:
+                tracker.add_symbol(symbol, 10000)
+            tracker.sync_position(symbol, 10, price if symbol == 'TSLA' else 100.0, price,
+                                  T0 + pd.Timedelta(minutes=minute))
+            tracker.on_mark(symbol, price, T0 + pd.Timedelta(minutes=minute))
+
+    tracker = PerformanceTracker.load(path)
+    assert sorted(tracker.books) == ['AAPL', 'TSLA']
+    assert tracker.summary('AAPL')['profit_loss'] == pytest.approx(100.0)  # 10 shares bought at 100, now 110
+    assert tracker.summary()['net_worth'] == pytest.approx(20100.0)
+
+
+def test_sync_position_prices_buys_from_the_average_entry_price():
+    tracker = PerformanceTracker({'AAPL': 10000})
+    tracker.sync_position('AAPL', 10, 100.0, 101.0, T0)
+    tracker.sync_position('AAPL', 20, 105.0, 111.0, T0 + pd.Timedelta(minutes=1))  # Second lot filled at 110
+    tracker.sync_position('AAPL', 5, 105.0, 120.0, T0 + pd.Timedelta(minutes=2))
+
+    cash, shares, average_cost, _ = tracker.books['AAPL']
+    assert shares == 5 and average_cost == pytest.approx(105.0)
+    assert cash == pytest.approx(10000 - 10 * 100 - 10 * 110 + 15 * 120)
+    assert tracker.summary('AAPL')['win_rate'] == 1.0
+
+
+def test_snapshot_is_independent_of_later_events(tmp_path):
+    tracker = PerformanceTracker({'AAPL': 10000})
+    tracker.on_mark('AAPL', 100.0, T0)
+    state = tracker.snapshot()
+    tracker.on_fill('AAPL', 'buy', 10, 100.0, T0 + pd.Timedelta(minutes=1))
+
+    path = str(tmp_path / 'performance.pkl')
+    tracker.save(path, state)
+    assert PerformanceTracker.load(path).books['AAPL'][1] == 0
+
+
+def sharpe_at(marks, mark_interval):
+    sharpe_window, periods_per_year = cadence(mark_interval)
+    tracker = PerformanceTracker({'AAPL': 10000}, sharpe_window=sharpe_window, periods_per_year=periods_per_year)
+    tracker.on_fill('AAPL', 'buy', 100, marks[0], T0)
+    for i, price in enumerate(marks[1:], 1):
+        tracker.on_mark('AAPL', price, T0 + pd.Timedelta(seconds=i * mark_interval))
+    return tracker.summary('AAPL')['sharpe_ratio']
+
+
+def test_sharpe_ratio_does_not_depend_on_the_mark_interval():
+    # Five trading days of minute prices, marked every minute (interactive_bot) or every hour (live_engine)
+    rng = np.random.default_rng(0)
+    minutes = 100 * np.exp(np.cumsum(rng.normal(2e-4, 1e-3, 5 * 390)))
+    by_minute = sharpe_at(minutes, 60)
+    by_hour = sharpe_at(minutes[::60], 3600)
+
+    assert cadence(60)[1] == 252 * 390 and cadence(3600)[1] == 252 * 6.5
+    assert by_minute > 0 and by_hour > 0
+    assert 0.5 < by_hour / by_minute < 2  # Annualizing hourly returns per minute would inflate it ~sqrt(60)x
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import torch
+from stable_baselines3 import PPO
+from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+
+from benchmarks.fixtures import synthetic_features
+from policy_export import NumpyPolicy, policy_from_ppo
+from trading_env import TradingEnv
+
+N_SAMPLES = 20000
+# float32 matmuls in torch and NumPy may sum in different orders
+LOGIT_TOLERANCE = 1e-4
+
+
+def train(policy_kwargs=None):
+    data = synthetic_features(1000, seed=1)
+    env = VecNormalize(DummyVecEnv([lambda: TradingEnv(data)]), norm_obs=True, norm_reward=True)
+    model = PPO('MlpPolicy', env, n_steps=64, batch_size=64, n_epochs=1, verbose=0, seed=0,
+                policy_kwargs=policy_kwargs)
+    model.learn(total_timesteps=256)
+    return model, env
+
+
+@pytest.fixture(scope='module', params=[None, {'activation_fn': torch.nn.ReLU, 'net_arch': [32, 16]}],
+                ids=['default', 'relu'])
+def trained(request):
+    return train(request.param)
+
+
+def sample_observations(normalizer, seed=0):
+    """Raw observations spread over two standard deviations around the training stats."""
+    rng = np.random.default_rng(seed)
+    std = np.sqrt(normalizer.obs_rms.var)
+    return (normalizer.obs_rms.mean + rng.normal(0, 2, (N_SAMPLES, len(std))) * std).astype(np.float32)
+
+
+def ppo_actions_and_logits(model, normalized):
+    actions, _ = model.predict(normalized, deterministic=True)
+    with torch.no_grad():
+        logits = model.policy.get_distribution(torch.as_tensor(normalized)).distribution.logits.numpy()
+    return actions, logits
+
+
+def centered(logits):
+    # Categorical logits are log-probabilities: compare up to the per-row constant
+    return logits - logits.max(axis=1, keepdims=True)
+
+
+def test_export_matches_ppo(trained):
+    model, normalizer = trained
+    numpy_policy = policy_from_ppo(model, normalizer)
+    obs = sample_observations(normalizer)
+    normalized = normalizer.normalize_obs(obs)
+
+    np.testing.assert_allclose(numpy_policy.normalize(obs), normalized, rtol=1e-6, atol=1e-6)
+    expected_actions, expected_logits = ppo_actions_and_logits(model, normalized)
+    actions, _ = numpy_policy.predict(obs)
+    logits = numpy_policy.action_logits(numpy_policy.normalize(obs))
+
+    assert np.mean(actions == expected_actions) == 1.0
+    assert np.abs(centered(logits) - centered(expected_logits)).max() < LOGIT_TOLERANCE
+
+
+def test_saved_export_round_trips(trained, tmp_path):
+    model, normalizer = trained
+    numpy_policy = policy_from_ppo(model, normalizer)
+    path = tmp_path / 'policy.npz'
+    numpy_policy.save(path)
+    loaded = NumpyPolicy.load(path)
+
+    obs = sample_observations(normalizer, seed=1)
+    np.testing.assert_array_equal(loaded.predict(obs)[0], numpy_policy.predict(obs)[0])
+    single, _ = loaded.predict(obs[0])
+    assert np.ndim(single) == 0 and single == numpy_policy.predict(obs[:1])[0][0]
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import synthetic_ohlcv
+from stress_test import BarReturns, _environment, block_bootstrap_indices, summarize, synthetic_paths
+
+
+def test_bootstrap_indices_are_runs_of_consecutive_bars():
+    rows = block_bootstrap_indices(500, 8, 100, 24, np.random.default_rng(0))
+
+    assert rows.shape == (8, 100)
+    assert rows.min() >= 0 and rows.max() < 500
+    # Inside each block of 24 the rows are consecutive
+    steps = np.diff(rows, axis=1)
+    assert (np.delete(steps, np.arange(23, 99, 24), axis=1) == 1).all()
+    np.testing.assert_array_equal(rows, block_bootstrap_indices(500, 8, 100, 24, np.random.default_rng(0)))
+    assert not np.array_equal(rows, block_bootstrap_indices(500, 8, 100, 24, np.random.default_rng(1)))
+
+
+def test_synthetic_paths_keep_each_bar_consistent():
+    bars = synthetic_ohlcv(1000, seed=3)
+    paths = synthetic_paths(BarReturns(bars), 50.0, 16, 200, 24, np.random.default_rng(7))
+
+    for values in paths.values():
+        assert values.shape == (16, 200)
+    assert (paths['high'] >= paths['close']).all() and (paths['close'] >= paths['low']).all()
+    assert (paths['high'] >= paths['open']).all() and (paths['open'] >= paths['low']).all()
+    # Each path continues from the given close
+    assert np.abs(paths['open'][:, 0] / 50.0 - 1).max() < 0.05
+    again = synthetic_paths(BarReturns(bars), 50.0, 16, 200, 24, np.random.default_rng(7))
+    for name, values in paths.items():
+        np.testing.assert_array_equal(values, again[name])
+
+
+def test_summary_var_and_cvar():
+    losses = np.arange(1, 101) / 1000  # 0.1% to 10% loss, one path each
+    results = {'final_net_worth': 10000 * (1 - losses), 'max_drawdown': losses, 'trades': np.ones(100),
+               'market_return': np.zeros(100)}
+    summary = summarize(results, {})
+
+    assert summary['paths'] == 100 and summary['probability_of_loss'] == 1.0
+    assert summary['var_95_percentage'] == pytest.approx(9.505)
+    assert summary['cvar_95_percentage'] == pytest.approx(9.8)
+    assert summary['var_99_percentage'] == pytest.approx(9.901)
+    assert summary['cvar_99_percentage'] == pytest.approx(10.0)
+    assert summary['worst_drawdown_percentage'] == pytest.approx(10.0)
+
+
+def test_worker_thread_limits_are_set_only_while_the_pool_runs(monkeypatch):
+    monkeypatch.setenv('OMP_NUM_THREADS', '8')
+    monkeypatch.delenv('OPENBLAS_NUM_THREADS', raising=False)
+    with _environment({'OMP_NUM_THREADS': '2', 'OPENBLAS_NUM_THREADS': '2'}):
+        assert os.environ['OMP_NUM_THREADS'] == os.environ['OPENBLAS_NUM_THREADS'] == '2'
+    assert os.environ['OMP_NUM_THREADS'] == '8' and 'OPENBLAS_NUM_THREADS' not in os.environ
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import timing
+
+
+def write_metrics(metrics_dir, process, pid, age):
+    path = os.path.join(metrics_dir, f"{process}-{pid}.json")
+    with open(path, 'w') as f:
+        json.dump({'process': process, 'pid': pid, 'stages': {'cycle': timing.Histogram().to_dict()}}, f)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_collect_expires_files_of_exited_processes(tmp_path):
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    metrics_dir = str(tmp_path)
+    old_exited = write_metrics(metrics_dir, 'train_model', exited.pid, age=7200)
+    recent_exited = write_metrics(metrics_dir, 'Backtest_bot', exited.pid, age=10)
+    old_running = write_metrics(metrics_dir, 'interactive_bot', os.getpid(), age=7200)
+
+    processes = timing.collect('app', metrics_dir, retention=3600)
+
+    assert 'train_model' not in processes and not os.path.exists(old_exited)
+    assert 'Backtest_bot' in processes and os.path.exists(recent_exited)
+    assert 'interactive_bot' in processes and os.path.exists(old_running)
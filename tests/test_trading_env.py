@@ -0,0 +1,20 @@
+import pytest
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from benchmarks.fixtures import synthetic_ohlcv
+from feature_store import FeatureSet
+from indicators import add_indicators
+from trading_env import TradingEnv
+
+
+@pytest.mark.parametrize('episode_length, truncated', [(50, True), (None, False)])
+def test_window_ends_are_truncations(episode_length, truncated):
+    data = FeatureSet.from_frame(add_indicators(synthetic_ohlcv(500)).dropna())
+    env = DummyVecEnv([lambda: TradingEnv(data, episode_length=episode_length, random_start=bool(episode_length))])
+    env.seed(0)
+    env.reset()
+    done = [False]
+    while not done[0]:
+        _, _, done, infos = env.step([0])
+    # What PPO reads to bootstrap through the end of a window instead of treating it as terminal
+    assert infos[0]["TimeLimit.truncated"] is truncated
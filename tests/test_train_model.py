@@ -0,0 +1,148 @@
+import json
+import os
+
+import pytest
+
+import train_model
+
+
+@pytest.fixture
+def saved_model(tmp_path, monkeypatch):
+    """A saved model's files in tmp_path; returns a function writing its metadata."""
+    paths = tuple(str(tmp_path / name) for name in ('model.zip', 'normalize.pkl', 'model.json'))
+    for path in paths[:2]:
+        open(path, 'wb').close()
+    monkeypatch.setattr(train_model, 'model_paths', lambda stock_name: paths)
+
+    def write_metadata(**metadata):
+        with open(paths[2], 'w') as f:
+            json.dump(metadata, f)
+    return write_metadata
+
+
+def test_incremental_refuses_models_of_another_feature_version(saved_model, monkeypatch):
+    saved_model(feature_version='0ld', data_end='2025-02-01T00:00:00+00:00')
+    monkeypatch.setattr(train_model.tradeapi, 'REST', lambda *args, **kwargs: pytest.fail("fetched bars"))
+
+    with pytest.raises(ValueError, match='full training'):
+        train_model.train_incremental('Apple')
+
+
+def test_incremental_episodes_leave_starts_to_weight(saved_model, monkeypatch):
+    from benchmarks.fixtures import synthetic_ohlcv
+    from feature_store import config_version
+
+    bars = synthetic_ohlcv(1200, start='2025-01-01', freq='2h')  # ~100 days of bars
+    saved_model(feature_version=config_version(), data_end=str(bars.index[-200]))
+    monkeypatch.setattr(train_model.tradeapi, 'REST', lambda *args, **kwargs: None)
+    monkeypatch.setattr(train_model, 'BarCache', lambda api: type('Cache', (), {
+        'get_bars': lambda self, *args, **kwargs: bars.copy()})())
+    envs = []
+
+    def make_env(data, n_envs, vec_backend, episode_length, seed, start_weights=None):
+        envs.append((data, episode_length, start_weights))
+        raise StopIteration
+
+    monkeypatch.setattr(train_model, 'make_env', make_env)
+    with pytest.raises(StopIteration):
+        train_model.train_incremental('Apple', episode_length=None, until=str(bars.index[-1]))
+
+    data, episode_length, weights = envs[0]
+    assert episode_length == len(data) // 4
+    assert weights[-1] == 1.0 and weights[0] < 0.05
+
+
+def test_checkpoints_are_promoted_only_when_training_ends(tmp_path, monkeypatch):
+    from benchmarks.fixtures import synthetic_ohlcv
+    from feature_store import FeatureSet
+    from indicators import add_indicators
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'models').mkdir()
+    deployed = train_model.model_paths('Apple')
+    for path in deployed:
+        with open(path, 'w') as f:
+            f.write('deployed')
+    data = FeatureSet.from_frame(add_indicators(synthetic_ohlcv(3000, seed=5)).dropna())
+    monkeypatch.setattr(train_model, 'load_training_features', lambda stock_name, rebuild=False: data)
+    promote = train_model.promote_candidate
+    seen_at_promotion = []
+
+    def checked_promote(stock_name):
+        seen_at_promotion.append([open(path).read() for path in deployed])
+        promote(stock_name)
+
+    monkeypatch.setattr(train_model, 'promote_candidate', checked_promote)
+    train_model.train('Apple', episode_length=256, total_timesteps=4096, seed=0, eval_every=2048)
+
+    # Every checkpoint went to the candidate files while the run was going
+    assert seen_at_promotion == [['deployed'] * 3]
+    assert not any(os.path.exists(path) for path in train_model.candidate_paths('Apple'))
+    metadata = train_model.load_metadata('Apple')
+    assert metadata['history'][-1]['validation']['evaluations'] >= 1
+    assert train_model.PPO.load(deployed[0]).num_timesteps > 0
+
+
+@pytest.mark.parametrize('argv', [['Apple', '--portfolio'], ['--portfolio', '--incremental'],
+                                  ['--portfolio', 'Apple', 'Tesla', '--no-early-stopping'],
+                                  ['--portfolio', '--eval-every', '10000'], ['--portfolio', '--patience', '2'],
+                                  ['--portfolio', '--min-delta', '0.5']])
+def test_portfolio_rejects_single_stock_options(argv, monkeypatch):
+    monkeypatch.setattr(train_model, 'train_portfolio', lambda *args: pytest.fail("trained"))
+    with pytest.raises(SystemExit):
+        train_model.main(argv)
+
+
+def test_portfolio_model_is_backtested(tmp_path, monkeypatch):
+    import Backtest_bot
+    from benchmarks.fixtures import synthetic_ohlcv
+    from feature_store import FeatureSet
+    from indicators import add_indicators
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'models').mkdir()
+    bars = {name: synthetic_ohlcv(1500, seed=seed) for seed, name in enumerate(['Apple', 'Tesla'])}
+    monkeypatch.setattr(train_model, 'load_training_features', lambda stock_name, rebuild=False: FeatureSet.from_frame(
+        add_indicators(bars[stock_name].copy()).dropna()))
+    train_model.train_portfolio(['Apple', 'Tesla'], episode_length=256, total_timesteps=256, seed=0)
+
+    assert not any(os.path.exists(path) for path in train_model.candidate_paths('portfolio'))
+    assert train_model.load_metadata('portfolio')['symbols'] == ['AAPL', 'TSLA']
+    monkeypatch.setattr(Backtest_bot, 'fetch_backtest_bars', lambda stock_name: bars[stock_name].iloc[-500:].copy())
+    summary = Backtest_bot.backtest('portfolio')
+
+    assert summary['symbols'] == ['AAPL', 'TSLA']
+    results = Backtest_bot.backtest_results.BacktestResults(summary['results_file'])
+    assert results.series['action'].shape == (summary['bars'], 2)
+
+
+def test_final_model_is_kept_when_no_validation_run_scores(tmp_path, monkeypatch):
+    import numpy as np
+    import walk_forward
+    from benchmarks.fixtures import synthetic_ohlcv
+    from feature_store import FeatureSet
+    from indicators import add_indicators
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'models').mkdir()
+    data = FeatureSet.from_frame(add_indicators(synthetic_ohlcv(3000, seed=5)).dropna())
+    monkeypatch.setattr(train_model, 'load_training_features', lambda stock_name, rebuild=False: data)
+    monkeypatch.setattr(walk_forward, 'evaluate_windows', lambda policy, features, prices, sma_10, starts, ends: {
+        'final_net_worth': np.full(len(starts), np.nan)})
+    train_model.train('Apple', episode_length=256, total_timesteps=4096, seed=0)
+
+    assert all(os.path.exists(path) for path in train_model.model_paths('Apple'))
+    validation = train_model.load_metadata('Apple')['history'][-1]['validation']
+    assert validation['best_return_pct'] is None and validation['evaluations'] >= 1
+
+
+def test_too_short_validation_fails_before_training(monkeypatch):
+    from benchmarks.fixtures import synthetic_ohlcv
+    from feature_store import FeatureSet
+    from indicators import add_indicators
+
+    data = FeatureSet.from_frame(add_indicators(synthetic_ohlcv(200, seed=5)).dropna())
+    monkeypatch.setattr(train_model, 'load_training_features', lambda stock_name, rebuild=False: data)
+    monkeypatch.setattr(train_model, 'make_env', lambda *args, **kwargs: pytest.fail("trained"))
+    with pytest.raises(ValueError, match='no-early-stopping'):
+        train_model.train('Apple')
@@ -0,0 +1,57 @@
+import io
+import time
+
+import training_jobs
+from training_jobs import FAILED, SUCCEEDED, TrainingScheduler
+
+
+class FinishedProcess:
+    stdout = io.StringIO("done\n")
+
+    def wait(self):
+        return 0
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_failed_launch_fails_the_job_and_starts_the_next(monkeypatch):
+    launches = []
+
+    def launch(script, args, env=None, pool=None):
+        launches.append(args[0])
+        if len(launches) == 1:
+            raise RuntimeError("worker pool connection lost")
+        return FinishedProcess()
+
+    monkeypatch.setattr(training_jobs.worker_pool, 'launch', launch)
+    scheduler = TrainingScheduler(max_jobs=1)
+    failed, _ = scheduler.submit('Apple')
+    queued, _ = scheduler.submit('Tesla')
+
+    wait_for(lambda: queued.state == SUCCEEDED)
+    assert failed.state == FAILED
+    assert list(failed.log_tail) == ["worker pool connection lost"]
+    assert launches == ['Apple', 'Tesla']
+
+
+
+def test_pool_preloads_modules_under_its_thread_limit(tmp_path):
+    import os
+    from worker_pool import WorkerPool
+
+    # Stands in for numpy/torch, whose BLAS and OpenMP pools read the limit once, at import
+    (tmp_path / 'probe.py').write_text("import os\nAT_IMPORT = os.environ.get('OPENBLAS_NUM_THREADS')\n")
+    script = tmp_path / 'job.py'
+    script.write_text("import probe\nprint(probe.AT_IMPORT)\n")
+    pool = WorkerPool(preload=['probe'], env={**os.environ, 'PYTHONPATH': str(tmp_path)}, threads=3)
+    try:
+        process = pool.start(str(script), env={'OPENBLAS_NUM_THREADS': '1'})
+        assert process.wait(timeout=60) == 0
+        assert process.stdout.read().strip() == '3'
+    finally:
+        pool.shutdown()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from benchmarks.fixtures import synthetic_ohlcv
+from feature_store import FeatureSet
+from indicators import add_indicators
+from trading_env import TradingEnv
+from vec_trading_env import BatchTradingVecEnv
+
+N_ENVS = 4
+
+
+@pytest.fixture(scope='module')
+def data():
+    return FeatureSet.from_frame(add_indicators(synthetic_ohlcv(400, seed=6)).dropna())
+
+
+def env_pair(data, episode_length, start):
+    """BatchTradingVecEnv and a DummyVecEnv of TradingEnvs whose episodes all start at bar start."""
+    weights = None
+    if episode_length:
+        weights = np.zeros(len(data))
+        weights[start] = 1.0  # Every sampled window starts here
+    reference = DummyVecEnv([lambda: TradingEnv(data, episode_length=episode_length, random_start=weights is not None,
+                                                start_weights=weights) for _ in range(N_ENVS)])
+    # Whole-series episodes run from bar 0 in TradingEnv, but from random bars in the batch env unless fixed
+    batch = BatchTradingVecEnv(data, N_ENVS, episode_length=episode_length, start_weights=weights, seed=0,
+                               start_steps=None if episode_length else [start] * N_ENVS)
+    return batch, reference
+
+
+@pytest.mark.parametrize('episode_length, start', [(64, 100), (None, 0)])
+def test_batch_env_steps_like_trading_envs(data, episode_length, start):
+    batch, reference = env_pair(data, episode_length, start)
+    np.testing.assert_allclose(batch.reset(), reference.reset(), rtol=1e-6)
+    actions = np.random.default_rng(0).integers(0, 3, size=(3 * (episode_length or len(data)), N_ENVS))
+
+    dones_seen = 0
+    for step_actions in actions:
+        obs, rewards, dones, infos = batch.step(step_actions)
+        ref_obs, ref_rewards, ref_dones, ref_infos = reference.step(step_actions)
+
+        np.testing.assert_allclose(obs, ref_obs, rtol=1e-6)
+        np.testing.assert_allclose(rewards, ref_rewards, rtol=1e-5, atol=1e-8)
+        np.testing.assert_array_equal(dones, ref_dones)
+        for info, ref_info in zip(infos, ref_infos):
+            assert info["net_worth"] == pytest.approx(ref_info["net_worth"])
+            assert info.get("TimeLimit.truncated", False) == ref_info["TimeLimit.truncated"]
+            if "terminal_observation" in ref_info:
+                np.testing.assert_allclose(info["terminal_observation"], ref_info["terminal_observation"], rtol=1e-6)
+        assert batch.env_method('get_portfolio_value') == pytest.approx(reference.env_method('get_portfolio_value'))
+        for name in ('balance', 'shares_held', 'current_step'):
+            assert batch.get_attr(name) == pytest.approx(reference.get_attr(name))
+        dones_seen += int(dones.sum())
+
+    assert dones_seen >= N_ENVS  # Resets were compared too
+    assert any(info.get("TimeLimit.truncated") for info in infos) or not episode_length
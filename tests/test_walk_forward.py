@@ -0,0 +1,40 @@
+import numpy as np
+
+from benchmarks.fixtures import synthetic_ohlcv
+from feature_store import FeatureSet
+from indicators import add_indicators
+from trading_env import TradingEnv
+from walk_forward import evaluate_windows
+
+
+def policy(obs):
+    """Deterministic hold/buy/sell from the observation, for batched (n, features) input."""
+    return (np.abs(obs[:, 0] * 1e4).astype(np.int64) + (obs[:, 12] > 0)) % 3
+
+
+def rollout(data, start, end):
+    """One TradingEnv episode over data[start:end + 1] under policy."""
+    env = TradingEnv(data.slice(start, end + 1))
+    obs = env.reset()
+    net_worths, trades, done = [env.net_worth], 0, False
+    while not done:
+        shares = env.shares_held
+        obs, _, done, info = env.step(int(policy(obs[None])[0]))
+        trades += env.shares_held != shares
+        net_worths.append(info['net_worth'])
+    net_worths = np.array(net_worths)
+    return net_worths[-1], np.max(1 - net_worths / np.maximum.accumulate(net_worths)), trades
+
+
+def test_windows_match_trading_env_rollouts():
+    data = FeatureSet.from_frame(add_indicators(synthetic_ohlcv(1200, seed=8)).dropna())
+    starts = np.array([0, 150, 400, 700, 1000])
+    ends = np.array([120, 500, 460, 1000, len(data) - 1])
+    results = evaluate_windows(policy, data.features, data.prices, data.sma_10, starts, ends)
+
+    expected = [rollout(data, start, end) for start, end in zip(starts, ends)]
+    final, drawdown, trades = (np.array(values) for values in zip(*expected))
+    assert trades.min() > 0
+    np.testing.assert_allclose(results['final_net_worth'], final, rtol=1e-9)
+    np.testing.assert_allclose(results['max_drawdown'], drawdown, rtol=1e-9, atol=1e-12)
+    np.testing.assert_array_equal(results['trades'], trades)
@@ -0,0 +1,322 @@
+"""Lightweight timing spans aggregated into per-stage latency histograms.
+
+``with timing.span('fetch_bars'):`` adds the block's wall time to that
+stage's histogram. Buckets are fixed, so histograms from several processes
+can be summed. Scripts the API starts in the background (training, the
+trading bot) save theirs under METRICS_DIR, and the API's /metrics endpoint
+serves them, together with its own, in the Prometheus text format. Files of
+processes that have exited are dropped after METRICS_RETENTION.
+
+With ITRADER_TIMING=0, span() returns one shared no-op context manager, so a
+disabled span costs a function call and nothing else.
+
+Requests to the API can also be profiled on demand (ITRADER_PROFILING=1).
+RequestProfile collects cProfile (or pyinstrument) data from every thread
+that works on one request. Code that runs off the event loop marks its work
+with ``with timing.profiled():``.
+"""
+import bisect
+import contextlib
+import contextvars
+import cProfile
+import glob
+import json
+import os
+import pstats
+import threading
+import time
+
+# Set ITRADER_TIMING=0 to disable all spans
+ENABLED = os.getenv('ITRADER_TIMING', '1') != '0'
+# Where background processes save their histograms for /metrics
+METRICS_DIR = os.getenv('ITRADER_METRICS_DIR', 'metrics')
+# Upper bounds (seconds) of the histogram buckets, from 100us to 30 minutes
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+METRIC_NAME = 'itrader_stage_duration_seconds'
+# Loops calling save(..., min_interval=SAVE_INTERVAL) write their file at most this often (real seconds)
+SAVE_INTERVAL = float(os.getenv('ITRADER_METRICS_SAVE_SECONDS', '5'))
+# Files of processes that have exited are served this long after their last write, then deleted
+METRICS_RETENTION = float(os.getenv('ITRADER_METRICS_RETENTION_SECONDS', '3600'))
+
+# Per-request profiling is off unless ITRADER_PROFILING=1, as profiles expose code paths
+PROFILING = os.getenv('ITRADER_PROFILING', '0') == '1'
+PROFILE_DIR = os.getenv('ITRADER_PROFILE_DIR', 'profiles')
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum and total count."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Estimate of the q-quantile, interpolated inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.buckets[i - 1] if i > 0 else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+    @classmethod
+    def from_dict(cls, state, buckets=BUCKETS):
+        histogram = cls(buckets)
+        histogram.counts, histogram.sum, histogram.count = list(state['counts']), state['sum'], state['count']
+        return histogram
+
+
+class Registry:
+    """Thread-safe stage name -> Histogram map."""
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """Copy of every histogram, safe to read while spans keep recording."""
+        with self._lock:
+            return {stage: Histogram.from_dict(h.to_dict()) for stage, h in self.histograms.items()}
+
+
+REGISTRY = Registry()
+
+
+class _Span:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe(self.stage, time.perf_counter() - self.start)
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(stage):
+    """Context manager timing a block into the ``stage`` histogram."""
+    return _Span(stage) if ENABLED else _NULL_SPAN
+
+
+def observe(stage, seconds):
+    if ENABLED:
+        REGISTRY.observe(stage, seconds)
+
+
+# ---------------------------------------------------------------------------
+# Reporting and export
+# ---------------------------------------------------------------------------
+
+def report(histograms=None):
+    """Plain-text table of count, p50, p95 and total time per stage."""
+    histograms = REGISTRY.snapshot() if histograms is None else histograms
+    lines = [f"{'stage':<28} {'count':>8} {'p50 ms':>10} {'p95 ms':>10} {'total s':>10}"]
+    for stage, h in sorted(histograms.items()):
+        lines.append(f"{stage:<28} {h.count:>8} {h.quantile(0.5) * 1e3:>10.2f} "
+                     f"{h.quantile(0.95) * 1e3:>10.2f} {h.sum:>10.2f}")
+    return "\n".join(lines)
+
+
+_last_saved = {}  # process -> time.monotonic() of its last save
+
+
+def save(process, metrics_dir=METRICS_DIR, min_interval=0.0):
+    """Write this process's histograms to METRICS_DIR/<process>-<pid>.json for /metrics.
+
+    With min_interval, calls less than that many seconds after the previous
+    write are skipped.
+    """
+    if not ENABLED:
+        return
+    now = time.monotonic()
+    if min_interval and now - _last_saved.get(process, -min_interval) < min_interval:
+        return
+    _last_saved[process] = now
+    os.makedirs(metrics_dir, exist_ok=True)
+    path = os.path.join(metrics_dir, f"{process}-{os.getpid()}.json")
+    state = {'process': process, 'pid': os.getpid(),
+             'stages': {stage: h.to_dict() for stage, h in REGISTRY.snapshot().items()}}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _running(pid):
+    if os.name == 'nt':  # os.kill would terminate it; rely on the file age alone
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect(process, metrics_dir=METRICS_DIR, retention=METRICS_RETENTION):
+    """{process: {stage: Histogram}} for this process and every saved one, summed per process name.
+
+    Files of exited processes count until they are ``retention`` seconds old
+    and are deleted after that, so finished jobs drop out of the totals.
+    """
+    merged = {process: REGISTRY.snapshot()}
+    now = time.time()
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            expired = now - os.path.getmtime(path) > retention
+            # Files written before the pid was saved have it in their name
+            pid = state.get('pid') or int(os.path.basename(path)[:-len('.json')].rsplit('-', 1)[-1])
+        except (OSError, ValueError):
+            continue
+        if expired and not _running(pid):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            continue
+        stages = merged.setdefault(state['process'], {})
+        for stage, counts in state['stages'].items():
+            histogram = Histogram.from_dict(counts)
+            if stage in stages:
+                stages[stage].merge(histogram)
+            else:
+                stages[stage] = histogram
+    return merged
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(processes):
+    """Prometheus text exposition of collect() output."""
+    lines = [f"# HELP {METRIC_NAME} Wall time of instrumented stages.",
+             f"# TYPE {METRIC_NAME} histogram"]
+    for process, stages in sorted(processes.items()):
+        for stage, h in sorted(stages.items()):
+            labels = f'process="{_label(process)}",stage="{_label(stage)}"'
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'{METRIC_NAME}_sum{{{labels}}} {h.sum:.9g}')
+            lines.append(f'{METRIC_NAME}_count{{{labels}}} {h.count}')
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Per-request profiling
+# ---------------------------------------------------------------------------
+
+_request_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """Profiles of one request, one per thread that worked on it, saved as a single file.
+
+    mode is 'cprofile' (a .prof file for pstats/snakeviz) or 'pyinstrument'
+    (an HTML report; needs the optional pyinstrument package).
+    """
+
+    def __init__(self, mode='cprofile'):
+        if mode == 'pyinstrument':
+            import pyinstrument  # noqa: F401 - fail early if the optional package is missing
+        elif mode != 'cprofile':
+            raise ValueError(f"Unknown profiler '{mode}'. Use cprofile or pyinstrument.")
+        self.mode = mode
+        self.results = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def capture(self, async_mode=False):
+        if self.mode == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler(async_mode='enabled' if async_mode else 'disabled')
+            profiler.start()
+            try:
+                yield
+            finally:
+                result = profiler.stop()
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+: profilers see every thread, and the request's is already running
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                result = profiler
+        with self._lock:
+            self.results.append(result)
+
+    @contextlib.contextmanager
+    def active(self):
+        """Make this the profile that profiled() blocks in this context report to."""
+        token = _request_profile.set(self)
+        try:
+            yield
+        finally:
+            _request_profile.reset(token)
+
+    def save(self, name, profile_dir=PROFILE_DIR):
+        os.makedirs(profile_dir, exist_ok=True)
+        if self.mode == 'pyinstrument':
+            from pyinstrument.renderers import HTMLRenderer
+            from pyinstrument.session import Session
+            session = self.results[0]
+            for other in self.results[1:]:
+                session = Session.combine(session, other)
+            path = os.path.join(profile_dir, f"{name}.html")
+            with open(path, 'w') as f:
+                f.write(HTMLRenderer().render(session))
+        else:
+            stats = pstats.Stats(*self.results)
+            path = os.path.join(profile_dir, f"{name}.prof")
+            stats.dump_stats(path)
+        return path
+
+
+def profiled():
+    """Profile the block if the current request asked for a profile, else do nothing."""
+    profile = _request_profile.get()
+    return profile.capture() if profile is not None else _NULL_SPAN
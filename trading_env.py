@@ -3,10 +3,75 @@ from gym import spaces
 import numpy as np
 import pandas as pd
 
+# Observation layout: (column, scale) for market features, None for the
+# account-state slots that are filled in on every step.
+OBSERVATION_LAYOUT = [
+    ('open', 1000),
+    ('high', 1000),
+    ('low', 1000),
+    ('close', 1000),
+    ('RSI', 100),
+    ('MACD', 1),
+    ('MACD_hist', 1),
+    ('Stochastic_K', 1),
+    ('Stochastic_D', 1),
+    ('Upper_Band', 1000),
+    ('Lower_Band', 1000),
+    None,  # shares_held / 1000
+    None,  # balance / initial_balance
+    ('CCI', 1000),
+    ('OBV', 1000000),
+]
+SHARES_IDX = 11
+BALANCE_IDX = 12
+
+
+def build_feature_matrix(data):
+    """Precompute the scaled market part of every observation as a float32 matrix."""
+    features = np.zeros((len(data), len(OBSERVATION_LAYOUT)), dtype=np.float32)
+    if len(data) == 0:
+        return features
+    for i, entry in enumerate(OBSERVATION_LAYOUT):
+        if entry is None:
+            continue
+        column, scale = entry
+        features[:, i] = data[column].to_numpy(dtype=np.float64) / scale
+    return features
+
+
+def feature_arrays(data):
+    """(features, prices, sma_10) of an indicator DataFrame or of a feature_store.FeatureSet.
+
+    FeatureSet arrays are used as they are, so memory-mapped ones stay shared.
+    """
+    if not isinstance(data, pd.DataFrame):
+        return data.features, data.prices, data.sma_10
+    features = build_feature_matrix(data)
+    prices = data['close'].to_numpy(dtype=np.float64) if len(data) else np.zeros(0)
+    sma_10 = data['SMA_10'].to_numpy(dtype=np.float64) if 'SMA_10' in data.columns else None
+    return features, prices, sma_10
+
+
+def recency_weights(timestamps, half_life_seconds):
+    """Per-bar weights that halve every half_life_seconds back from the last bar."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    age = (timestamps[-1] - timestamps) / 1e9
+    return 0.5 ** (age / half_life_seconds)
+
+
+def start_cdf(weights, last_start):
+    """Cumulative distribution over episode starts 0..last_start from per-bar weights (None: uniform)."""
+    if weights is None:
+        return None
+    cdf = np.cumsum(np.asarray(weights[:last_start + 1], dtype=np.float64))
+    return cdf / cdf[-1]
+
+
 class TradingEnv(gym.Env):
-    def __init__(self, data, initial_balance=10000, transaction_fee=0.001):
+    def __init__(self, data, initial_balance=10000, transaction_fee=0.001,
+                 episode_length=None, random_start=False, start_weights=None):
         super(TradingEnv, self).__init__()
-        self.data = data.reset_index(drop=True)
+        self.data = data.reset_index(drop=True) if isinstance(data, pd.DataFrame) else data
         self.initial_balance = initial_balance
         self.current_step = 0
         self.balance = initial_balance
@@ -16,6 +81,18 @@ class TradingEnv(gym.Env):
         self.net_worth_history = [initial_balance]
         self.transaction_fee = transaction_fee  # Transaction fee
 
+        # Episode window: by default every episode runs over the whole series from bar 0.
+        # With random_start each reset samples its own window of episode_length bars,
+        # uniformly or in proportion to start_weights (one weight per bar).
+        self.episode_length = min(episode_length, self.max_steps) if episode_length else None
+        self.random_start = random_start
+        self._start_cdf = start_cdf(start_weights, self.max_steps - (self.episode_length or 1))
+        self.end_step = self.max_steps
+        self._rng = np.random.default_rng()
+
+        # Array-backed views of the data so reset/step never touch pandas
+        self.features, self.prices, self.sma_10 = feature_arrays(self.data)
+
         # Define action space: 0 = hold, 1 = buy, 2 = sell
         self.action_space = spaces.Discrete(3)
 
@@ -26,44 +103,39 @@ class TradingEnv(gym.Env):
 
     def seed(self, seed=None):  
         np.random.seed(seed)
+        self._rng = np.random.default_rng(seed)
 
     def reset(self):
         self.balance = self.initial_balance
         self.shares_held = 0
         self.net_worth = self.initial_balance
         self.current_step = 0
+        if self.random_start and self._start_cdf is not None:
+            self.current_step = int(np.searchsorted(self._start_cdf, self._rng.random(), side='right'))
+        elif self.random_start:
+            self.current_step = int(self._rng.integers(0, self.max_steps - (self.episode_length or 1) + 1))
+        if self.episode_length:
+            self.end_step = min(self.current_step + self.episode_length, self.max_steps)
         self.net_worth_history = [self.initial_balance]
         return self._next_observation()
 
     def _next_observation(self):
-        obs = np.array([
-            self.data.iloc[self.current_step]['open'] / 1000,
-            self.data.iloc[self.current_step]['high'] / 1000,
-            self.data.iloc[self.current_step]['low'] / 1000,
-            self.data.iloc[self.current_step]['close'] / 1000,
-            self.data.iloc[self.current_step]['RSI'] / 100,
-            self.data.iloc[self.current_step]['MACD'],
-            self.data.iloc[self.current_step]['MACD_hist'],
-            self.data.iloc[self.current_step]['Stochastic_K'],
-            self.data.iloc[self.current_step]['Stochastic_D'],
-            self.data.iloc[self.current_step]['Upper_Band'] / 1000,
-            self.data.iloc[self.current_step]['Lower_Band'] / 1000,
-            self.shares_held / 1000,
-            self.balance / self.initial_balance,
-            self.data.iloc[self.current_step]['CCI'] / 1000,
-            self.data.iloc[self.current_step]['OBV'] / 1000000
-        ])
-        return obs.astype(np.float32)
+        # A fresh array per step rather than a reused buffer: vec env wrappers keep
+        # references to returned observations (e.g. terminal_observation)
+        obs = self.features[self.current_step].copy()
+        obs[SHARES_IDX] = self.shares_held / 1000
+        obs[BALANCE_IDX] = self.balance / self.initial_balance
+        return obs
 
     def step(self, action):
         # Get the current price
-        current_price = self.data.iloc[self.current_step]['close']
+        current_price = float(self.prices[self.current_step])
 
         # Increase the step counter first
         self.current_step += 1
 
         # Retrieve the SMA_10 from the current step
-        sma_10 = self.data.iloc[self.current_step]['SMA_10'] if 'SMA_10' in self.data.columns else current_price
+        sma_10 = float(self.sma_10[self.current_step]) if self.sma_10 is not None else current_price
 
         # Execute the action with added risk controls:
         if action == 1:  # Buy
@@ -93,10 +165,14 @@ class TradingEnv(gym.Env):
         self.net_worth_history.append(self.net_worth)
 
         # Check if the episode is done
-        done = self.current_step >= self.max_steps
+        done = self.current_step >= self.end_step
 
         # Include the current net worth in the info dict
         info = {"net_worth": self.net_worth}
+        if done:
+            # A window ending before the data is cut off, not terminal: PPO bootstraps its value
+            # (BatchTradingVecEnv sets the same flag)
+            info["TimeLimit.truncated"] = self.end_step < self.max_steps
 
         return self._next_observation(), reward, done, info
 
@@ -1,15 +1,25 @@
+import argparse
 import pandas as pd
-import pandas_ta as ta
 import alpaca_trade_api as tradeapi
 from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.vec_env import VecNormalize
-from trading_env import TradingEnv
+from stable_baselines3.common.vec_env import VecNormalize, DummyVecEnv, SubprocVecEnv
+from trading_env import TradingEnv, recency_weights
+from portfolio_env import PortfolioData, PortfolioEnv
+from vec_trading_env import BatchTradingVecEnv
+from bar_cache import BarCache
+from feature_store import FeatureSet, FeatureStore, config_version
+from indicators import add_indicators
+from policy_export import model_files_lock
+import timing
 from dotenv import load_dotenv
+import json
 import os
 import time
 import sys
-from .constants import STOCK_MAPPINGS
+import numpy as np
+from constants import STOCK_MAPPINGS
 
 # Load environment variables
 load_dotenv()
@@ -19,100 +29,587 @@ API_KEY = os.getenv('ALPACA_API_KEY')
 API_SECRET = os.getenv('ALPACA_API_SECRET')
 BASE_URL = 'https://paper-api.alpaca.markets'
 
-stock_name = sys.argv[1]
-stock_symbol = STOCK_MAPPINGS[stock_name]
-
-# Initialize Alpaca API
-api = tradeapi.REST(API_KEY, API_SECRET, BASE_URL, api_version='v2')
-
 # Training parameters
 total_timesteps = 1000000
+TIMEFRAME = '1H'
+TRAIN_START, TRAIN_END = '2020-01-01', '2025-02-01'
+episode_length = 2048  # Bars per sampled episode window
+
+# Incremental (warm-start) retraining on bars newer than the model's data
+INCREMENTAL_TIMESTEPS = 100000
+INCREMENTAL_WINDOW_DAYS = 90  # Fine-tune on this many days of bars, ending at the newest one
+INCREMENTAL_HALF_LIFE_DAYS = 14  # Episode start weights halve every this many days back
+# Bars per episode when fine-tuning. The window holds ~1000 1H bars, so a full-length episode would
+# leave a single possible start and the recency weights would have nothing to choose from
+INCREMENTAL_EPISODE_LENGTH = 128
+INCREMENTAL_MIN_NEW_BARS = 7  # Fewer new bars than this: nothing to fine-tune
+INDICATOR_WARMUP_DAYS = 10  # Extra days fetched before the window so indicators are defined at its start
+
+# Early stopping: the most recent bars are held out and the policy is scored on them during training
+VALIDATION_FRACTION = 0.2
+EVAL_EVERY = 50000  # Timesteps between validation runs
+VALIDATION_WINDOWS = 16  # Episodes evaluated in lockstep, spread evenly over the validation bars
+EARLY_STOP_PATIENCE = 5  # Validation runs without improvement before training stops
+EARLY_STOP_MIN_DELTA = 0.1  # Gain in mean validation return (percentage points) that counts as improvement
+MIN_VALIDATION_BARS = 50  # Fewer held-out bars than this cannot score a policy; train without early stopping
+
+PPO_PARAMS = {
+    'learning_rate': 1e-04,
+    'n_steps': 4096,  # Rollout size summed over all envs
+    'batch_size': 128,
+    'gamma': 0.98,
+    'gae_lambda': 0.9,
+    'clip_range': 0.2,
+    'ent_coef': 0.01,
+    'max_grad_norm': 0.5,
+}
+
+VEC_BACKENDS = {'dummy': DummyVecEnv, 'subproc': SubprocVecEnv}
+
+# Marks the machine-readable progress lines printed with --progress
+PROGRESS_PREFIX = '##progress'
+
+
+class ProgressCallback(BaseCallback):
+    """Prints '##progress <timesteps done> <total timesteps>' after every rollout (counted from this learn() call)."""
+
+    def __init__(self, total_timesteps):
+        super().__init__()
+        self.total_timesteps = total_timesteps
+        self.start_timesteps = 0
 
+    def _report(self):
+        print(f"{PROGRESS_PREFIX} {self.num_timesteps - self.start_timesteps} {self.total_timesteps}", flush=True)
 
-print(f"\n🔄 Training on {stock_name} ({stock_symbol})...")
+    def _on_training_start(self):
+        # A warm-started model continues from its saved timestep count
+        self.start_timesteps = self.num_timesteps
+        self._report()
 
-while True:  # Keep retrying until data is fetched
-    try:
-        print(f"📡 Fetching data for {stock_symbol} from Alpaca...")
-        data = api.get_bars(stock_symbol, '1H', start='2020-01-01', end='2025-02-01').df
-        if not data.empty:
-            print(f"✅ Received {len(data)} bars for {stock_symbol}")
-            break
+    def _on_rollout_end(self):
+        self._report()
+
+    def _on_step(self):
+        return True
+
+
+class EarlyStoppingCallback(BaseCallback):
+    """Scores the policy on held-out bars every eval_every timesteps, saves it on improvement, stops on a plateau.
+
+    Validation runs VALIDATION_WINDOWS episodes of validation (a FeatureSet)
+    in lockstep through walk_forward.evaluate_windows, with the training
+    normalizer's current statistics. The score is their mean return in %.
+    Whenever it beats the best so far by min_delta, the model and normalizer
+    are saved to model_path and env_path (the run's candidate paths, not the
+    deployed files), so those always hold the best checkpoint. After patience
+    runs without such a gain, learn() stops.
+    """
+
+    def __init__(self, validation, model_path, env_path, episode_length=None, eval_every=EVAL_EVERY,
+                 patience=EARLY_STOP_PATIENCE, min_delta=EARLY_STOP_MIN_DELTA, n_windows=VALIDATION_WINDOWS):
+        super().__init__()
+        self.validation = validation
+        self.model_path = model_path
+        self.env_path = env_path
+        self.eval_every = eval_every
+        self.patience = patience
+        self.min_delta = min_delta
+        last_bar = len(validation) - 1
+        length = min(episode_length or last_bar, last_bar)
+        self.starts = np.unique(np.linspace(0, last_bar - length, n_windows).astype(np.int64))
+        self.ends = self.starts + length
+        self.best_score = -np.inf
+        self.best_timesteps = None
+        self.evaluations = 0
+        self.stale = 0
+        self.stopped = False
+        self.last_eval = 0
+        self.eval_seconds = 0.0
+
+    def _evaluate(self):
+        from walk_forward import evaluate_windows, ppo_policy
+
+        start = time.time()
+        self.last_eval = self.num_timesteps
+        normalizer = self.model.get_vec_normalize_env()
+        with timing.span('validation'):
+            results = evaluate_windows(ppo_policy(self.model, normalizer), self.validation.features,
+                                       self.validation.prices, self.validation.sma_10, self.starts, self.ends)
+        score = float(np.mean(results['final_net_worth'] / 10000 - 1) * 100)
+        self.evaluations += 1
+        if score > self.best_score + self.min_delta:
+            self.best_score, self.best_timesteps, self.stale = score, self.num_timesteps, 0
+            with timing.span('model_save'):
+                self.model.save(self.model_path)
+                normalizer.save(self.env_path)
+            note = "new best, checkpoint saved"
         else:
-            print(f"⚠️ No data fetched for {stock_symbol}. Retrying in 10 seconds...")
+            self.stale += 1
+            best = f"best {self.best_score:+.2f}% at {self.best_timesteps:,}" if self.best_timesteps else "no score yet"
+            note = f"{best}, {self.stale}/{self.patience} without gain"
+            self.stopped = self.stale >= self.patience
+        print(f"📏 Validation at {self.num_timesteps:,} timesteps: {score:+.2f}% mean return ({note})", flush=True)
+        self.eval_seconds += time.time() - start
+
+    def _on_rollout_end(self):
+        if self.num_timesteps - self.last_eval >= self.eval_every:
+            self._evaluate()
+
+    def _on_step(self):
+        return not self.stopped
+
+    def _on_training_end(self):
+        # Score the final policy too, so a short budget still leaves a checkpoint
+        if not self.stopped and self.num_timesteps > self.last_eval:
+            self._evaluate()
+
+
+def fetch_data(api, stock_symbol):
+    cache = BarCache(api)
+    while True:  # Keep retrying until data is fetched
+        try:
+            print(f"📡 Fetching data for {stock_symbol} (local bar cache, Alpaca for missing ranges)...")
+            with timing.span('fetch_bars'):
+                data = cache.get_bars(stock_symbol, TIMEFRAME, start=TRAIN_START, end=TRAIN_END)
+            if not data.empty:
+                print(f"✅ Received {len(data)} bars for {stock_symbol}")
+                return data
+            else:
+                print(f"⚠️ No data fetched for {stock_symbol}. Retrying in 10 seconds...")
+                time.sleep(10)
+        except tradeapi.rest.APIError as e:
+            print(f"⚠️ API Error: {e}. Retrying in 10 seconds...")
             time.sleep(10)
-    except tradeapi.rest.APIError as e:
-        print(f"⚠️ API Error: {e}. Retrying in 10 seconds...")
-        time.sleep(10)
-
-# Compute technical indicators
-print("📊 Calculating technical indicators...")
-data['RSI'] = ta.rsi(data['close'], length=14)
-data.ta.macd(close='close', fast=12, slow=26, signal=9, append=True)
-data['SMA_10'] = data['close'].rolling(window=10).mean()
-data['SMA_20'] = data['close'].rolling(window=20).mean()
-data['SMA_50'] = data['close'].rolling(window=50).mean()
-data['STD_20'] = data['close'].rolling(window=20).std()
-data['Upper_Band'] = data['SMA_20'] + (2 * data['STD_20'])
-data['Lower_Band'] = data['SMA_20'] - (2 * data['STD_20'])
-data['ATR'] = ta.atr(data['high'], data['low'], data['close'], length=14)
-data['VWAP'] = ta.vwap(data['high'], data['low'], data['close'], data['volume'])
-
-# Stochastic Oscillator
-stoch = ta.stoch(data['high'], data['low'], data['close'], k=14, d=3)
-if stoch is not None and not stoch.empty:
-    data['Stochastic_K'] = stoch['STOCHk_14_3_3']
-    data['Stochastic_D'] = stoch['STOCHd_14_3_3']
-else:
-    print(f"⚠️ Stochastic indicator failed for {stock_symbol}. Skipping training.")
-    
-
-# Rename MACD columns
-data.rename(columns={'MACD_12_26_9': 'MACD', 
-                        'MACDh_12_26_9': 'MACD_hist', 
-                        'MACDs_12_26_9': 'MACD_signal'}, inplace=True)
-
-# Add CCI and OBV
-data['CCI'] = ta.cci(data['high'], data['low'], data['close'], length=14)
-data['OBV'] = ta.obv(data['close'], data['volume'])
-
-# Drop NaN values after all indicators are added
-data.dropna(inplace=True)
-
-print(f"✅ Data preprocessing complete for {stock_symbol}. Starting training.")
-
-# Create environment
-env = TradingEnv(data)
-env = make_vec_env(lambda: env, n_envs=1)
-env = VecNormalize(env, norm_obs=True, norm_reward=True)
-
-# Initialize PPO model
-model = PPO(
-    'MlpPolicy',
-    env,
-    verbose=1,
-    tensorboard_log=f"./trading_tensorboard/{stock_name}/",
-    learning_rate=1e-04,
-    n_steps=4096,
-    batch_size=128,
-    gamma=0.98,
-    gae_lambda=0.9,
-    clip_range=0.2,
-    ent_coef=0.01,
-    max_grad_norm=0.5
-)
-
-# Train the model
-print(f"🚀 Training PPO model for {stock_symbol}...")
-model.learn(total_timesteps=total_timesteps)
-print(f"✅ Training complete for {stock_symbol}.")
-
-# Save trained model
-model.save(f"models/trading_bot_ppo_{stock_name}")
-env.save(f"models/trading_env_normalize_{stock_name}.pkl")
-
-print(f"💾 Model saved: models/trading_bot_ppo_{stock_name}")
-
-print("\n🎉 All training complete. Models saved using company names.")
 
 
+def prepare_features(data):
+    # Compute technical indicators
+    print("📊 Calculating technical indicators...")
+    with timing.span('indicators'):
+        add_indicators(data)
+
+        # Drop NaN values after all indicators are added
+        data.dropna(inplace=True)
+    return data
+
+
+def make_env(data, n_envs=1, vec_backend='dummy', episode_length=None, seed=None, start_weights=None):
+    """Vectorized training env where every worker samples its own episode windows.
+
+    episode_length=None keeps the original behaviour of one episode over the
+    whole series starting at bar 0. start_weights (one per bar) makes some
+    episode starts more likely than others.
+    """
+    if vec_backend == 'batch':
+        return BatchTradingVecEnv(data, n_envs, episode_length=episode_length, seed=seed, start_weights=start_weights)
+    random_start = episode_length is not None
+    return make_vec_env(
+        lambda: TradingEnv(data, episode_length=episode_length, random_start=random_start,
+                           start_weights=start_weights),
+        n_envs=n_envs,
+        seed=seed,
+        vec_env_cls=VEC_BACKENDS[vec_backend],
+    )
+
+
+def load_training_features(stock_name, rebuild=False):
+    """Training FeatureSet for stock_name, memory-mapped from the feature store.
+
+    Every env worker shares that one copy. Bars and indicators are only
+    computed when this symbol/range/indicator version has not been stored yet.
+    """
+    stock_symbol = STOCK_MAPPINGS[stock_name]
+    store = FeatureStore()
+    with timing.span('feature_store_open'):
+        data = None if rebuild else store.open(stock_symbol, TIMEFRAME, TRAIN_START, TRAIN_END)
+    if data is not None:
+        print(f"📦 Using stored features for {stock_symbol}: {data.path}")
+        return data
+    # Initialize Alpaca API
+    api = tradeapi.REST(API_KEY, API_SECRET, BASE_URL, api_version='v2')
+    bars = fetch_data(api, stock_symbol)
+    print("📊 Calculating technical indicators...")
+    with timing.span('indicators'):
+        return store.write(stock_symbol, TIMEFRAME, TRAIN_START, TRAIN_END, bars)
+
+
+def model_paths(stock_name):
+    """(model, normalizer, metadata) paths of a stock's trained model."""
+    return (f"models/trading_bot_ppo_{stock_name}.zip", f"models/trading_env_normalize_{stock_name}.pkl",
+            f"models/trading_bot_ppo_{stock_name}.json")
+
+
+def candidate_paths(stock_name):
+    """Where a run saves its model, normalizer and metadata until promote_candidate() deploys them."""
+    return tuple(f"{root}.candidate{ext}" for root, ext in map(os.path.splitext, model_paths(stock_name)))
+
+
+def promote_candidate(stock_name):
+    """Replace the deployed model, normalizer and metadata with the candidate ones in one step.
+
+    Loaders take model_files_lock shared, so none of them sees a mix of the
+    old and new files.
+    """
+    with model_files_lock(stock_name, exclusive=True):
+        for candidate, path in zip(candidate_paths(stock_name), model_paths(stock_name)):
+            os.replace(candidate, path)
+
+
+def load_metadata(stock_name):
+    """What data the saved model has been trained on, or None if it predates metadata."""
+    path = model_paths(stock_name)[2]
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_metadata(stock_name, timesteps, mode, data, seconds, new_bars=None, previous=None, validation=None,
+                  path=None):
+    """Record a training run on data (a FeatureSet) by a model that has seen timesteps in total.
+
+    Written to path, by default next to the deployed model.
+    """
+    first, last = (pd.Timestamp(int(data.timestamps[i]), tz='UTC') for i in (0, -1))
+    metadata = previous or {'stock': stock_name, 'symbol': STOCK_MAPPINGS[stock_name], 'timeframe': TIMEFRAME,
+                            'data_start': first.isoformat(), 'history': []}
+    metadata.update(data_end=last.isoformat(), total_timesteps=int(timesteps),
+                    feature_version=config_version(), updated_at=pd.Timestamp.now(tz='UTC').isoformat())
+    run = {'mode': mode, 'start': first.isoformat(), 'end': last.isoformat(), 'bars': len(data),
+           'timesteps': int(timesteps) - sum(r['timesteps'] for r in metadata['history']),
+           'seconds': round(seconds, 1), 'finished_at': metadata['updated_at']}
+    if new_bars is not None:
+        run['new_bars'] = new_bars
+    if validation is not None:
+        run['validation'] = validation
+    metadata['history'] = metadata.pop('history') + [run]
+
+    path = path or model_paths(stock_name)[2]
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+    return metadata
+
+
+def train(stock_name, n_envs=1, vec_backend='dummy', episode_length=episode_length,
+          total_timesteps=total_timesteps, seed=None, threads=None, progress=False, rebuild_features=False,
+          early_stopping=True, eval_every=EVAL_EVERY, patience=EARLY_STOP_PATIENCE, min_delta=EARLY_STOP_MIN_DELTA):
+    """Train a new model for stock_name.
+
+    With early_stopping, the last VALIDATION_FRACTION of the bars is held out
+    and total_timesteps is only an upper bound (see EarlyStoppingCallback):
+    the saved model is the checkpoint that scored best on those bars.
+    """
+    stock_symbol = STOCK_MAPPINGS[stock_name]
+    model_path = model_paths(stock_name)[0]
+    # Checkpoints go to the candidate files; the deployed ones change only when the run is done
+    candidate_model, candidate_env, candidate_metadata = candidate_paths(stock_name)
+
+    if threads:
+        # Keep torch's intra-op pool inside this job's CPU budget
+        import torch
+        torch.set_num_threads(threads)
+
+    print(f"\n🔄 Training on {stock_name} ({stock_symbol})...")
+    data = load_training_features(stock_name, rebuild_features)
+    validation = None
+    if early_stopping:
+        # Time-ordered split: the policy is validated on bars after everything it trains on
+        split = int(len(data) * (1 - VALIDATION_FRACTION))
+        if len(data) - split < MIN_VALIDATION_BARS:
+            raise ValueError(f"Only {len(data) - split} of {stock_symbol}'s {len(data)} bars would be held out for "
+                             f"validation (need {MIN_VALIDATION_BARS}); train with --no-early-stopping.")
+        data, validation = data.slice(0, split), data.slice(split)
+
+    print(f"✅ Data preprocessing complete for {stock_symbol} ({len(data)} bars"
+          f"{f', {len(validation)} held out for validation' if validation is not None else ''}). Starting training.")
+
+    # Create environment. VecNormalize wraps the whole vec env in this process, so
+    # its running obs/reward statistics see every worker's samples and are saved
+    # once, in the same single-env-compatible format Backtest_bot.py loads.
+    env = make_env(data, n_envs, vec_backend, episode_length, seed)
+    env = VecNormalize(env, norm_obs=True, norm_reward=True, gamma=PPO_PARAMS['gamma'])
+
+    # Keep the rollout size per PPO update the same whatever the env count
+    params = dict(PPO_PARAMS, n_steps=max(PPO_PARAMS['n_steps'] // n_envs, 64))
+
+    # Initialize PPO model
+    model = PPO(
+        'MlpPolicy',
+        env,
+        verbose=1,
+        tensorboard_log=f"./trading_tensorboard/{stock_name}/",
+        seed=seed,
+        **params
+    )
+
+    callbacks = [ProgressCallback(total_timesteps)] if progress else []
+    stopper = None
+    if validation is not None:
+        stopper = EarlyStoppingCallback(validation, candidate_model, candidate_env, episode_length, eval_every,
+                                        patience, min_delta)
+        callbacks.append(stopper)
+
+    # Train the model
+    print(f"🚀 Training PPO model for {stock_symbol} with {n_envs} {vec_backend} env(s)...")
+    start = time.time()
+    with timing.span('training'):
+        model.learn(total_timesteps=total_timesteps, callback=callbacks)
+    seconds = time.time() - start
+    print(f"✅ Training complete for {stock_symbol} in {seconds:.0f}s.")
+
+    if stopper is None:
+        # Save trained model
+        with timing.span('model_save'):
+            model.save(candidate_model)
+            env.save(candidate_env)
+            save_metadata(stock_name, model.num_timesteps, 'full', data, seconds, path=candidate_metadata)
+    else:
+        if stopper.best_timesteps is None:
+            # No validation run gave a finite score, so no checkpoint was written: keep the final policy
+            print("⚠️ No validation run scored the policy; keeping the final model.")
+            with timing.span('model_save'):
+                model.save(candidate_model)
+                env.save(candidate_env)
+            stopper.best_timesteps = int(model.num_timesteps)
+        # The best checkpoint is already saved; estimate what the rest of the budget would have cost
+        trained = int(model.num_timesteps)
+        saved_timesteps = max(total_timesteps - trained, 0)
+        saved_seconds = seconds / trained * saved_timesteps
+        first, last = (pd.Timestamp(int(validation.timestamps[i]), tz='UTC') for i in (0, -1))
+        report = {'start': first.isoformat(), 'end': last.isoformat(), 'bars': len(validation),
+                  'best_return_pct': round(stopper.best_score, 3) if np.isfinite(stopper.best_score) else None,
+                  'evaluations': stopper.evaluations,
+                  'stopped_early': stopper.stopped, 'budget_timesteps': int(total_timesteps),
+                  'trained_timesteps': trained, 'saved_timesteps': saved_timesteps,
+                  'saved_seconds': round(saved_seconds, 1), 'eval_seconds': round(stopper.eval_seconds, 1)}
+        save_metadata(stock_name, stopper.best_timesteps, 'full', data, seconds, validation=report,
+                      path=candidate_metadata)
+        if stopper.stopped:
+            print(f"⏹️ Stopped early at {trained:,} of {total_timesteps:,} timesteps: saved {saved_timesteps:,} "
+                  f"timesteps (~{saved_seconds:.0f}s at this run's rate).")
+        if np.isfinite(stopper.best_score):
+            print(f"🏅 Kept the checkpoint from {stopper.best_timesteps:,} timesteps "
+                  f"({stopper.best_score:+.2f}% mean validation return, {stopper.evaluations} validation runs "
+                  f"taking {stopper.eval_seconds:.0f}s).")
+    env.close()
+    promote_candidate(stock_name)
+
+    print(f"💾 Model saved: {model_path}")
+    return model
+
+
+def train_incremental(stock_name, n_envs=1, vec_backend='dummy', episode_length=INCREMENTAL_EPISODE_LENGTH,
+                      total_timesteps=INCREMENTAL_TIMESTEPS, window_days=INCREMENTAL_WINDOW_DAYS,
+                      half_life_days=INCREMENTAL_HALF_LIFE_DAYS, until=None, seed=None, threads=None,
+                      progress=False):
+    """Fine-tune the saved model and normalizer on the bars that arrived since it was last trained.
+
+    Episodes are drawn from the last window_days of bars, with start weights
+    halving every half_life_days back from the newest bar, so new bars are
+    seen most while older ones keep the policy from overfitting the last week.
+    Episodes are capped at a quarter of the window so there are starts to
+    weight. Returns the model, or None if fewer than INCREMENTAL_MIN_NEW_BARS
+    bars are new. Raises ValueError if the model was trained on features of
+    another indicator version, which only a full retrain can fix.
+    """
+    stock_symbol = STOCK_MAPPINGS[stock_name]
+    model_path, env_path, _ = model_paths(stock_name)
+    for path in (model_path, env_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found. Run a full training of {stock_name} first.")
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    metadata = load_metadata(stock_name)
+    if metadata and metadata.get('feature_version') != config_version():
+        raise ValueError(f"{stock_name} was trained on features version {metadata.get('feature_version')}, "
+                         f"but the indicators are now version {config_version()}. "
+                         f"Run a full training of {stock_name} instead of --incremental.")
+    # Models trained before metadata was recorded have seen the fixed training range
+    cutoff = pd.Timestamp(metadata['data_end'] if metadata else TRAIN_END)
+    cutoff = cutoff.tz_localize('UTC') if cutoff.tzinfo is None else cutoff
+    end = pd.Timestamp(until, tz='UTC') if until else pd.Timestamp.now(tz='UTC')
+    window_start = end - pd.Timedelta(days=window_days)
+
+    print(f"\n🔄 Incremental training on {stock_name} ({stock_symbol}): bars after {cutoff}...")
+    api = tradeapi.REST(API_KEY, API_SECRET, BASE_URL, api_version='v2')
+    with timing.span('fetch_bars'):
+        bars = BarCache(api).get_bars(stock_symbol, TIMEFRAME, start=window_start - pd.Timedelta(days=INDICATOR_WARMUP_DAYS),
+                                      end=end)
+    new_bars = int((bars.index > cutoff).sum())
+    if new_bars < INCREMENTAL_MIN_NEW_BARS:
+        print(f"⏭️ Only {new_bars} new bar(s) for {stock_symbol}; keeping the current model.")
+        return None
+    if cutoff < window_start:
+        print(f"⚠️ Model data ends {cutoff}, before the {window_days}-day window; older unseen bars are skipped.")
+
+    data = FeatureSet.from_frame(prepare_features(bars))
+    data = data.slice(int(np.searchsorted(data.timestamps, window_start.value)))
+    print(f"✅ {new_bars} new bar(s); fine-tuning on {len(data)} bars from {window_start:%Y-%m-%d}.")
+
+    max_length = max(len(data) // 4, 1)
+    if not episode_length or episode_length > max_length:
+        print(f"ℹ️ Episode length {episode_length or 'whole series'} leaves too few starts in {len(data)} bars; "
+              f"using {max_length}.")
+        episode_length = max_length
+    weights = recency_weights(data.timestamps, half_life_days * 86400)
+    env = make_env(data, n_envs, vec_backend, episode_length, seed, start_weights=weights)
+    with timing.span('model_load'), model_files_lock(stock_name):
+        # Keeps updating the saved running obs/reward statistics as new bars come in
+        env = VecNormalize.load(env_path, env)
+        model = PPO.load(model_path, env=env, seed=seed,
+                         custom_objects={'n_steps': max(PPO_PARAMS['n_steps'] // n_envs, 64)})
+    if metadata is None:
+        metadata = {'stock': stock_name, 'symbol': stock_symbol, 'timeframe': TIMEFRAME,
+                    'data_start': pd.Timestamp(TRAIN_START, tz='UTC').isoformat(),
+                    'history': [{'mode': 'full', 'start': pd.Timestamp(TRAIN_START, tz='UTC').isoformat(),
+                                 'end': cutoff.isoformat(), 'timesteps': int(model.num_timesteps)}]}
+
+    print(f"🚀 Fine-tuning {stock_symbol} for {total_timesteps} timesteps "
+          f"(model has {model.num_timesteps} so far)...")
+    start = time.time()
+    with timing.span('training'):
+        model.learn(total_timesteps=total_timesteps, reset_num_timesteps=False,
+                    callback=ProgressCallback(total_timesteps) if progress else None)
+    print(f"✅ Incremental training complete for {stock_symbol} in {time.time() - start:.0f}s.")
+
+    candidate_model, candidate_env, candidate_metadata = candidate_paths(stock_name)
+    with timing.span('model_save'):
+        model.save(candidate_model)
+        env.save(candidate_env)
+        save_metadata(stock_name, model.num_timesteps, 'incremental', data, time.time() - start, new_bars, metadata,
+                      path=candidate_metadata)
+        promote_candidate(stock_name)
+    env.close()
+
+    print(f"💾 Model updated: {model_path} (data through {pd.Timestamp(int(data.timestamps[-1]), tz='UTC')})")
+    return model
+
+
+def train_portfolio(stock_names, n_envs=1, vec_backend='dummy', episode_length=episode_length,
+                    total_timesteps=total_timesteps, seed=None, threads=None, progress=False, rebuild_features=False):
+    """Train one shared policy over all stock_names at once (see portfolio_env), saved as the 'portfolio' model."""
+    if vec_backend == 'batch':
+        raise ValueError("The batch backend steps single-stock episodes; use dummy or subproc for a portfolio.")
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    print(f"\n🔄 Training one portfolio policy on {', '.join(stock_names)}...")
+    data = PortfolioData.align({STOCK_MAPPINGS[name]: load_training_features(name, rebuild_features)
+                                for name in stock_names})
+    missing = ", ".join(f"{symbol} {count}" for symbol, count in data.missing_bars().items() if count)
+    print(f"✅ Aligned {len(data.symbols)} symbols on {len(data)} bars"
+          f"{f' (missing bars carried forward: {missing})' if missing else ''}. Starting training.")
+
+    random_start = episode_length is not None
+    env = make_vec_env(lambda: PortfolioEnv(data, episode_length=episode_length, random_start=random_start),
+                       n_envs=n_envs, seed=seed, vec_env_cls=VEC_BACKENDS[vec_backend])
+    env = VecNormalize(env, norm_obs=True, norm_reward=True, gamma=PPO_PARAMS['gamma'])
+    params = dict(PPO_PARAMS, n_steps=max(PPO_PARAMS['n_steps'] // n_envs, 64))
+    model = PPO('MlpPolicy', env, verbose=1, tensorboard_log="./trading_tensorboard/portfolio/", seed=seed, **params)
+
+    print(f"🚀 Training portfolio PPO model with {n_envs} {vec_backend} env(s)...")
+    start = time.time()
+    with timing.span('training'):
+        model.learn(total_timesteps=total_timesteps,
+                    callback=ProgressCallback(total_timesteps) if progress else None)
+    print(f"✅ Portfolio training complete in {time.time() - start:.0f}s.")
+
+    model_path = model_paths('portfolio')[0]
+    candidate_model, candidate_env, candidate_metadata = candidate_paths('portfolio')
+    # Backtest_bot.backtest_portfolio rebuilds the aligned bars from these stocks, in this action order
+    metadata = {'stock': 'portfolio', 'stocks': list(stock_names), 'symbols': data.symbols, 'timeframe': TIMEFRAME,
+                'data_start': pd.Timestamp(int(data.timestamps[0]), tz='UTC').isoformat(), 'history': []}
+    with timing.span('model_save'):
+        model.save(candidate_model)
+        env.save(candidate_env)
+        save_metadata('portfolio', model.num_timesteps, 'portfolio', data, time.time() - start, previous=metadata,
+                      path=candidate_metadata)
+        promote_candidate('portfolio')
+    env.close()
+
+    print(f"💾 Model saved: {model_path} (symbols in action order: {', '.join(data.symbols)})")
+    return model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train a PPO trading model for one stock.")
+    parser.add_argument('stock', nargs='?', choices=list(STOCK_MAPPINGS))
+    parser.add_argument('--n-envs', type=int, default=1, help="Parallel environments used for rollouts")
+    parser.add_argument('--vec-backend', choices=['dummy', 'subproc', 'batch'], default='dummy',
+                        help="dummy: one process, subproc: one worker process per env, "
+                             "batch: all envs stepped together with NumPy")
+    parser.add_argument('--episode-length', type=int, default=None,
+                        help=f"Bars per randomly placed episode window (default {episode_length}, or "
+                             f"{INCREMENTAL_EPISODE_LENGTH} with --incremental; 0 = whole series from bar 0)")
+    parser.add_argument('--timesteps', type=int, default=None,
+                        help=f"Training budget (default {total_timesteps}, or {INCREMENTAL_TIMESTEPS} with --incremental)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=None, help="Torch threads for this training run")
+    parser.add_argument('--rebuild-features', action='store_true',
+                        help="Refetch bars and recompute the stored features for this stock")
+    parser.add_argument('--progress', action='store_true',
+                        help=f"Print '{PROGRESS_PREFIX} <done> <total>' lines while training")
+    parser.add_argument('--no-early-stopping', dest='early_stopping', action='store_false',
+                        help="Train for the whole --timesteps budget on all bars, without a validation hold-out")
+    parser.add_argument('--eval-every', type=int, default=None,
+                        help=f"Timesteps between validation runs (default {EVAL_EVERY})")
+    parser.add_argument('--patience', type=int, default=None,
+                        help=f"Validation runs without improvement before training stops (default {EARLY_STOP_PATIENCE})")
+    parser.add_argument('--min-delta', type=float, default=None,
+                        help="Gain in mean validation return (percentage points) that counts as improvement "
+                             f"(default {EARLY_STOP_MIN_DELTA})")
+    parser.add_argument('--portfolio', nargs='*', choices=list(STOCK_MAPPINGS), default=None, metavar='STOCK',
+                        help="Train one shared policy over these stocks (default: all) instead of one stock")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Fine-tune the saved model on bars newer than its training data")
+    parser.add_argument('--window-days', type=int, default=INCREMENTAL_WINDOW_DAYS,
+                        help="With --incremental: days of recent bars to fine-tune on")
+    parser.add_argument('--half-life-days', type=float, default=INCREMENTAL_HALF_LIFE_DAYS,
+                        help="With --incremental: episode start weights halve every this many days back")
+    parser.add_argument('--until', default=None, help="With --incremental: last date to fetch (default: now)")
+    args = parser.parse_args(argv)
+    if args.stock is None and args.portfolio is None:
+        parser.error("give a stock, or --portfolio")
+    if args.portfolio is not None:
+        if args.stock is not None:
+            parser.error("--portfolio takes its stocks after the flag, not as the positional stock")
+        if args.incremental:
+            parser.error("--incremental fine-tunes one stock's model, not the portfolio one")
+        early_stopping_options = [flag for flag, value in [('--no-early-stopping', not args.early_stopping),
+                                                           ('--eval-every', args.eval_every is not None),
+                                                           ('--patience', args.patience is not None),
+                                                           ('--min-delta', args.min_delta is not None)] if value]
+        if early_stopping_options:
+            parser.error(f"{', '.join(early_stopping_options)} apply to single-stock training; "
+                         "the portfolio has no validation hold-out")
+    if args.episode_length is None:
+        args.episode_length = INCREMENTAL_EPISODE_LENGTH if args.incremental else episode_length
+
+    if args.portfolio is not None:
+        model = train_portfolio(args.portfolio or list(STOCK_MAPPINGS), args.n_envs, args.vec_backend,
+                                args.episode_length or None, args.timesteps or total_timesteps, args.seed,
+                                args.threads, args.progress, args.rebuild_features)
+    elif args.incremental:
+        model = train_incremental(args.stock, args.n_envs, args.vec_backend, args.episode_length,
+                          args.timesteps or INCREMENTAL_TIMESTEPS, args.window_days, args.half_life_days,
+                          args.until, args.seed, args.threads, args.progress)
+    else:
+        model = train(args.stock, args.n_envs, args.vec_backend, args.episode_length or None,
+                      args.timesteps or total_timesteps, args.seed, args.threads, args.progress, args.rebuild_features,
+                      args.early_stopping, EVAL_EVERY if args.eval_every is None else args.eval_every,
+                      EARLY_STOP_PATIENCE if args.patience is None else args.patience,
+                      EARLY_STOP_MIN_DELTA if args.min_delta is None else args.min_delta)
+    if model is not None:
+        print("\n🎉 All training complete. Models saved using company names.")
+    print(timing.report())
+    timing.save('train_model')
+
+
+if __name__ == "__main__":
+    main()
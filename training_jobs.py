@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+import timing
+import worker_pool
+from train_model import PROGRESS_PREFIX
+
+# Trainings allowed to run at the same time; the rest wait in the queue
+MAX_TRAINING_JOBS = int(os.getenv('ITRADER_MAX_TRAINING_JOBS', '1'))
+# CPU threads given to each training (torch, OpenMP, BLAS)
+TRAINING_THREADS = int(os.getenv('ITRADER_TRAINING_THREADS', '0')) or max(1, (os.cpu_count() or 1) // MAX_TRAINING_JOBS)
+# Finished jobs kept for /jobs before the oldest are forgotten
+MAX_FINISHED_JOBS = 100
+# Output lines kept per job, shown when a training fails
+LOG_TAIL_LINES = 20
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class TrainingJob:
+    """One train_model.py run and what is known about its progress."""
+
+    def __init__(self, stock_name, options):
+        self.id = uuid.uuid4().hex[:12]
+        self.stock = stock_name
+        self.options = options
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.startup_seconds = None  # launch until the first line of output
+        self.finished_at = None
+        self.timesteps = 0
+        self.total_timesteps = None
+        self.returncode = None
+        self.log_tail = deque(maxlen=LOG_TAIL_LINES)
+        self.process = None
+
+    def to_dict(self):
+        progress = self.timesteps / self.total_timesteps if self.total_timesteps else 0.0
+        eta = None
+        if self.state == RUNNING and self.started_at and 0 < progress < 1:
+            eta = (time.time() - self.started_at) * (1 - progress) / progress
+        job = {
+            "id": self.id,
+            "stock": self.stock,
+            "state": self.state,
+            "options": self.options,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "startup_seconds": self.startup_seconds,
+            "finished_at": self.finished_at,
+            "timesteps": self.timesteps,
+            "total_timesteps": self.total_timesteps,
+            "progress": min(progress, 1.0),
+            "eta_seconds": eta,
+        }
+        if self.state == FAILED:
+            job["returncode"] = self.returncode
+            job["log_tail"] = list(self.log_tail)
+        return job
+
+
+class TrainingScheduler:
+    """Queue of training jobs run as train_model.py processes.
+
+    At most ``max_jobs`` trainings run at once, each limited to
+    ``threads_per_job`` CPU threads. Submitting a stock that already has a
+    queued or running job returns that job instead of starting another.
+    Jobs are forked from ``pool`` (a worker_pool.WorkerPool) when given, so
+    they start with torch and stable_baselines3 already imported.
+    """
+
+    def __init__(self, max_jobs=MAX_TRAINING_JOBS, threads_per_job=TRAINING_THREADS, pool=None):
+        self.max_jobs = max_jobs
+        self.threads_per_job = threads_per_job
+        self.pool = pool
+        self._jobs = {}
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def arguments(self, job):
+        args = [job.stock, "--progress", "--threads", str(self.threads_per_job)]
+        for name, value in job.options.items():
+            flag = f"--{name.replace('_', '-')}"
+            if value is True:
+                args.append(flag)
+            elif value not in (False, None):
+                args += [flag, str(value)]
+        return args
+
+    def environment(self):
+        """Variables set on top of the API's environment for every training."""
+        # Only fresh interpreters read these; a WorkerPool sets them on its server (see worker_pool)
+        env = worker_pool.thread_limits(self.threads_per_job)
+        env['PYTHONUNBUFFERED'] = '1'
+        return env
+
+    def submit(self, stock_name, **options):
+        """Queue a training for stock_name; returns (job, created)."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.stock == stock_name and job.state in ACTIVE_STATES:
+                    return job, False
+            job = TrainingJob(stock_name, options)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._forget_finished()
+            self._dispatch()
+            return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in ACTIVE_STATES:
+                return job
+            if job.state == QUEUED:
+                self._queue.remove(job)
+                job.finished_at = time.time()
+            elif job.process is not None:
+                job.process.terminate()
+            # (a job still being launched is terminated by _run once its process exists)
+            job.state = CANCELLED
+            return job
+
+    def shutdown(self):
+        """Cancel everything; running trainings are terminated."""
+        for job in self.jobs():
+            self.cancel(job.id)
+
+    def _running(self):
+        # Cancelled trainings count until their process has actually exited
+        return sum(job.returncode is None and (job.state == RUNNING or job.process is not None)
+                   for job in self._jobs.values())
+
+    def _dispatch(self):
+        # Caller holds the lock
+        while self._queue and self._running() < self.max_jobs:
+            job = self._queue.popleft()
+            job.state = RUNNING
+            job.started_at = time.time()
+            threading.Thread(target=self._run, args=(job,), name=f"train-{job.stock}", daemon=True).start()
+
+    def _run(self, job):
+        """Start a job's process and follow its output for progress, then record how it ended and start the next one."""
+        # Launched outside the lock: the first launch waits for the worker pool's imports.
+        # Any failure (no fork server, a broken pool socket, ...) fails this job and moves the queue on
+        try:
+            process = worker_pool.launch("train_model.py", self.arguments(job), self.environment(), pool=self.pool)
+        except Exception as e:
+            with self._lock:
+                if job.state == RUNNING:
+                    job.state = FAILED
+                job.finished_at = time.time()
+                job.log_tail.append(str(e))
+                self._dispatch()
+            return
+        with self._lock:
+            job.process = process
+            if job.state == CANCELLED:
+                process.terminate()
+
+        for line in process.stdout:
+            if job.startup_seconds is None:
+                job.startup_seconds = time.time() - job.started_at
+                timing.observe('job_startup', job.startup_seconds)
+            line = line.rstrip()
+            if line.startswith(PROGRESS_PREFIX):
+                done, total = line.split()[1:3]
+                job.timesteps, job.total_timesteps = int(done), int(total)
+            elif line:
+                job.log_tail.append(line)
+        returncode = process.wait()
+
+        with self._lock:
+            job.returncode = returncode
+            job.finished_at = time.time()
+            if job.state == RUNNING:
+                job.state = SUCCEEDED if returncode == 0 else FAILED
+            self._dispatch()
+
+    def _forget_finished(self):
+        finished = [job for job in self._jobs.values() if job.state not in ACTIVE_STATES]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
@@ -0,0 +1,174 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv
+
+from trading_env import OBSERVATION_LAYOUT, SHARES_IDX, BALANCE_IDX, feature_arrays, start_cdf
+
+# Per-episode state that get_attr/set_attr address by env index
+PER_ENV_ATTRS = ('balance', 'shares_held', 'net_worth', 'current_step', 'start_step', 'end_step')
+
+
+def batch_trade_step(balance, shares_held, net_worth, price, sma_10, actions,
+                     initial_balance=10000, transaction_fee=0.001):
+    """Apply the TradingEnv.step buy/sell rules to arrays of episodes at once.
+
+    Returns the new (balance, shares_held, net_worth) arrays.
+    """
+    # Buy: invest 50% of cash, only below SMA_10, and only if the fee-inclusive cost fits
+    shares_to_buy = np.floor_divide(balance * 0.5, price)
+    cost = shares_to_buy * price * (1 + transaction_fee)
+    buy = (actions == 1) & (price < sma_10) & (shares_to_buy > 0) & (cost <= balance)
+
+    # Sell: half the position (all of it if less than one share would go) above SMA_10 or at 2% profit
+    sell = (actions == 2) & (shares_held > 0) & (
+        (price > sma_10) | ((net_worth / initial_balance - 1) >= 0.02))
+    shares_to_sell = np.trunc(shares_held * 0.5)
+    shares_to_sell = np.where(shares_to_sell < 1, shares_held, shares_to_sell)
+    revenue = shares_to_sell * price * (1 - transaction_fee)
+
+    balance = np.where(buy, balance - cost, np.where(sell, balance + revenue, balance))
+    shares_held = np.where(buy, shares_held + shares_to_buy,
+                           np.where(sell, shares_held - shares_to_sell, shares_held))
+    net_worth = balance + shares_held * price
+    return balance, shares_held, net_worth
+
+
+class BatchTradingVecEnv(VecEnv):
+    """N TradingEnv episodes over the same data, advanced in lockstep with NumPy.
+
+    Each episode starts at its own random offset (drawn in proportion to
+    ``start_weights`` if given, or fixed at ``start_steps``) and runs for
+    ``episode_length`` steps, or to the end of the data when
+    ``episode_length`` is None. Finished episodes are reset in place, as
+    DummyVecEnv does.
+    """
+
+    def __init__(self, data, n_envs=1, initial_balance=10000, transaction_fee=0.001,
+                 episode_length=None, start_steps=None, seed=None, start_weights=None):
+        self.features, self.prices, self.sma_10 = feature_arrays(data)
+        self.max_steps = len(data) - 1
+        if self.max_steps < 1:
+            raise ValueError("BatchTradingVecEnv needs at least two bars of data.")
+
+        self.initial_balance = initial_balance
+        self.transaction_fee = transaction_fee
+        self.episode_length = min(episode_length, self.max_steps) if episode_length else None
+        self.fixed_starts = None if start_steps is None else np.asarray(start_steps, dtype=np.int64)
+        if self.fixed_starts is not None and len(self.fixed_starts) != n_envs:
+            raise ValueError("start_steps must give one offset per environment.")
+        self._start_cdf = start_cdf(start_weights, self.max_steps - (self.episode_length or 1))
+        self.render_mode = None
+        self._rng = np.random.default_rng(seed)
+
+        self.balance = np.full(n_envs, initial_balance, dtype=np.float64)
+        self.shares_held = np.zeros(n_envs, dtype=np.float64)
+        self.net_worth = np.full(n_envs, initial_balance, dtype=np.float64)
+        self.current_step = np.zeros(n_envs, dtype=np.int64)
+        self.start_step = np.zeros(n_envs, dtype=np.int64)
+        self.end_step = np.full(n_envs, self.max_steps, dtype=np.int64)
+        self._actions = np.zeros(n_envs, dtype=np.int64)
+
+        # Same spaces as TradingEnv, as gymnasium spaces for stable-baselines3
+        super().__init__(
+            n_envs,
+            spaces.Box(low=0, high=1, shape=(len(OBSERVATION_LAYOUT),), dtype=np.float32),
+            spaces.Discrete(3),
+        )
+
+    def _sample_starts(self, count):
+        if self._start_cdf is not None:
+            return np.searchsorted(self._start_cdf, self._rng.random(count), side='right')
+        last_start = self.max_steps - (self.episode_length or 1)
+        return self._rng.integers(0, last_start + 1, size=count)
+
+    def _reset_envs(self, mask):
+        count = int(mask.sum())
+        starts = self.fixed_starts[mask] if self.fixed_starts is not None else self._sample_starts(count)
+        self.start_step[mask] = starts
+        self.current_step[mask] = starts
+        if self.episode_length:
+            self.end_step[mask] = np.minimum(starts + self.episode_length, self.max_steps)
+        self.balance[mask] = self.initial_balance
+        self.shares_held[mask] = 0
+        self.net_worth[mask] = self.initial_balance
+
+    def _observations(self):
+        # Fancy indexing already returns a new array, so nothing is shared with past observations
+        obs = self.features[self.current_step]
+        obs[:, SHARES_IDX] = self.shares_held / 1000
+        obs[:, BALANCE_IDX] = self.balance / self.initial_balance
+        return obs
+
+    def seed(self, seed=None):
+        self._rng = np.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+    def reset(self):
+        self._reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self._observations()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions).reshape(self.num_envs)
+
+    def step_wait(self):
+        price = self.prices[self.current_step]
+        self.current_step += 1
+        sma_10 = self.sma_10[self.current_step] if self.sma_10 is not None else price
+
+        previous_net_worth = self.net_worth
+        self.balance, self.shares_held, self.net_worth = batch_trade_step(
+            self.balance, self.shares_held, self.net_worth, price, sma_10, self._actions,
+            self.initial_balance, self.transaction_fee)
+        rewards = ((self.net_worth - previous_net_worth) / previous_net_worth).astype(np.float32)
+
+        dones = self.current_step >= self.end_step
+        infos = [{"net_worth": net_worth} for net_worth in self.net_worth.tolist()]
+        obs = self._observations()
+        if dones.any():
+            truncated = self.end_step < self.max_steps
+            for i in np.flatnonzero(dones):
+                infos[i]["terminal_observation"] = obs[i].copy()
+                infos[i]["TimeLimit.truncated"] = bool(truncated[i])
+            self._reset_envs(dones)
+            obs = self._observations()
+        return obs, rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        value = getattr(self, attr_name)
+        if attr_name in PER_ENV_ATTRS:
+            return [value[i].item() for i in self._get_indices(indices)]
+        return [value for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        if attr_name in PER_ENV_ATTRS:
+            getattr(self, attr_name)[list(self._get_indices(indices))] = value
+        else:
+            setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        """Call a TradingEnv method on the selected episodes, which live in this env's arrays."""
+        method = getattr(self, f"_env_{method_name}", None)
+        if method is None:
+            raise AttributeError(f"BatchTradingVecEnv episodes have no TradingEnv method {method_name!r}")
+        return [method(i, *method_args, **method_kwargs) for i in self._get_indices(indices)]
+
+    # TradingEnv methods for one episode i, reached through env_method
+
+    def _env_seed(self, i, seed=None):
+        # Episodes draw their start offsets from one shared generator, so this reseeds all of them
+        self._rng = np.random.default_rng(seed)
+
+    def _env_get_portfolio_value(self, i):
+        return self.net_worth[i].item()
+
+    def _env_render(self, i, mode='human'):
+        print(f'Step: {self.current_step[i]}, Net Worth: {self.net_worth[i]}')
+
+    def _env_close(self, i):
+        pass
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
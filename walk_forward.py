@@ -0,0 +1,178 @@
+"""Walk-forward backtests of every trained model over many rolling windows at once.
+
+All windows of a stock run in lockstep: each bar costs one batched policy
+forward pass for that stock's model, however many windows are evaluated.
+
+Usage: python walk_forward.py [--stocks Apple Tesla] [--days 365] [--window-days 90] [--step-days 7]
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import Backtest_bot
+from backtest_engine import ModelRegistry
+from bar_cache import BarCache
+from constants import STOCK_MAPPINGS
+from indicators import add_indicators
+from trading_env import BALANCE_IDX, OBSERVATION_LAYOUT, SHARES_IDX, build_feature_matrix
+from vec_trading_env import batch_trade_step
+
+# Extra history fetched before the first window so indicators are warmed up
+WARMUP_DAYS = 30
+
+
+def ppo_policy(model, normalizer):
+    """Deterministic batched policy applying frozen VecNormalize observation stats."""
+    mean = normalizer.obs_rms.mean
+    scale = np.sqrt(normalizer.obs_rms.var + normalizer.epsilon)
+    clip = normalizer.clip_obs
+
+    def policy(obs):
+        normalized = np.clip((obs - mean) / scale, -clip, clip).astype(np.float32)
+        actions, _ = model.predict(normalized, deterministic=True)
+        return actions
+
+    return policy
+
+
+def evaluate_windows(policy, features, prices, sma_10, starts, ends,
+                     initial_balance=10000, transaction_fee=0.001):
+    """Run one TradingEnv episode per [start, end] bar range, all in lockstep.
+
+    Each episode matches TradingEnv over data[start:end + 1]. Returns arrays
+    of final net worth, max drawdown (fraction) and trade count per episode.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    n = len(starts)
+    step = starts.copy()
+    balance = np.full(n, float(initial_balance))
+    shares_held = np.zeros(n)
+    net_worth = balance.copy()
+    peak = net_worth.copy()
+    max_drawdown = np.zeros(n)
+    trades = np.zeros(n, dtype=np.int64)
+    obs = np.empty((n, len(OBSERVATION_LAYOUT)), dtype=np.float32)
+    actions = np.zeros(n, dtype=np.int64)
+
+    active = step < ends
+    while active.any():
+        np.take(features, step, axis=0, out=obs)
+        obs[:, SHARES_IDX] = shares_held / 1000
+        obs[:, BALANCE_IDX] = balance / initial_balance
+        actions[:] = 0
+        actions[active] = policy(obs[active])
+
+        price = prices[step]
+        next_step = np.where(active, step + 1, step)
+        new_balance, new_shares, new_net_worth = batch_trade_step(
+            balance, shares_held, net_worth, price, sma_10[next_step], actions,
+            initial_balance, transaction_fee)
+
+        trades += active & (new_shares != shares_held)
+        balance = np.where(active, new_balance, balance)
+        shares_held = np.where(active, new_shares, shares_held)
+        net_worth = np.where(active, new_net_worth, net_worth)
+        peak = np.maximum(peak, net_worth)
+        max_drawdown = np.maximum(max_drawdown, 1 - net_worth / peak)
+        step = next_step
+        active = step < ends
+
+    return {'final_net_worth': net_worth, 'max_drawdown': max_drawdown, 'trades': trades}
+
+
+def rolling_windows(index, first_start, last_end, window, step):
+    """(window_start, window_end, start_bar, end_bar) for every window fully inside the data."""
+    windows = []
+    window_start = first_start
+    while window_start + window <= last_end:
+        window_end = window_start + window
+        start_bar = int(index.searchsorted(window_start))
+        end_bar = int(index.searchsorted(window_end)) - 1
+        if end_bar > start_bar:
+            windows.append((window_start, window_end, start_bar, end_bar))
+        window_start += step
+    return windows
+
+
+def load_history(stock_name, start, end):
+    symbol = STOCK_MAPPINGS[stock_name]
+    data = BarCache(Backtest_bot.get_api()).get_bars(
+        symbol, '1H', start=start - timedelta(days=WARMUP_DAYS), end=end, feed='iex')
+    return add_indicators(data).dropna()
+
+
+def _utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+def walk_forward(stock_names, start, end, window, step, registry=None, initial_balance=10000):
+    """Summary table with one row per (stock, window)."""
+    registry = registry or ModelRegistry()
+    start, end = _utc(start), _utc(end)
+    rows = []
+    for stock_name in stock_names:
+        data = load_history(stock_name, start, end)
+        windows = rolling_windows(data.index, start, end, window, step)
+        if not windows:
+            print(f"No complete windows for {stock_name}; skipping.", file=sys.stderr)
+            continue
+
+        model, normalizer = registry.get(stock_name)
+        starts = [w[2] for w in windows]
+        ends = [w[3] for w in windows]
+        results = evaluate_windows(
+            ppo_policy(model, normalizer),
+            build_feature_matrix(data),
+            data['close'].to_numpy(dtype=np.float64),
+            data['SMA_10'].to_numpy(dtype=np.float64),
+            starts, ends, initial_balance=initial_balance)
+
+        for i, (window_start, window_end, start_bar, end_bar) in enumerate(windows):
+            rows.append({
+                'stock': stock_name,
+                'window_start': window_start.date(),
+                'window_end': window_end.date(),
+                'bars': end_bar - start_bar + 1,
+                'final_portfolio_value': results['final_net_worth'][i],
+                'total_return_percentage': (results['final_net_worth'][i] / initial_balance - 1) * 100,
+                'max_drawdown_percentage': results['max_drawdown'][i] * 100,
+                'trades': int(results['trades'][i]),
+            })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stocks', nargs='+', choices=list(STOCK_MAPPINGS), default=list(STOCK_MAPPINGS))
+    parser.add_argument('--days', type=int, default=365, help="How far back the first window starts")
+    parser.add_argument('--window-days', type=int, default=90)
+    parser.add_argument('--step-days', type=int, default=7)
+    parser.add_argument('--output', default='walk_forward_results.csv')
+    args = parser.parse_args()
+
+    end = datetime.now().date()
+    start = end - timedelta(days=args.days)
+    began = time.perf_counter()
+    summary = walk_forward(args.stocks, start, end, timedelta(days=args.window_days), timedelta(days=args.step_days))
+    elapsed = time.perf_counter() - began
+
+    if summary.empty:
+        print("No windows evaluated.", file=sys.stderr)
+        sys.exit(1)
+    summary.to_csv(args.output, index=False)
+    pd.set_option('display.width', 200)
+    print(summary.to_string(index=False, float_format=lambda x: f"{x:.2f}"))
+    print()
+    print(summary.groupby('stock')['total_return_percentage'].describe()[['count', 'mean', 'std', 'min', 'max']]
+          .to_string(float_format=lambda x: f"{x:.2f}"))
+    print(f"\n{len(summary)} windows in {elapsed:.1f}s; results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
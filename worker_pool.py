@@ -0,0 +1,277 @@
+"""Fork server that keeps torch, stable_baselines3, gym and pandas imported for fast job startup.
+
+A fresh ``python train_model.py`` spends seconds importing its dependencies
+before it does any work. WorkerPool starts one server process that imports
+PRELOAD_MODULES once. Each job is then an ``os.fork()`` of that server,
+which runs the script with its modules already loaded.
+
+Jobs behave like the parts of ``subprocess.Popen`` the API uses: ``pid``,
+``stdout``, ``poll()``, ``wait()`` and ``terminate()``. Requests and the
+job's stdout pipe are passed to the server over a Unix socket. The server
+reaps finished jobs and reports their exit codes back.
+
+Usage (server side, started by WorkerPool): python worker_pool.py --serve <socket fd> [module ...]
+"""
+import json
+import os
+import runpy
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+import timing
+
+# Imported once by the server, shared copy-on-write by every job
+PRELOAD_MODULES = ['numpy', 'pandas', 'torch', 'gym', 'stable_baselines3',
+                   'trading_env', 'train_model', 'interactive_bot']
+# Set ITRADER_WORKER_POOL=0 to start every job as a fresh interpreter instead
+USE_WORKER_POOL = os.getenv('ITRADER_WORKER_POOL', '1') != '0'
+
+MAX_MESSAGE_BYTES = 65536
+
+# CPU thread limits of the BLAS and OpenMP runtimes. They are read once, when numpy and torch are
+# imported, so in a forked job they only take effect if the server had them before preloading
+THREAD_LIMIT_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def thread_limits(threads):
+    """Environment limiting numpy's and torch's thread pools to threads."""
+    return {name: str(threads) for name in THREAD_LIMIT_VARS}
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+def _run_job(request, stdout_fd):
+    """Body of a forked job: set up stdio, environment and argv, then run the script as __main__."""
+    if stdout_fd is not None:
+        os.dup2(stdout_fd, 1)
+        os.dup2(stdout_fd, 2)
+        os.close(stdout_fd)
+        # Pipes are block-buffered by default; progress lines must arrive as they are printed
+        sys.stdout.reconfigure(line_buffering=True)
+    os.environ.update(request['env'])
+    sys.argv = [request['script'], *request['args']]
+    code = 0
+    try:
+        runpy.run_path(request['script'], run_name='__main__')
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(code)
+
+
+def serve(sock, preload):
+    """Import preload, then fork a job per request until the client closes the socket."""
+    for name in preload:
+        try:
+            __import__(name)
+        except ImportError as e:
+            print(f"worker_pool: could not preload {name}: {e}", file=sys.stderr)
+
+    # SIGCHLD wakes the selector through a pipe; no threads, so forking stays safe
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ, 'request')
+    selector.register(wake_r, selectors.EVENT_READ, 'child')
+
+    while True:
+        for key, _ in selector.select():
+            if key.data == 'child':
+                os.read(wake_r, 4096)
+                _reap(sock)
+                continue
+            data, fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE_BYTES, 1)
+            if not data:
+                return
+            request = json.loads(data)
+            pid = os.fork()
+            if pid == 0:
+                selector.close()
+                sock.close()
+                signal.set_wakeup_fd(-1)
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                _run_job(request, fds[0] if fds else None)
+            for fd in fds:
+                os.close(fd)
+            sock.send(json.dumps({'id': request['id'], 'pid': pid}).encode())
+
+
+def _reap(sock):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        sock.send(json.dumps({'exited': pid, 'returncode': os.waitstatus_to_exitcode(status)}).encode())
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+class WorkerProcess:
+    """A job forked by the pool server, with the Popen methods the API relies on."""
+
+    def __init__(self, stdout=None):
+        self.pid = None
+        self.stdout = stdout
+        self.returncode = None
+        self._launched = threading.Event()
+        self._exited = threading.Event()
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(str(self.pid), timeout)
+        return self.returncode
+
+    def send_signal(self, signum):
+        if self.returncode is None and self.pid is not None:
+            try:
+                os.kill(self.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def _exit(self, returncode):
+        self.returncode = returncode
+        self._launched.set()
+        self._exited.set()
+
+
+class WorkerPool:
+    """Client side of the fork server; start() launches a script as a preloaded fork.
+
+    With threads, the server imports its modules with thread_limits(threads)
+    set, so every job's BLAS and OpenMP pools use that many threads; a job's
+    own env cannot change them any more.
+    """
+
+    def __init__(self, preload=PRELOAD_MODULES, env=None, threads=None):
+        self.preload = list(preload)
+        self.env = env
+        if threads:
+            self.env = {**(env if env is not None else os.environ), **thread_limits(threads)}
+        self._server = None
+        self._sock = None
+        self._requests = {}  # request id -> WorkerProcess awaiting its pid
+        self._processes = {}  # pid -> running WorkerProcess
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """Start the server (and its imports) if it is not running; safe to call from any thread."""
+        with self._lock:
+            if self._server is not None and self._server.poll() is None:
+                return
+            ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            self._server = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--serve', str(theirs.fileno()), *self.preload],
+                pass_fds=(theirs.fileno(),), stdin=subprocess.DEVNULL, env=self.env)
+            theirs.close()
+            self._sock = ours
+            threading.Thread(target=self._read, args=(ours,), name='worker-pool', daemon=True).start()
+
+    def start(self, script, args=(), env=None, capture_output=True):
+        """Run ``python script *args`` as a fork of the server; stdout and stderr piped if capture_output."""
+        self.ensure_running()
+        with timing.span('worker_launch'):
+            read_fd = write_fd = None
+            if capture_output:
+                read_fd, write_fd = os.pipe()
+            process = WorkerProcess(os.fdopen(read_fd, 'r', buffering=1) if capture_output else None)
+            with self._lock:
+                request_id = self._next_id
+                self._next_id += 1
+                self._requests[request_id] = process
+                sock = self._sock
+            request = {'id': request_id, 'script': script, 'args': [str(arg) for arg in args], 'env': env or {}}
+            try:
+                socket.send_fds(sock, [json.dumps(request).encode()], [write_fd] if capture_output else [])
+            finally:
+                if write_fd is not None:
+                    os.close(write_fd)
+            process._launched.wait()
+        if process.pid is None:
+            raise OSError("Worker pool server exited before starting the job")
+        return process
+
+    def _read(self, sock):
+        """Match the server's launch/exit messages to WorkerProcess objects."""
+        while True:
+            try:
+                data = sock.recv(MAX_MESSAGE_BYTES)
+            except OSError:
+                data = b''
+            if not data:
+                break
+            message = json.loads(data)
+            with self._lock:
+                if 'exited' in message:
+                    process = self._processes.pop(message['exited'], None)
+                    if process is not None:
+                        process._exit(message['returncode'])
+                else:
+                    process = self._requests.pop(message['id'])
+                    process.pid = message['pid']
+                    self._processes[process.pid] = process
+                    process._launched.set()
+        # Server gone: nothing will report these jobs' exits any more
+        with self._lock:
+            for process in [*self._requests.values(), *self._processes.values()]:
+                process._exit(-1)
+            self._requests.clear()
+            self._processes.clear()
+
+    def shutdown(self):
+        """Stop the server. Running jobs keep running, like processes started with Popen."""
+        with self._lock:
+            if self._sock is not None:
+                # Wakes the reader thread; the server exits when it sees the socket close
+                self._sock.shutdown(socket.SHUT_RDWR)
+                self._sock.close()
+                self._sock = None
+            if self._server is not None:
+                self._server.wait()
+
+
+def launch(script, args=(), env=None, capture_output=True, pool=None):
+    """Start a script through pool when given (and enabled), else as a fresh interpreter."""
+    if pool is not None and USE_WORKER_POOL:
+        return pool.start(script, args, env, capture_output)
+    pipes = {'stdout': subprocess.PIPE, 'stderr': subprocess.STDOUT, 'text': True, 'bufsize': 1} if capture_output else {}
+    return subprocess.Popen([sys.executable, script, *map(str, args)], env={**os.environ, **(env or {})}, **pipes)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != '--serve':
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        sys.exit(1)
+    serve(socket.socket(fileno=int(sys.argv[2])), sys.argv[3:])